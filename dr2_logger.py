@@ -1,8 +1,19 @@
+import argparse
+import multiprocessing
 import os
 import sys
 import threading
 import queue
 
+from source import async_engine
+from source import batch_analysis
+from source import converter
+from source import exporter
+from source import networking
+from source import replay
+from source import settings
+from source import session_library
+from source.dirt_rally.game_dirt_rally import GameDirtRally
 from source.logger_backend import LoggerBackend
 
 
@@ -31,9 +42,12 @@ Enter:
 "c" or "clear" to clear the current run
 "p" or "plot" to show the important plots
 "pa" or "plot_all" to show all plots
-"s" or "save" to save the current run
-"l" or "load" to load a saved run
+"s" or "save" to save the current run, "s path" to save it without a file dialog
+"l" or "load" to load a saved run, "l path" to load it without a file dialog
+"i" or "info" to show statistics about the received packets
+"a" or "analytics" to show gear usage, bump stop and in-air times of the current run
 "g game_name" to switch the target game, values for game_name: {}
+"r port" to select the rig for the other commands when logging several ports
 '''.format(LoggerBackend.get_all_valid_games())
 
 
@@ -69,6 +83,124 @@ def print_current_state(state_str):
             pass
 
 
+def get_command_path(command: str):
+    # the rest of the command, paths may contain spaces
+    return os.path.expanduser(command.split(' ', 1)[1].strip().strip('"'))
+
+
+def handle_command(logger_backend: LoggerBackend, command: str):
+    end_program = False
+
+    if command == 'e' or command == 'exit':
+        print('Exit...\n')
+        end_program = True
+    elif command == 'c' or command == 'clear':
+        print('Cleared {} data points\n'.format(logger_backend.get_num_samples()))
+        logger_backend.clear_session_collection()
+    elif command == 'p' or command == 'plot':
+        if logger_backend.get_num_samples() == 0:
+            print('No data points to plot\n')
+        else:
+            print('Plotting {} data points\n'.format(logger_backend.get_num_samples()))
+            logger_backend.show_plots(False)
+    elif command == 'pa' or command == 'plot_all':
+        if logger_backend.get_num_samples() == 0:
+            print('No data points to plot\n')
+        else:
+            print('Plotting {} data points\n'.format(logger_backend.get_num_samples()))
+            logger_backend.show_plots(True)
+    elif command == 's' or command == 'save':
+        logger_backend.save_run()
+    elif command.startswith('s ') or command.startswith('save '):
+        logger_backend.save_run(file_path=get_command_path(command))
+    elif command.startswith('g'):
+        new_game_name = command.split(' ')[1]
+        logger_backend.change_game(new_game_name)
+        print('Switched game to "{}"'.format(logger_backend.game_name))
+    elif command == 'i' or command == 'info':
+        print(logger_backend.get_ingest_stats_str() + '\n')
+    elif command == 'a' or command == 'analytics':
+        print(logger_backend.get_run_analytics_str() + '\n')
+    elif command == 'l' or command == 'load':
+        logger_backend.load_run()
+        print_current_state(logger_backend.get_game_state_str())
+    elif command.startswith('l ') or command.startswith('load '):
+        logger_backend.load_run(file_path=get_command_path(command))
+        print_current_state(logger_backend.get_game_state_str())
+    elif command == '':
+        pass  # just ignore empty inputs
+    else:
+        print('Unknown command: "{}"'.format(command))
+        print(commands_hint + '\n')
+
+    return end_program
+
+
+class Rigs:
+    """
+    One logger backend per input port, e.g. for several sim rigs. Commands go to the selected rig.
+    """
+
+    def __init__(self, ports_in: list):
+        multi_rig = len(ports_in) > 1
+        self.logger_backends = [LoggerBackend(debugging=debugging, log_raw_data=log_raw_data, port_in=port_in,
+                                              rig_name='Rig {}'.format(port_in) if multi_rig else None)
+                                for port_in in ports_in]
+        self.selected_id = 0
+
+    def get_selected(self):
+        return self.logger_backends[self.selected_id]
+
+    def get_state_str(self):
+        return self.get_selected().get_game_state_str()
+
+    def select(self, port_str: str):
+        ports = [logger_backend.get_port_in() for logger_backend in self.logger_backends]
+        try:
+            self.selected_id = ports.index(int(port_str))
+            print('Selected rig on port {}'.format(ports[self.selected_id]))
+        except ValueError:
+            print('No rig on port "{}", available ports: {}'.format(port_str, ports))
+
+    def handle_command(self, command: str):
+        if command.startswith('r '):
+            self.select(command.split(' ')[1])
+            return False
+        return handle_command(self.get_selected(), command)
+
+    def pop_messages(self):
+        messages = [logger_backend.pop_messages() for logger_backend in self.logger_backends]
+        return '\n'.join([m for m in messages if len(m) > 0])
+
+
+def recover_unfinished_races(rigs: Rigs):
+    # races that were checkpointed when the logger crashed or was killed
+    unfinished_races = [(logger_backend, file_path) for logger_backend in rigs.logger_backends
+                        for file_path in logger_backend.get_unfinished_races()]
+    if len(unfinished_races) == 0:
+        return
+
+    print('Found {} unfinished races:'.format(len(unfinished_races)))
+    for _, file_path in unfinished_races:
+        print('    ' + file_path)
+    answer = input('Recover them as saved runs? [y/n] ')
+    if answer.strip().lower() in ['y', 'yes']:
+        for logger_backend, file_path in unfinished_races:
+            logger_backend.recover_unfinished_race(file_path)
+    else:
+        print('Kept the unfinished races, they will be offered again at the next start\n')
+
+
+def get_ports_in():
+    try:
+        return settings.get_ports_in()
+    except ValueError:
+        print('Invalid input port. Resetting...')
+        settings.init_settings_input_socket()
+        settings.write_settings()
+        return settings.get_ports_in()
+
+
 def main():
 
     end_program = False
@@ -76,8 +208,23 @@ def main():
     print(intro_text)
     print(commands_hint)
 
-    logger_backend = LoggerBackend(debugging=debugging, log_raw_data=log_raw_data)
-    logger_backend.start_logging()
+    rigs = Rigs(get_ports_in())
+    recover_unfinished_races(rigs)
+
+    if settings.settings['general']['engine'] == 'asyncio':
+        for logger_backend in rigs.logger_backends:
+            logger_backend.start_logging(receive_thread=False)
+        async_engine.run(rigs.logger_backends, handle_command=rigs.handle_command,
+                         get_state_str=rigs.get_state_str, print_state=print_current_state)
+        for logger_backend in rigs.logger_backends:
+            logger_backend.end_logging()
+        return
+
+    # a single thread receives and decodes the data of all rigs
+    udp_receiver = networking.UdpReceiver()
+    for logger_backend in rigs.logger_backends:
+        logger_backend.start_logging(udp_receiver=udp_receiver)
+    udp_receiver.start()
 
     message_queue = queue.Queue()
     input_thread = threading.Thread(target=add_input, args=(message_queue,))
@@ -86,52 +233,172 @@ def main():
 
     while not end_program:
 
-        logger_backend.check_udp_messages()
-        print_current_state(logger_backend.get_game_state_str())
+        # wait for new data only once for all rigs
+        rigs.logger_backends[0].check_udp_messages()
+        for logger_backend in rigs.logger_backends[1:]:
+            logger_backend.check_udp_messages(timeout=None)
+        print_current_state(rigs.get_state_str())
 
         while not message_queue.empty():
             command = message_queue.get()
+            end_program = rigs.handle_command(command) or end_program
 
-            if command == 'e' or command == 'exit':
-                print('Exit...\n')
-                end_program = True
-            elif command == 'c' or command == 'clear':
-                print('Cleared {} data points\n'.format(logger_backend.get_num_samples()))
-                logger_backend.clear_session_collection()
-            elif command == 'p' or command == 'plot':
-                if logger_backend.get_num_samples() == 0:
-                    print('No data points to plot\n')
-                else:
-                    print('Plotting {} data points\n'.format(logger_backend.get_num_samples()))
-                    logger_backend.show_plots(False)
-            elif command == 'pa' or command == 'plot_all':
-                if logger_backend.get_num_samples() == 0:
-                    print('No data points to plot\n')
-                else:
-                    print('Plotting {} data points\n'.format(logger_backend.get_num_samples()))
-                    logger_backend.show_plots(True)
-            elif command == 's' or command == 'save':
-                logger_backend.save_run()
-            elif command.startswith('g'):
-                new_game_name = command.split(' ')[1]
-                logger_backend.change_game(new_game_name)
-                print('Switched game to "{}"'.format(logger_backend.game_name))
-            elif command == 'l' or command == 'load':
-                logger_backend.load_run()
-                print_current_state(logger_backend.get_game_state_str())
-            elif command == '':
-                pass  # just ignore empty inputs
-            else:
-                print('Unknown command: "{}"'.format(command))
-                print(commands_hint + '\n')
-
-        message = logger_backend.check_state_changes()
+        message = rigs.pop_messages()
         if len(message) > 0:
             print(message)
 
     input_thread.join()
-    logger_backend.end_logging()
+    udp_receiver.stop()
+    for logger_backend in rigs.logger_backends:
+        logger_backend.end_logging()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Dirt Rally 2.0 Logger {}'.format(version_string))
+    subparsers = parser.add_subparsers(dest='tool', help='run a tool instead of the logger')
+
+    recover_parser = subparsers.add_parser(
+        'recover', help='rebuild saved races from raw datagram journals or unfinished races')
+    recover_parser.add_argument('journal_files', nargs='+',
+                                help='journal files (.dr2j) or unfinished races (in_progress/*.npz)')
+
+    replay_parser = subparsers.add_parser('replay', help='send saved races or journals to a UDP port like the game')
+    replay_parser.add_argument('replay_files', nargs='+', help='saved races (.npz) or journal files (.dr2j)')
+    replay_parser.add_argument('--ip', default=settings.settings['general']['ip_in'], help='target IP')
+    # resolved when replaying, an invalid port setting must not break the other tools
+    replay_parser.add_argument('--port', type=int, default=None,
+                               help='target port, default: the first input port of the settings')
+    replay_parser.add_argument('--speed', type=float, default=1.0,
+                               help='1 for real time, N for N times faster, 0 for max speed')
+    replay_parser.add_argument('--game', default=settings.settings['general']['game'],
+                               choices=LoggerBackend.get_all_valid_games(), help='game of saved races')
+
+    library_parser = subparsers.add_parser('library', help='update the index of saved races and search it')
+    library_parser.add_argument('--car', help='words that the car name must contain, e.g. "Renault 5"')
+    library_parser.add_argument('--track', help='words that the track name must contain, e.g. "Noorinbee"')
+    library_parser.add_argument('--game', choices=LoggerBackend.get_all_valid_games(), help='game of saved races')
+    library_parser.add_argument('--path', default=settings.settings['general']['session_path'],
+                                help='session path with the saved races')
+
+    convert_parser = subparsers.add_parser('convert', help='validate saved races and convert them to the newest format')
+    convert_parser.add_argument('--path', default=settings.settings['general']['session_path'],
+                                help='session path with the saved races')
+    convert_parser.add_argument('--format', default=settings.settings['general']['session_format'],
+                                choices=['npz', 'channels'], help='target format, see the session_format setting')
+    convert_parser.add_argument('--workers', type=int, default=None,
+                                help='number of processes, default: number of CPUs')
+
+    export_parser = subparsers.add_parser('export', help='export saved races to CSV or JSON lines for other tools')
+    export_parser.add_argument('export_paths', nargs='*', default=[settings.settings['general']['session_path']],
+                               help='saved races, directories or glob patterns, default: the session path')
+    export_parser.add_argument('--output', default='./export', help='directory for the exported files')
+    export_parser.add_argument('--format', default='csv', choices=list(exporter.export_formats.keys()),
+                               help='one row or JSON object per sample')
+    export_parser.add_argument('--channels', help='comma-separated field names, e.g. "run_time,speed_ms,rpm", '
+                                                  'default: all fields')
+    export_parser.add_argument('--units', default='plot', choices=exporter.export_units,
+                               help='raw: as sent by the game, plot: converted like for the plots, '
+                                    'e.g. real RPM values, z-up coordinates and run time from 0')
+    export_parser.add_argument('--workers', type=int, default=None,
+                               help='number of processes, default: number of CPUs')
+
+    overview_parser = subparsers.add_parser('overview', help='plot overviews of saved races from their pyramids')
+    overview_parser.add_argument('overview_files', nargs='+', help='saved races (.npz or session directories)')
+
+    analyze_parser = subparsers.add_parser('analyze', help='analyze many saved races and show a summary table')
+    analyze_parser.add_argument('analyze_paths', nargs='*', default=[],
+                                help='saved races, directories or glob patterns, default: all races in the library')
+    analyze_parser.add_argument('--car', help='words that the car name must contain, e.g. "Renault 5"')
+    analyze_parser.add_argument('--track', help='words that the track name must contain, e.g. "Noorinbee"')
+    analyze_parser.add_argument('--game', choices=LoggerBackend.get_all_valid_games(), help='game of saved races')
+    analyze_parser.add_argument('--path', default=settings.settings['general']['session_path'],
+                                help='session path with the saved races')
+    analyze_parser.add_argument('--workers', type=int, default=None,
+                                help='number of processes, default: number of CPUs')
+
+    return parser.parse_args()
+
+
+def search_library(session_path, car, track, game):
+    library = session_library.SessionLibrary(session_path)
+    num_indexed, num_removed, errors = library.update()
+    for file_path, er in errors:
+        print('Error while indexing "{}": {}'.format(file_path, er))
+    print('Indexed {} new or changed races, removed {} deleted races'.format(num_indexed, num_removed))
+
+    rows = library.query(car=car, track=track, game=game)
+    print(session_library.get_table_str(rows))
+    print('Found {} races'.format(len(rows)))
+
+
+def analyze_sessions(patterns, session_path, car, track, game, num_workers):
+    file_paths = batch_analysis.find_session_files(patterns, session_path, car=car, track=track, game=game)
+    results = batch_analysis.analyze_all(file_paths, num_workers=num_workers, car=car, track=track)
+    if len(results) > 0:
+        print(batch_analysis.get_table_str(results))
+        print(batch_analysis.get_summary_str(results))
+    elif len(file_paths) > 0:
+        print('No races match the filters')
+
+
+def show_overviews(file_paths):
+    from source import plots
+    from source.pyramid import Pyramid
+
+    for file_path in file_paths:
+        try:
+            game = GameDirtRally(game_name=session_library.get_game_name(file_path))
+            pyramid = game.load_pyramid(file_path)
+            if pyramid is None:
+                print('No pyramid in "{}", building it from the samples. '
+                      'Run the convert tool to add pyramids to older saves.'.format(file_path))
+                pyramid = Pyramid.build(game.load_data(file_path))
+        except (OSError, ValueError, KeyError) as er:
+            print('Error while loading race data: {}\n{}'.format(file_path, er))
+            continue
+
+        last_sample = pyramid.ends[1]
+        title_post_fix = ' - {} on {}'.format(game.get_car_name(last_sample), game.get_track_name(last_sample))
+        plots.plot_overview(pyramid, game.get_fields_enum().run_time.value, game.get_overview_fields(), title_post_fix)
+    plots.plt.show()
 
 
 if __name__ == "__main__":
-    main()
+    # the pyinstaller executable would start the logger again in each worker process of the analyze tool
+    multiprocessing.freeze_support()
+    args = parse_args()
+    if args.tool is None:
+        main()
+    elif args.tool == 'recover':
+        recover_backend = LoggerBackend(debugging=debugging)
+        for journal_file in args.journal_files:
+            if journal_file.endswith('.npz'):
+                recover_backend.recover_unfinished_race(journal_file)
+            else:
+                recover_backend.recover_journal(journal_file)
+        recover_backend.end_logging()
+    elif args.tool == 'replay':
+        replay_game = GameDirtRally(game_name=args.game)
+        replay_port = get_ports_in()[0] if args.port is None else args.port
+        for replay_file in args.replay_files:
+            replay.replay_file(replay_file, replay_game, ip=args.ip, port=replay_port, speed=args.speed)
+    elif args.tool == 'library':
+        search_library(args.path, car=args.car, track=args.track, game=args.game)
+    elif args.tool == 'export':
+        export_channels = None if args.channels is None else [c.strip() for c in args.channels.split(',')]
+        try:
+            num_exported_files, num_exported_samples = exporter.export_all(
+                args.export_paths, args.output, args.format, channel_names=export_channels, units=args.units,
+                num_workers=args.workers)
+            print('Exported {} samples of {} races to {}'.format(
+                num_exported_samples, num_exported_files, os.path.abspath(args.output)))
+        except ValueError as er:
+            print(er)
+    elif args.tool == 'overview':
+        show_overviews(args.overview_files)
+    elif args.tool == 'analyze':
+        analyze_sessions(args.analyze_paths, args.path, car=args.car, track=args.track, game=args.game,
+                         num_workers=args.workers)
+    elif args.tool == 'convert':
+        conversion_results = converter.convert_all(args.path, target_format=args.format, num_workers=args.workers)
+        print(', '.join(['{} {}'.format(len(files), result) for result, files in conversion_results.items()]))
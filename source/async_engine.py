@@ -0,0 +1,100 @@
+import asyncio
+import time
+
+import numpy as np
+
+from source.logger_backend import LoggerBackend
+
+
+class LoggerProtocol(asyncio.DatagramProtocol):
+    """
+    Receives datagrams from the event loop and feeds them to the logger backend.
+    All datagrams that arrive in the same loop iteration are decoded and processed as one batch.
+    """
+
+    def __init__(self, logger_backend: LoggerBackend):
+        self.logger_backend = logger_backend
+        self.datagrams = []
+        self.receive_times = []
+        self.loop = None
+
+    def connection_made(self, transport):
+        self.loop = asyncio.get_running_loop()
+
+    def datagram_received(self, data, addr):
+        receive_time = time.time()
+        if self.logger_backend.journal is not None:
+            self.logger_backend.journal.write(data, receive_time)
+        if self.logger_backend.forwarder is not None:
+            self.logger_backend.forwarder.forward([data])
+        if len(self.datagrams) == 0:
+            self.loop.call_soon(self.process_datagrams)
+        self.datagrams.append(data)
+        self.receive_times.append(receive_time)
+
+    def error_received(self, exc):
+        print('Socket error while receiving: {}'.format(exc))
+
+    def process_datagrams(self):
+        datagrams = self.datagrams
+        receive_times = self.receive_times
+        self.datagrams = []
+        self.receive_times = []
+
+        samples = self.logger_backend.game.decode_datagrams(datagrams)
+        # decode_datagrams skips short datagrams, the receive times don't fit then
+        receive_times = np.array(receive_times) if samples.shape[1] == len(receive_times) else None
+        self.logger_backend.process_samples(samples, receive_times)
+        self.logger_backend.write_status_line()
+
+        message = self.logger_backend.pop_messages()
+        if len(message) > 0:
+            print(message)
+
+
+async def print_status(logger_backends: list, get_state_str, print_state, interval: float):
+    while True:
+        print_state(get_state_str())
+        # e.g. messages from the save worker, which may finish after the last datagram
+        for logger_backend in logger_backends:
+            message = logger_backend.pop_messages()
+            if len(message) > 0:
+                print(message)
+        await asyncio.sleep(interval)
+
+
+async def run_async(logger_backends: list, handle_command, get_state_str, print_state, status_interval=0.5):
+    loop = asyncio.get_running_loop()
+
+    transports = []
+    for logger_backend in logger_backends:
+        if logger_backend.udp_socket is not None:
+            transport, _ = await loop.create_datagram_endpoint(
+                lambda: LoggerProtocol(logger_backend), sock=logger_backend.udp_socket)
+            transports.append(transport)
+    status_task = loop.create_task(print_status(logger_backends, get_state_str, print_state, status_interval))
+
+    try:
+        end_program = False
+        while not end_program:
+            # input() blocks, so it runs in the default executor.
+            # Blocking commands (plots, file dialogs) still run in the loop, the socket buffers meanwhile.
+            command = await loop.run_in_executor(None, input)
+            end_program = handle_command(command)
+    finally:
+        status_task.cancel()
+        for transport in transports:
+            transport.close()
+
+
+def run(logger_backends: list, handle_command, get_state_str, print_state):
+    """
+    Run the logger on an asyncio event loop instead of the receive thread.
+    The loop sleeps until datagrams or commands arrive, so there is no polling while idle.
+    :param logger_backends: backends after start_logging(receive_thread=False), one per rig
+    :param handle_command: function(command) -> True to exit
+    :param get_state_str: function() -> current state string
+    :param print_state: function(state_str) to show the current state, e.g. in the window title
+    """
+
+    asyncio.run(run_async(logger_backends, handle_command, get_state_str, print_state))
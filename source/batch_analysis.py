@@ -0,0 +1,145 @@
+import functools
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from source import data_processing
+from source import session_io
+from source import session_library
+
+
+# key numbers of many saved races, computed like for the plots in parallel worker processes
+min_drift_speed = 5.0  # m/s, the drift angle is meaningless when the car is almost standing
+min_samples = 2 * data_processing.in_air_context  # shorter races are shorter than the filters of the analysis
+
+
+def analyze_file(file_path: str):
+    """
+    Run the analysis of the plots on a saved race. Runs in a worker process.
+    :return: file path, dict with the results or None, error message or None
+    """
+
+    try:
+        with np.errstate(invalid='ignore'):  # e.g. drift angles while standing, they are filtered
+            return file_path, analyze_session(file_path), None
+    except session_io.load_errors as er:
+        return file_path, None, str(er)
+    except Exception as er:
+        # a single strange race must not stop the analysis of all others
+        return file_path, None, '{}: {}'.format(type(er).__name__, er)
+
+
+def analyze_session(file_path: str):
+    """
+    :return: dict with car, track, duration, optimal RPM, gear usage, bump stop and in-air time, speed and drift
+    """
+
+    session = session_io.load(file_path, lazy=True)  # the analysis doesn't use all channels
+    if session.data.shape[1] < min_samples:
+        raise ValueError('Not enough samples: {}, at least {} are needed'.format(session.data.shape[1], min_samples))
+    game = session_io.get_game(session.game_name)
+    plot_data = game.get_plot_data(session.data)
+
+    time_differences = data_processing.get_time_differences(plot_data=plot_data)
+    total_time = float(time_differences.sum())
+    range_gears, gear_times = data_processing.get_gear_times(plot_data=plot_data)
+    forward_gears = range_gears > 0.0
+    gear_ratios = gear_times / total_time if total_time > 0.0 else np.zeros_like(gear_times)
+    optimal_rpm, _, _ = data_processing.get_optimal_rpm(plot_data=plot_data)
+    susp_max, bump_stop_times = data_processing.get_bump_stop_times(plot_data=plot_data)
+    in_air_masks = data_processing.get_in_air_masks(plot_data=plot_data)
+    all_in_air = functools.reduce(np.logical_and, in_air_masks)
+
+    drift_angle = data_processing.get_drift_angle_deg(plot_data=plot_data)
+    drift_angle = drift_angle[np.logical_and(plot_data.speed_ms >= min_drift_speed, np.isfinite(drift_angle))]
+
+    last_sample = session.data[:, -1]
+    mtime, _ = session_library.get_file_state(file_path)
+    return {
+        'path': file_path,
+        'date': session_library.get_session_date(file_path, mtime),
+        'car': game.get_car_name(last_sample),
+        'track': game.get_track_name(last_sample),
+        'duration': float(plot_data.run_time[-1]),
+        'optimal_rpm': None if optimal_rpm is None else float(optimal_rpm),
+        'gear_ratios': {int(g): float(r) for g, r in zip(range_gears[forward_gears], gear_ratios[forward_gears])},
+        'susp_max': float(susp_max),
+        'bump_stop_time': float(bump_stop_times.sum()),
+        'air_time': float(time_differences[all_in_air].sum()),  # all four wheels in the air
+        'mean_speed': float(np.sum(plot_data.speed_ms * time_differences) / max(total_time, 1e-6)),
+        'drift_mean': float(np.mean(drift_angle)) if drift_angle.shape[0] > 0 else None,
+        'drift_90': float(np.percentile(drift_angle, 90)) if drift_angle.shape[0] > 0 else None,
+    }
+
+
+def matches(name: str, query: str):
+    # like SessionLibrary.query: all words, ignoring case
+    return query is None or all([word.lower() in name.lower() for word in query.split()])
+
+
+def find_session_files(patterns: list, session_path: str, car: str = None, track: str = None, game: str = None):
+    """
+    :param patterns: saved races, directories or glob patterns, the session library of session_path if empty
+    :return: paths of the saved races, the library is filtered by car, track and game before the analysis
+    """
+
+    if len(patterns) > 0:
+        return sorted(set([f for pattern in patterns for f in session_io.find_sessions(pattern)]))
+
+    library = session_library.SessionLibrary(session_path)
+    _, _, errors = library.update()
+    for file_path, er in errors:
+        print('Error while indexing "{}": {}'.format(file_path, er))
+    return [row['path'] for row in library.query(car=car, track=track, game=game)]
+
+
+def analyze_all(file_paths: list, num_workers: int = None, car: str = None, track: str = None):
+    """
+    Analyze saved races in parallel worker processes. Broken files are reported and skipped.
+    :param num_workers: number of processes, the number of CPUs if None
+    :param car: words that the car name must contain, for races that were not filtered by the library
+    :param track: words that the track name must contain
+    :return: list of result dicts, see analyze_file, newest first
+    """
+
+    if len(file_paths) == 0:
+        print('No saved races found')
+        return []
+
+    results = []
+    with ProcessPoolExecutor(max_workers=num_workers) as executor:
+        futures = [executor.submit(analyze_file, file_path) for file_path in file_paths]
+        for i, future in enumerate(as_completed(futures)):
+            file_path, result, error = future.result()
+            if error is not None:
+                print('\nError while analyzing {}: {}'.format(file_path, error))
+            elif matches(result['car'], car) and matches(result['track'], track):
+                results.append(result)
+            print('\r{}/{} races analyzed'.format(i + 1, len(file_paths)), end='', flush=True)
+    print()
+    return sorted(results, key=lambda r: r['date'], reverse=True)
+
+
+def get_table_str(results: list):
+    def optional(value, value_format):
+        return '' if value is None else value_format.format(value)
+
+    lines = ['{:<19}  {:<24}  {:<32}  {:>8}  {:>7}  {:<20}  {:>6}  {:>6}  {:>7}  {:>11}'.format(
+        'Date', 'Car', 'Track', 'Time', 'Opt.RPM', 'Gear usage (%)', 'Bump', 'Air', 'km/h', 'Drift (deg)')]
+    for r in results:
+        gears_str = '/'.join(['{:.0f}'.format(ratio * 100.0) for _, ratio in sorted(r['gear_ratios'].items())])
+        drift_str = '' if r['drift_mean'] is None else '{:.1f}/{:.1f}'.format(r['drift_mean'], r['drift_90'])
+        lines.append('{:<19}  {:<24}  {:<32}  {:>7.1f}s  {:>7}  {:<20}  {:>5.1f}s  {:>5.1f}s  {:>7.1f}  {:>11}'.format(
+            r['date'][:19], r['car'][:24], r['track'][:32], r['duration'], optional(r['optimal_rpm'], '{:.0f}'),
+            gears_str[:20], r['bump_stop_time'], r['air_time'], r['mean_speed'] * 3.6, drift_str))
+    return '\n'.join(lines)
+
+
+def get_summary_str(results: list):
+    if len(results) == 0:
+        return ''
+    optimal_rpms = [r['optimal_rpm'] for r in results if r['optimal_rpm'] is not None]
+    total_time = sum([r['duration'] for r in results])
+    return 'Races: {}, total time: {:.1f} min, median optimal RPM: {}, bump stops: {:.1f} s, in air: {:.1f} s'.format(
+        len(results), total_time / 60.0, '{:.0f}'.format(np.median(optimal_rpms)) if len(optimal_rpms) > 0 else '-',
+        sum([r['bump_stop_time'] for r in results]), sum([r['air_time'] for r in results]))
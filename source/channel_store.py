@@ -0,0 +1,140 @@
+import json
+import os
+import shutil
+
+import numpy as np
+
+
+# session directory layout: one uncompressed .npy per channel and a meta.json with the session's values
+# constant channels, e.g. the car's max RPM, are stored only once in the meta file, dropped channels not at all
+channel_dir_extension = '.dr2s'
+meta_file_name = 'meta.json'
+
+
+def get_session_dir(file_path: str):
+    """
+    :param file_path: session directory or its meta file, e.g. from a file dialog
+    :return: the session directory or None if the path is no session directory
+    """
+
+    if os.path.basename(file_path) == meta_file_name:
+        file_path = os.path.dirname(file_path)
+    if os.path.isfile(os.path.join(file_path, meta_file_name)):
+        return file_path
+    return None
+
+
+def write_channels(dir_path: str, data: np.ndarray, channel_names: list, values: dict,
+                   channel_dtypes: dict = None, dropped_channels: list = None, arrays: dict = None):
+    """
+    Write a session directory. It's written next to the target and renamed, so that it's complete or missing.
+    :param dir_path: target directory, an existing session is replaced
+    :param data: numpy array of shape (num_channels, num_samples)
+    :param channel_names: name per channel, used as file names
+    :param values: additional values for the meta file, e.g. game name and save version
+    :param channel_dtypes: compact type per channel name, used if it represents the values exactly
+    :param dropped_channels: names of channels that are not saved, they are read as zeros
+    :param arrays: additional arrays by name, e.g. the pyramid, read them with read_arrays
+    """
+
+    channel_dtypes = {} if channel_dtypes is None else channel_dtypes
+    dropped_channels = [] if dropped_channels is None else dropped_channels
+    arrays = {} if arrays is None else arrays
+
+    temp_dir_path = dir_path.rstrip('/\\') + '.tmp'
+    if os.path.isdir(temp_dir_path):
+        shutil.rmtree(temp_dir_path)
+    os.makedirs(temp_dir_path)
+
+    constants = {}
+    for channel_id, channel_name in enumerate(channel_names):
+        if channel_name in dropped_channels:
+            continue
+        channel = data[channel_id]
+        if channel.shape[0] > 0 and np.all(channel == channel[0]):
+            constants[channel_name] = float(channel[0])
+            continue
+        if channel_name in channel_dtypes:
+            compact_channel = channel.astype(channel_dtypes[channel_name])
+            if np.array_equal(compact_channel, channel):
+                channel = compact_channel
+        np.save(os.path.join(temp_dir_path, channel_name + '.npy'), np.ascontiguousarray(channel))
+
+    for name, array in arrays.items():
+        np.save(os.path.join(temp_dir_path, name + '.npy'), array)
+
+    meta = dict(values)
+    meta['arrays'] = list(arrays.keys())
+    meta['num_samples'] = data.shape[1]
+    meta['constants'] = constants
+    meta['dropped'] = list(dropped_channels)
+    with open(os.path.join(temp_dir_path, meta_file_name), 'w') as f:
+        json.dump(meta, f, indent=2)
+
+    if os.path.isdir(dir_path):
+        shutil.rmtree(dir_path)
+    os.replace(temp_dir_path, dir_path)
+
+
+def remove_session_dir(dir_path: str):
+    shutil.rmtree(dir_path)
+
+
+def read_meta(dir_path: str):
+    with open(os.path.join(dir_path, meta_file_name), 'r') as f:
+        return json.load(f)
+
+
+def read_arrays(dir_path: str):
+    # memory-mapped like the channels
+    meta = read_meta(dir_path)
+    return {name: np.load(os.path.join(dir_path, name + '.npy'), mmap_mode='r') for name in meta.get('arrays', [])}
+
+
+class ChannelStore:
+    """
+    Read-only session from a session directory. Channels are memory-mapped when they are first accessed,
+    so opening a session is fast and only the pages that are actually used are read.
+    Channels keep their saved type, e.g. float32 or small integers.
+    Supports the indexing that is used on session arrays, e.g. store[field], store[field, -1] and store[:, -1].
+    """
+
+    def __init__(self, dir_path: str, channel_names: list):
+        self.dir_path = dir_path
+        self.channel_names = channel_names
+        self.meta = read_meta(dir_path)
+        self.num_samples = self.meta['num_samples']
+        self.channels = {}
+
+    @property
+    def shape(self):
+        return len(self.channel_names), self.num_samples
+
+    def get_channel(self, channel_id: int):
+        if channel_id < 0:
+            channel_id += len(self.channel_names)
+        if channel_id not in self.channels:
+            channel_name = self.channel_names[channel_id]
+            if channel_name in self.meta['constants']:
+                channel = np.full((self.num_samples,), self.meta['constants'][channel_name])
+            elif channel_name in self.meta.get('dropped', []):
+                channel = np.zeros((self.num_samples,), dtype=np.float32)
+            else:
+                channel = np.load(os.path.join(self.dir_path, channel_name + '.npy'), mmap_mode='r')
+            self.channels[channel_id] = channel
+        return self.channels[channel_id]
+
+    def __getitem__(self, key):
+        if isinstance(key, tuple):
+            channel_key, sample_key = key
+        else:
+            channel_key, sample_key = key, slice(None)
+
+        if isinstance(channel_key, slice):
+            channel_ids = range(*channel_key.indices(len(self.channel_names)))
+            return np.stack([self.get_channel(channel_id)[sample_key] for channel_id in channel_ids])
+        return self.get_channel(int(channel_key))[sample_key]
+
+    def __array__(self, dtype=None, copy=None):
+        data = self[:]
+        return data if dtype is None else data.astype(dtype)
@@ -0,0 +1,127 @@
+import os
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from source import channel_store
+from source import session_library
+
+
+temp_marker = session_library.temp_marker  # converted files before they replace the originals
+
+# conversion results
+up_to_date = 'up to date'
+converted = 'converted'
+corrupt = 'corrupt'
+
+
+def get_save_version(file_path: str):
+    session_dir = channel_store.get_session_dir(file_path)
+    if session_dir is not None:
+        return channel_store.read_meta(session_dir).get('save_version')
+    with np.load(file_path) as npz_file:
+        if 'arr_0' in npz_file:
+            return 'initial'
+        return str(npz_file['save_version']) if 'save_version' in npz_file else None
+
+
+def get_target_path(file_path: str, target_format: str):
+    if target_format == 'channels':
+        return os.path.splitext(file_path)[0] + channel_store.channel_dir_extension
+    return os.path.splitext(file_path)[0] + '.npz'
+
+
+def remove_session(file_path: str):
+    if os.path.isdir(file_path):
+        channel_store.remove_session_dir(file_path)
+    elif os.path.isfile(file_path):
+        os.remove(file_path)
+
+
+def validate_samples(samples: np.ndarray, num_fields: int):
+    if samples.ndim != 2 or samples.shape[0] != num_fields:
+        raise ValueError('Invalid shape of the samples: {}'.format(samples.shape))
+    if samples.shape[1] == 0:
+        raise ValueError('No samples')
+
+
+def convert_file(file_path: str, target_format: str):
+    """
+    Validate a saved race and convert it to the newest save version of the target format.
+    The converted file is checked before the original is replaced, so this can be re-run safely.
+    Runs in a worker process.
+    :param file_path: saved race (.npz or session directory)
+    :param target_format: 'npz' or 'channels', like the session_format setting
+    :return: file path, result, path of the converted file, message
+    """
+
+    from source.dirt_rally.game_dirt_rally import GameDirtRally
+    from source.dirt_rally import udp_data
+
+    try:
+        game = GameDirtRally(game_name=session_library.get_game_name(file_path))
+        save_version = get_save_version(file_path)
+        samples = game.load_data(file_path)
+        validate_samples(samples, game.get_num_fields())
+    except (OSError, ValueError, KeyError, EOFError, zipfile.BadZipFile) as er:
+        return file_path, corrupt, None, str(er)
+
+    target_version = GameDirtRally.channels_save_version if target_format == 'channels' \
+        else GameDirtRally.current_save_version
+    target_path = get_target_path(file_path, target_format)
+    is_target_format = (channel_store.get_session_dir(file_path) is not None) == (target_format == 'channels')
+    if save_version == target_version and is_target_format and game.load_pyramid(file_path) is not None:
+        return file_path, up_to_date, file_path, None
+
+    # write next to the original, replace it only when the converted file is complete and correct
+    temp_path = os.path.splitext(file_path)[0] + temp_marker + os.path.splitext(target_path)[1]
+    try:
+        game.save_data(samples, temp_path, ingest_stats=game.load_ingest_stats(file_path))
+        converted_samples = game.load_data(temp_path)
+        expected_samples = samples.copy()
+        if target_format == 'channels':
+            expected_samples[[field.value for field in udp_data.ignored_fields]] = 0.0  # not saved
+        if not np.array_equal(converted_samples, expected_samples, equal_nan=True):  # e.g. NaN from broken packets
+            raise ValueError('The converted samples differ from the original')
+
+        if os.path.isdir(target_path):
+            channel_store.remove_session_dir(target_path)  # directories can't be replaced
+        os.replace(temp_path, target_path)
+        if target_path != file_path:
+            remove_session(file_path)
+    except (OSError, ValueError) as er:
+        remove_session(temp_path)
+        return file_path, corrupt, None, 'Conversion failed: {}'.format(er)
+
+    return file_path, converted, target_path, 'converted from save version {}'.format(save_version)
+
+
+def convert_all(session_path: str, target_format: str, num_workers: int = None):
+    """
+    Validate and convert all saved races in the session path in parallel, and record them in the session library.
+    :param num_workers: number of processes, the number of CPUs if None
+    :return: dict of result -> list of (file path, message)
+    """
+
+    library = session_library.SessionLibrary(session_path)
+    # leftovers of interrupted conversions are not listed, they are replaced
+    file_paths = session_library.get_session_files(session_path)
+    results = {up_to_date: [], converted: [], corrupt: []}
+
+    with ProcessPoolExecutor(max_workers=num_workers) as executor:
+        futures = [executor.submit(convert_file, file_path, target_format) for file_path in file_paths]
+        for i, future in enumerate(as_completed(futures)):
+            file_path, result, target_path, message = future.result()
+            results[result].append((file_path, message))
+            if result == converted:
+                library.remove(file_path)
+                try:
+                    library.add(target_path, note=message)
+                except (OSError, ValueError) as er:
+                    print('Error while adding {} to the session library: {}'.format(target_path, er))
+            elif result == corrupt:
+                print('Corrupt: {}\n    {}'.format(file_path, message))
+            print('\r{}/{} files checked'.format(i + 1, len(file_paths)), end='', flush=True)
+    print()
+    return results
@@ -1,8 +1,59 @@
 import functools
+import inspect
+import weakref
 
 import numpy as np
 
 from source import plot_data as pd
+from source.polynomial_fits import PolynomialFits
+
+
+# derived channels per PlotData, computed once and shared by all plots of a session
+# the entries are removed when their PlotData is garbage collected
+derived_cache = {}
+
+
+def make_read_only(value):
+    # cached arrays are shared, so a plot must not modify them
+    if isinstance(value, np.ndarray):
+        value.flags.writeable = False
+    elif isinstance(value, tuple):
+        for v in value:
+            make_read_only(v)
+    return value
+
+
+def cached_derived(function):
+    """
+    Memoize a function of a PlotData and further arguments, keyed on the PlotData's identity.
+    """
+
+    signature = inspect.signature(function)
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        arguments = signature.bind(*args, **kwargs)
+        arguments.apply_defaults()
+        plot_data = arguments.arguments.pop('plot_data')
+
+        plot_data_id = id(plot_data)
+        if plot_data_id not in derived_cache:
+            derived_cache[plot_data_id] = {}
+            weakref.finalize(plot_data, derived_cache.pop, plot_data_id, None)
+        cache = derived_cache[plot_data_id]
+
+        key = (function.__name__, tuple(sorted(arguments.arguments.items())))
+        if key not in cache:
+            cache[key] = make_read_only(function(plot_data, **arguments.arguments))
+        return cache[key]
+
+    return wrapper
+
+
+def percentile_nearest(values, q):
+    # like np.percentile with the 'nearest' method, which has different keywords in old and new numpy versions
+    values_sorted = np.sort(np.asarray(values).ravel())
+    return values_sorted[int(np.around(q / 100.0 * (values_sorted.shape[0] - 1)))]
 
 
 def normalize_2d_vectors(x, y):
@@ -103,6 +154,7 @@ def get_forward_vel_2d(plot_data: pd.PlotData):
     return vxy_normalized
 
 
+@cached_derived
 def get_drift_angle_deg(plot_data: pd.PlotData):
 
     pxy_normalized = get_forward_dir_2d(plot_data)
@@ -116,6 +168,7 @@ def get_drift_angle_deg(plot_data: pd.PlotData):
     return drift_angle_deg
 
 
+@cached_derived
 def get_energy(plot_data: pd.PlotData):
 
     mass = 1000.0  # kg, doesn't really matter because we want only the relative changes in energy
@@ -135,6 +188,14 @@ def get_energy(plot_data: pd.PlotData):
     return energy, kinetic_energy, potential_energy
 
 
+@cached_derived
+def get_power(plot_data: pd.PlotData):
+    # kW, relative like the energy
+    energy, kinetic_energy, potential_energy = get_energy(plot_data=plot_data)
+    return derive_no_nan(x=kinetic_energy, time_steps=plot_data.run_time) / 1000.0
+
+
+@cached_derived
 def get_gear_shift_mask(plot_data: pd.PlotData, shift_time_ms=100.0):
 
     # exclude times ~0.1 sec around gear shifts and gears < 1
@@ -148,6 +209,34 @@ def get_gear_shift_mask(plot_data: pd.PlotData, shift_time_ms=100.0):
     return close_to_gear_changes
 
 
+@cached_derived
+def get_gear_acceleration_masks(plot_data: pd.PlotData):
+    """
+    :return: forward gears and per gear the mask of full acceleration samples that are not close to gear shifts
+    """
+
+    full_acceleration_mask = get_full_acceleration_mask(plot_data=plot_data)
+    not_close_to_gear_changes = np.logical_not(get_gear_shift_mask(plot_data=plot_data, shift_time_ms=100.0))
+    full_without_shifts = np.logical_and(not_close_to_gear_changes, full_acceleration_mask)
+    range_gears = np.unique(plot_data.gear)
+    range_gears = range_gears[range_gears > 0.0]
+    return range_gears, tuple([np.logical_and(full_without_shifts, plot_data.gear == g) for g in range_gears])
+
+
+@cached_derived
+def get_rpm_polynomials(plot_data: pd.PlotData, channel_name: str):
+    """
+    Cubic fits of a channel over the RPM, one per gear of get_gear_acceleration_masks, fitted in one batch.
+    :param channel_name: PlotData field, e.g. 'speed_ms', or 'power' for get_power
+    :return: PolynomialFits
+    """
+
+    range_gears, gear_masks = get_gear_acceleration_masks(plot_data=plot_data)
+    channel = get_power(plot_data=plot_data) if channel_name == 'power' else getattr(plot_data, channel_name)
+    return PolynomialFits.fit([plot_data.rpm[mask] for mask in gear_masks], [channel[mask] for mask in gear_masks], 3)
+
+
+@cached_derived
 def get_optimal_rpm(plot_data: pd.PlotData):
 
     # the first gear is rather unreliable because the wheels usually spin freely at the start
@@ -157,65 +246,41 @@ def get_optimal_rpm(plot_data: pd.PlotData):
         return None, None, None
     # energy, kinetic_energy, potential_energy = get_energy(plot_data=plot_data)
 
-    optimal_y_per_gear = []
-    optimal_x_per_gear = []
-    optimal_rpm_range_min_per_gear = []
-    optimal_rpm_range_max_per_gear = []
-    data_gear = plot_data.gear
-    range_gears = list(set(data_gear))
-    range_gears.sort()
-    range_gears = [g for g in range_gears if g > 0.0]
-    for g in range_gears:
-        current_gear = plot_data.gear == g
-        not_close_to_gear_changes = np.logical_not(get_gear_shift_mask(plot_data=plot_data, shift_time_ms=100.0))
-        full_in_current_gear = np.logical_and(not_close_to_gear_changes, current_gear)
-        interesting = np.logical_and(full_in_current_gear, full_acceleration_mask)
-        # acc_gear = plot_data.g_force_lon[interesting]  # optimal RPM prediction is noisy with acceleration
-        vel_gear = plot_data.speed_ms[interesting]
-        # acc_gear = kinetic_energy[interesting]
-        rpm_gear = plot_data.rpm[interesting]
-
-        rpm_min = np.min(rpm_gear)
-        rpm_max = np.max(rpm_gear)
-        try:
-            # poly_coefficients = np.polyfit(rpm_gear, acc_gear, 3)
-            poly_coefficients = np.polyfit(rpm_gear, vel_gear, 3)
-            poly = np.poly1d(poly_coefficients)
-            poly_derived = np.polyder(poly)
-            x_poly = np.linspace(rpm_min, rpm_max, 500)
-            y_poly = poly_derived(x_poly)
-            optimal_y_per_gear.append(np.max(y_poly))
-            optimal_x_per_gear.append(x_poly[np.argmax(y_poly)])
-
-            y_90_percentile = np.percentile(y_poly, 90, interpolation='nearest')
-            y_90_percentile_mask = y_poly > y_90_percentile
-            optimal_rpm_min_gear = np.min(x_poly[y_90_percentile_mask])
-            optimal_rpm_max_gear = np.max(x_poly[y_90_percentile_mask])
-            optimal_rpm_range_min_per_gear.append(optimal_rpm_min_gear)
-            optimal_rpm_range_max_per_gear.append(optimal_rpm_max_gear)
-        except np.linalg.LinAlgError as _:
-            pass  # sometimes LinAlgError("SVD did not converge in Linear Least Squares"), maybe first gear
-
-    # optimal_y_per_gear = np.array(optimal_y_per_gear)
-    optimal_x_per_gear = np.array(optimal_x_per_gear)
-    optimal_rpm_range_min_per_gear = np.array(optimal_rpm_range_min_per_gear)
-    optimal_rpm_range_max_per_gear = np.array(optimal_rpm_range_max_per_gear)
-
-    optimal_rpm = np.percentile(optimal_x_per_gear, 50, interpolation='nearest')
+    # acceleration over RPM is noisy, so use the slope of the speed over RPM
+    polynomials = get_rpm_polynomials(plot_data=plot_data, channel_name='speed_ms')
+    valid_gears = polynomials.get_valid()
+    if not np.any(valid_gears):
+        return None, None, None  # e.g. too few samples per gear, the fits are singular
+    x_poly = polynomials.get_grid(500)
+    y_poly = polynomials.derive(x_poly)
+    x_poly = x_poly[valid_gears]
+    y_poly = y_poly[valid_gears]
+
+    gear_ids = np.arange(x_poly.shape[0])
+    optimal_x_per_gear = x_poly[gear_ids, np.argmax(y_poly, axis=1)]
+
+    # like percentile_nearest(y_poly, 90) per gear
+    y_90_percentile = np.sort(y_poly, axis=1)[:, int(np.around(0.9 * (y_poly.shape[1] - 1)))]
+    y_90_percentile_mask = y_poly > y_90_percentile[:, np.newaxis]
+    optimal_rpm_range_min_per_gear = np.min(np.where(y_90_percentile_mask, x_poly, np.inf), axis=1)
+    optimal_rpm_range_max_per_gear = np.max(np.where(y_90_percentile_mask, x_poly, -np.inf), axis=1)
+    # a constant slope has no samples above its percentile
+    has_range = np.any(y_90_percentile_mask, axis=1)
+    optimal_rpm_range_min_per_gear = np.where(has_range, optimal_rpm_range_min_per_gear, optimal_x_per_gear)
+    optimal_rpm_range_max_per_gear = np.where(has_range, optimal_rpm_range_max_per_gear, optimal_x_per_gear)
+
+    optimal_rpm = percentile_nearest(optimal_x_per_gear, 50)
     gear_at_optimal_rpm = np.argwhere(optimal_x_per_gear == optimal_rpm)
     optimal_rpm = optimal_x_per_gear[gear_at_optimal_rpm]
     optimal_rpm_range_min = optimal_rpm_range_min_per_gear[gear_at_optimal_rpm]
     optimal_rpm_range_max = optimal_rpm_range_max_per_gear[gear_at_optimal_rpm]
 
-    # TODO: optimal_rpm_range_min and optimal_rpm_range_max fail sometimes
-
     return optimal_rpm[0, 0], optimal_rpm_range_min[0, 0], optimal_rpm_range_max[0, 0]
 
 
+@cached_derived
 def get_full_acceleration_mask(plot_data: pd.PlotData):
 
-    import functools
-
     # full throttle inputs
     full_throttle = plot_data.throttle >= 0.99
     no_brakes = plot_data.brakes <= 0.01
@@ -238,11 +303,7 @@ def get_full_acceleration_mask(plot_data: pd.PlotData):
     # small_susp_vel_rr = np.abs(plot_data.susp_vel_rr) <= 0.01
 
     # take samples only when all wheels are on the ground
-    susp_vel = [plot_data.susp_vel_fl, plot_data.susp_vel_fr, plot_data.susp_vel_rl, plot_data.susp_vel_rr]
-    in_air_masks = [get_in_air_mask(
-        susp_vel_arr=susp, time_steps=plot_data.run_time,
-        susp_vel_lim=100.0, susp_vel_var_max=100.0, filter_length=6)
-        for susp in susp_vel]
+    in_air_masks = get_in_air_masks(plot_data=plot_data)
     on_ground_masks = [np.logical_not(am) for am in in_air_masks]
     on_ground_mask = functools.reduce(np.logical_and, on_ground_masks)
 
@@ -261,6 +322,26 @@ def get_full_acceleration_mask(plot_data: pd.PlotData):
     return full_acceleration_mask
 
 
+@cached_derived
+def get_in_air_masks(plot_data: pd.PlotData):
+    """
+    :return: in-air masks of the front left, front right, rear left and rear right wheel
+    """
+
+    susp_vel = [plot_data.susp_vel_fl, plot_data.susp_vel_fr, plot_data.susp_vel_rl, plot_data.susp_vel_rr]
+    return tuple([get_wheel_in_air_mask(susp, plot_data.run_time) for susp in susp_vel])
+
+
+# samples before and after a sample that its wheel in-air mask depends on, with some reserve
+in_air_context = 12
+
+
+def get_wheel_in_air_mask(susp_vel_arr: np.ndarray, time_steps: np.ndarray):
+    # the derivative and two box filters of length 6 reach 7 samples back and 4 ahead, see in_air_context
+    return get_in_air_mask(susp_vel_arr=susp_vel_arr, time_steps=time_steps,
+                           susp_vel_lim=100.0, susp_vel_var_max=100.0, filter_length=6)
+
+
 def get_in_air_mask(susp_vel_arr: np.ndarray, time_steps: np.ndarray,
                     susp_vel_lim=100.0, susp_vel_var_max=100.0, filter_length=6):
     # filter_length = 6 -> 100 ms (0.1 s) at 60 FPS
@@ -275,11 +356,11 @@ def get_in_air_mask(susp_vel_arr: np.ndarray, time_steps: np.ndarray,
 
     # check if the suspension velocity is declining continuously over a certain time
     susp_acc = derive_no_nan(susp_vel_arr, time_steps)
-    susp_acc_pos = (susp_acc > -10.0).astype(np.float)
+    susp_acc_pos = (susp_acc > -10.0).astype(float)
     susp_acc_pos_conv = np.convolve(susp_acc_pos, box_filter, mode='same') == float(filter_length)
 
     # check if the suspension velocity is negative for a certain time
-    susp_vel_neg = (susp_vel_arr < 10.0).astype(np.float)
+    susp_vel_neg = (susp_vel_arr < 10.0).astype(float)
     susp_vel_neg_conv = np.convolve(susp_vel_neg, box_filter, mode='same') == float(filter_length)
 
     # # check approximately monotonously increasing suspension velocity (less fast extension over time)
@@ -303,4 +384,40 @@ def get_in_air_mask(susp_vel_arr: np.ndarray, time_steps: np.ndarray,
     # previous convolutions shrunk the masks, now extending again
     in_air_mask = np.convolve(in_air_mask, box_filter, mode='same') >= float(filter_length * 0.5)
 
-    return in_air_mask
\ No newline at end of file
+    return in_air_mask
+
+
+@cached_derived
+def get_time_differences(plot_data: pd.PlotData):
+    return differences(plot_data.run_time, True)
+
+
+def get_gear_times(plot_data: pd.PlotData):
+    """
+    :return: used gears, accumulated time per gear in seconds
+    """
+
+    time_differences = get_time_differences(plot_data=plot_data)
+    range_gears = np.unique(plot_data.gear)
+    return range_gears, np.array([time_differences[plot_data.gear == g].sum() for g in range_gears])
+
+
+def get_bump_stop_times(plot_data: pd.PlotData):
+    """
+    Bump stops are hit at the maximum compression of all wheels, like in the suspension plot.
+    :return: maximum compression in mm, time at it per wheel (front left, front right, rear left, rear right)
+    """
+
+    time_differences = get_time_differences(plot_data=plot_data)
+    susp_data = np.array([plot_data.susp_fl, plot_data.susp_fr, plot_data.susp_rl, plot_data.susp_rr])
+    susp_max = np.max(susp_data)
+    return susp_max, np.sum(np.where(susp_data == susp_max, time_differences, 0.0), axis=1)
+
+
+def get_in_air_times(plot_data: pd.PlotData):
+    """
+    :return: in-air time per wheel (front left, front right, rear left, rear right) in seconds
+    """
+
+    time_differences = get_time_differences(plot_data=plot_data)
+    return np.array([time_differences[mask].sum() for mask in get_in_air_masks(plot_data=plot_data)])
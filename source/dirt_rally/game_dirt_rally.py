@@ -1,10 +1,14 @@
+import json
 import time
 
 import numpy as np
 
-from source import logger_backend
 from source import plot_data as pd
 from source import data_processing
+from source import channel_store
+from source import session_file
+from source.game_state import GameState
+from source.pyramid import Pyramid
 from source.game_base import GameBase
 from source.dirt_rally import udp_data
 from source.dirt_rally import car_data_dr1
@@ -17,7 +21,8 @@ class GameDirtRally(GameBase):
 
     valid_game_name_dr1 = 'Dirt_Rally_1'
     valid_game_name_dr2 = 'Dirt_Rally_2'
-    current_save_version = '1.0.0'
+    current_save_version = '2.0.0'
+    channels_save_version = '3.0.0'  # session directory with one file per channel
 
     def __init__(self, game_name):
         self.unknown_cars = set()
@@ -25,12 +30,46 @@ class GameDirtRally(GameBase):
         if game_name != GameDirtRally.valid_game_name_dr1 and game_name != GameDirtRally.valid_game_name_dr2:
             raise ValueError('Invalid game name: {}'.format(game_name))
         self.game_name = game_name
+        self.plot_unit_sources, self.plot_unit_scales = GameDirtRally.get_plot_unit_conversions()
 
     @staticmethod
     def get_valid_game_names():
         return [GameDirtRally.valid_game_name_dr1, GameDirtRally.valid_game_name_dr2]
 
+    def get_channel_names(self):
+        return [field.name for field in udp_data.Fields]
+
+    def get_overview_fields(self):
+        # field ids and labels for plots.plot_overview
+        return [(field.value, label) for field, label in udp_data.overview_fields]
+
+    def get_sample_dtype(self):
+        return udp_data.sample_dtype
+
+    def load_channels(self, file_path):
+        """
+        Open a session directory without reading the samples. The channels are memory-mapped on first access.
+        :param file_path: session directory or its meta file
+        :return: ChannelStore that can be used like the array from load_data, e.g. for get_plot_data
+        """
+
+        session_dir = channel_store.get_session_dir(file_path)
+        if session_dir is None:
+            raise ValueError('"{}" is no session directory'.format(file_path))
+        store = channel_store.ChannelStore(session_dir, self.get_channel_names())
+        game_name = store.meta.get('game')
+        if game_name != self.game_name:
+            raise ValueError('The saved race "{}" is from game: "{}". '
+                             'Switch the logger\'s game mode with "g {}".'.format(file_path, game_name, game_name))
+        save_version = store.meta.get('save_version')
+        if save_version != GameDirtRally.channels_save_version:
+            raise ValueError('Unknown save version "{}" for game "{}"'.format(save_version, game_name))
+        return store
+
     def load_data(self, file_path):
+        if channel_store.get_session_dir(file_path) is not None:
+            return np.asarray(self.load_channels(file_path), dtype=udp_data.sample_dtype)
+
         npz_file = np.load(file_path)
         if 'arr_0' in npz_file:
             # initial simple saves
@@ -41,25 +80,207 @@ class GameDirtRally(GameBase):
             samples[udp_data.Fields.max_rpm.value] /= 10.0
             samples[udp_data.Fields.idle_rpm.value] /= 10.0
         else:
-            required_values = ['samples', 'game', 'save_version']
-            for v in required_values:
-                required_value_exists = v in npz_file
-                if not required_value_exists:
-                    raise ValueError('Saved race doesn\'t contain the required field "{}"'.format(v))
-            game_name = npz_file['game']
-            if game_name != self.game_name:
-                raise ValueError('The saved race "{}" is from game: "{}". '
-                                 'Switch the logger\'s game mode with "g {}".'.format(file_path, game_name, game_name))
-            save_version = npz_file['save_version']
+            save_version = self.check_save_values(npz_file, file_path)
             if save_version == '1.0.0':
                 samples = npz_file['samples']
             else:
-                raise ValueError('Unknown save version "{}" for game "{}"'.format(save_version, game_name))
-        return samples
+                # chunks appended during the race, see session_file.py
+                samples = session_file.load_chunks(npz_file, udp_data.num_fields, dtype=udp_data.sample_dtype)
+        # older saves are float64, but the values came from the game as float32
+        return samples.astype(udp_data.sample_dtype, copy=False)
+
+    def check_save_values(self, npz_file, file_path):
+        """
+        Check game and save version of an npz save with save version.
+        :return: the save version
+        """
+
+        required_values = ['game', 'save_version']
+        for v in required_values:
+            required_value_exists = v in npz_file
+            if not required_value_exists:
+                raise ValueError('Saved race doesn\'t contain the required field "{}"'.format(v))
+        game_name = npz_file['game']
+        if game_name != self.game_name:
+            raise ValueError('The saved race "{}" is from game: "{}". '
+                             'Switch the logger\'s game mode with "g {}".'.format(file_path, game_name, game_name))
+        save_version = npz_file['save_version']
+        if save_version == '1.0.0':
+            if 'samples' not in npz_file:
+                raise ValueError('Saved race doesn\'t contain the required field "samples"')
+        elif save_version != '2.0.0':
+            raise ValueError('Unknown save version "{}" for game "{}"'.format(save_version, game_name))
+        return str(save_version)
+
+    def iter_samples(self, file_path, block_size):
+        """
+        Read a saved race in blocks, e.g. for exports. Chunked saves and session directories are never read at once.
+        :param block_size: maximum samples per block
+        :return: generator of numpy arrays of shape (num_fields, num_samples)
+        """
+
+        def split(samples):
+            for start in range(0, samples.shape[1], block_size):
+                yield samples[:, start:start + block_size]
+
+        if channel_store.get_session_dir(file_path) is not None:
+            store = self.load_channels(file_path)
+            for start in range(0, store.num_samples, block_size):
+                yield np.asarray(store[:, start:start + block_size], dtype=udp_data.sample_dtype)
+            return
+
+        with np.load(file_path) as npz_file:
+            if 'arr_0' not in npz_file and self.check_save_values(npz_file, file_path) == '2.0.0':
+                chunk_keys = session_file.get_chunk_keys(npz_file.files)
+                for key in chunk_keys:
+                    yield from split(npz_file[key].astype(udp_data.sample_dtype, copy=False))
+                return
+        yield from split(self.load_data(file_path))
+
+    @staticmethod
+    def get_plot_unit_conversions():
+        """
+        :return: numpy arrays with the source field id and the factor per field for convert_to_plot_units
+        """
+
+        fields = udp_data.Fields
+        source_ids = np.arange(len(fields))
+        scales = np.ones((len(fields),))
+        for field in [fields.rpm, fields.max_rpm, fields.idle_rpm]:
+            scales[field.value] = 10.0
+
+        # switch coordinate system to z - up, roll and pitch are swapped like in get_plot_data
+        # convert the field positions like values to get the source axis and sign per axis
+        axes = data_processing.convert_coordinate_system_3d(1, 2, 3)
+        vectors = [
+            ([fields.pos_x, fields.pos_y, fields.pos_z], [fields.pos_x, fields.pos_y, fields.pos_z]),
+            ([fields.vel_x, fields.vel_y, fields.vel_z], [fields.vel_x, fields.vel_y, fields.vel_z]),
+            ([fields.roll_x, fields.roll_y, fields.roll_z], [fields.pitch_x, fields.pitch_y, fields.pitch_z]),
+            ([fields.pitch_x, fields.pitch_y, fields.pitch_z], [fields.roll_x, fields.roll_y, fields.roll_z]),
+        ]
+        for target_fields, source_fields in vectors:
+            for target_field, axis in zip(target_fields, axes):
+                source_ids[target_field.value] = source_fields[abs(axis) - 1].value
+                scales[target_field.value] = 1.0 if axis > 0 else -1.0
+        return source_ids, scales
+
+    def convert_to_plot_units(self, samples, start_run_time, field_ids: list = None):
+        """
+        The conversions of get_plot_data for raw samples, e.g. for exports. Channels keep their field names.
+        :param samples: numpy array of shape (num_fields, num_samples)
+        :param start_run_time: run time of the first sample of the race
+        :param field_ids: convert only these fields, e.g. for the analytics of each received batch, all if None
+        :return: float64 numpy array of shape (num_fields, num_samples), or one row per field id in their order
+        """
+
+        field_ids = np.arange(samples.shape[0]) if field_ids is None else np.asarray(field_ids)
+        converted = samples[self.plot_unit_sources[field_ids]].astype(np.float64)
+        converted *= self.plot_unit_scales[field_ids, np.newaxis]
+        converted[field_ids == udp_data.Fields.run_time.value] -= start_run_time
+        return converted
+
+    def get_session_info(self, file_path):
+        """
+        Values for the session library. Session directories are memory-mapped, so only the used channels are read.
+        :return: dict with car, track, duration, race_time, num_samples, max_speed, mean_speed, progress, missing_packets
+        """
+
+        ingest_stats = self.load_ingest_stats(file_path)
+        info = {'missing_packets': None if ingest_stats is None else ingest_stats.get('missing_packets')}
+
+        pyramid = self.load_pyramid(file_path)
+        if pyramid is not None:
+            # no need to read the samples
+            first_sample, last_sample = pyramid.ends
+            run_time_field = udp_data.Fields.run_time.value
+            info.update({
+                'duration': float(last_sample[run_time_field] - first_sample[run_time_field]),
+                'num_samples': pyramid.num_samples,
+                'max_speed': pyramid.get_max(udp_data.Fields.speed_ms.value),
+                'mean_speed': pyramid.get_mean(udp_data.Fields.speed_ms.value),
+            })
+        else:
+            if channel_store.get_session_dir(file_path) is not None:
+                samples = self.load_channels(file_path)
+            else:
+                samples = self.load_data(file_path)
+            if samples.shape[1] == 0:
+                raise ValueError('"{}" contains no samples'.format(file_path))
+
+            last_sample = samples[:, -1]
+            speed = samples[udp_data.Fields.speed_ms.value]
+            info.update({
+                'duration': float(self.get_race_duration(samples)),
+                'num_samples': int(samples.shape[1]),
+                'max_speed': float(np.max(speed)),
+                'mean_speed': float(np.mean(speed)),
+            })
+
+        info.update({
+            'car': self.get_car_name(last_sample),
+            'track': self.get_track_name(last_sample),
+            'race_time': float(last_sample[udp_data.Fields.lap_time.value]),
+            'progress': float(last_sample[udp_data.Fields.progress.value]),
+        })
+        return info
+
+    def save_data(self, data, file_path, ingest_stats=None):
+        if file_path.endswith(channel_store.channel_dir_extension):
+            values = {'game': self.game_name, 'save_version': GameDirtRally.channels_save_version}
+            if ingest_stats is not None:
+                values['ingest_stats'] = ingest_stats
+            channel_store.write_channels(
+                file_path, data, self.get_channel_names(), values,
+                channel_dtypes={field.name: dtype for field, dtype in udp_data.channel_dtypes.items()},
+                dropped_channels=[field.name for field in udp_data.ignored_fields],
+                arrays=Pyramid.build(data).to_entries())
+            return
+
+        if not file_path.endswith('.npz'):
+            file_path += '.npz'  # like np.savez
+        race_file = self.create_session_file(file_path)
+        race_file.create()
+        race_file.append(data)
+        if ingest_stats is not None:
+            self.add_ingest_stats(race_file, ingest_stats)
+        self.add_pyramid(race_file, data)
+
+    def create_session_file(self, file_path):
+        return session_file.ChunkedSessionFile(file_path, values={
+            'game': self.game_name, 'save_version': GameDirtRally.current_save_version})
+
+    @staticmethod
+    def add_ingest_stats(race_file, ingest_stats):
+        # the ingest statistics are optional and don't change the save version
+        race_file.add_values({'ingest_stats': json.dumps(ingest_stats)})
+
+    @staticmethod
+    def add_pyramid(race_file, data):
+        # optional like the ingest statistics, older saves have no pyramid
+        race_file.add_values(Pyramid.build(data).to_entries())
+
+    def load_pyramid(self, file_path):
+        """
+        Read only the pyramid, not the samples.
+        :return: Pyramid or None if the session was saved without one
+        """
 
-    def save_data(self, data, file_path):
-        np.savez_compressed(file_path, samples=data, game=self.game_name,
-                            save_version=GameDirtRally.current_save_version)
+        session_dir = channel_store.get_session_dir(file_path)
+        if session_dir is not None:
+            return Pyramid.from_entries(channel_store.read_arrays(session_dir))
+
+        with np.load(file_path) as npz_file:
+            return Pyramid.from_entries(npz_file)
+
+    def load_ingest_stats(self, file_path):
+        session_dir = channel_store.get_session_dir(file_path)
+        if session_dir is not None:
+            return channel_store.read_meta(session_dir).get('ingest_stats')
+
+        npz_file = np.load(file_path)
+        if 'ingest_stats' not in npz_file:
+            return None
+        return json.loads(str(npz_file['ingest_stats']))
 
     def get_game_state_str(self, state, last_sample, num_samples, bar_length=16):
 
@@ -68,10 +289,10 @@ class GameDirtRally(GameBase):
                     'Speed: {speed:.1f} m/s, RPM: {rpm:5.0f}, ' \
                     'Samples: {samples:05d}, {state}'
 
-        current_time = last_sample[udp_data.Fields.lap_time.value]
+        current_time = float(last_sample[udp_data.Fields.lap_time.value])
         current_time_str = time.strftime('%M:%S', time.gmtime(current_time))
-        progress_raw = last_sample[udp_data.Fields.progress.value]
-        num_laps = max(1, last_sample[udp_data.Fields.total_laps.value])
+        progress_raw = float(last_sample[udp_data.Fields.progress.value])
+        num_laps = max(1.0, float(last_sample[udp_data.Fields.total_laps.value]))
         progress = progress_raw / num_laps
         filled_length = int(round(bar_length * progress))
         progress_str = '|' + f'{"█" * filled_length}{"-" * (bar_length - filled_length)}' + '|'
@@ -80,11 +301,11 @@ class GameDirtRally(GameBase):
         speed = last_sample[udp_data.Fields.speed_ms.value]
         rpm = last_sample[udp_data.Fields.rpm.value]
 
-        if state == logger_backend.GameState.race_not_running:
+        if state == GameState.race_not_running:
             state = 'not racing'
-        elif state == logger_backend.GameState.race_running:
+        elif state == GameState.race_running:
             state = 'racing'
-        elif state == logger_backend.GameState.ignore_package:
+        elif state == GameState.ignore_package:
             state = 'paused'
         else:
             raise ValueError('Invalid game state: {}'.format(state))
@@ -99,36 +320,36 @@ class GameDirtRally(GameBase):
 
         # no new data
         if receive_results is None:
-            return logger_backend.GameState.ignore_package
+            return GameState.ignore_package
 
         # all equal except the run time -> new package, same game state in DR2 -> race is paused
         if last_receive_results is not None and \
                 np.all(receive_results[1:] == last_receive_results[1:]):
-            return logger_backend.GameState.ignore_package
+            return GameState.ignore_package
 
         # if receive_results[udp_data.Fields.progress.value] > 0.0:
         if receive_results[udp_data.Fields.lap_time.value] > 0.0:
-            return logger_backend.GameState.race_running
+            return GameState.race_running
 
         # race has not yet started
         if receive_results[udp_data.Fields.lap_time.value] == 0.0:
-            return logger_backend.GameState.race_not_running
+            return GameState.race_not_running
         if receive_results[udp_data.Fields.distance.value] <= 0.0:
-            return logger_backend.GameState.race_not_running
+            return GameState.race_not_running
 
         # RPM will never be zero at the start (it will be the idle RPM)
         # However, RPM can be zero for some reason in the service area. Ignore then.
         # TODO: check if RPM can be zero when the engine dies
         if receive_results[udp_data.Fields.rpm.value] == 0.0 and receive_results[udp_data.Fields.run_time.value] <= 0.1:
-            return logger_backend.GameState.ignore_package
+            return GameState.ignore_package
 
         # strange packages with position at zero after race, speed check to be sure
         if receive_results[udp_data.Fields.pos_y.value] == 0.0 and \
                 receive_results[udp_data.Fields.speed_ms.value] == 0.0:
-            return logger_backend.GameState.race_not_running
+            return GameState.race_not_running
 
         print('Unknown reason for "not running": progress={}'.format(receive_results[udp_data.Fields.progress.value]))
-        return logger_backend.GameState.race_not_running
+        return GameState.race_not_running
 
     def get_fields_enum(self):
         return udp_data.Fields
@@ -139,10 +360,20 @@ class GameDirtRally(GameBase):
     def get_data(self, udp_socket):
         return udp_data.receive(udp_socket=udp_socket)
 
+    def get_data_batch(self, udp_socket):
+        return udp_data.receive_batch(udp_socket=udp_socket)
+
+    def decode_datagrams(self, datagrams):
+        return udp_data.decode_datagrams(datagrams)
+
+    def encode_samples(self, samples):
+        return udp_data.encode_samples(samples)
+
     def get_car_name(self, sample):
-        max_rpm = sample[udp_data.Fields.max_rpm.value]
-        idle_rpm = sample[udp_data.Fields.idle_rpm.value]
-        max_gears = sample[udp_data.Fields.max_gears.value]
+        # Python floats for readable names, float32 samples compare equal to the float32 values in the car data
+        max_rpm = float(sample[udp_data.Fields.max_rpm.value])
+        idle_rpm = float(sample[udp_data.Fields.idle_rpm.value])
+        max_gears = float(sample[udp_data.Fields.max_gears.value])
 
         key = (max_rpm, idle_rpm, max_gears)
         car_data = car_data_dr1 if self.game_name == GameDirtRally.valid_game_name_dr1 else car_data_dr2
@@ -176,8 +407,8 @@ class GameDirtRally(GameBase):
 
     def get_track_name(self, sample):
 
-        length = sample[udp_data.Fields.track_length.value]
-        start_z = sample[udp_data.Fields.pos_z.value]
+        length = float(sample[udp_data.Fields.track_length.value])
+        start_z = float(sample[udp_data.Fields.pos_z.value])
 
         track_data = track_data_dr1 if self.game_name == GameDirtRally.valid_game_name_dr1 else track_data_dr2
         if start_z is not None and length in track_data.track_dict.keys():
@@ -206,78 +437,83 @@ class GameDirtRally(GameBase):
             run_time_cleaned = run_time_raw - start_time
             return run_time_cleaned
 
-    def get_plot_data(self, session_collection):
-
-        # make consistent with other games
-        run_time = self.get_run_time_cleaned(session_collection[udp_data.Fields.run_time.value])
-        rpm = session_collection[udp_data.Fields.rpm.value] * 10.0
-        max_rpm = session_collection[udp_data.Fields.max_rpm.value] * 10.0
-        idle_rpm = session_collection[udp_data.Fields.idle_rpm.value] * 10.0
-
-        # switch coordinate system to z - up
-        pos_x, pos_y, pos_z = data_processing.convert_coordinate_system_3d(
-            session_collection[udp_data.Fields.pos_x.value],
-            session_collection[udp_data.Fields.pos_y.value],
-            session_collection[udp_data.Fields.pos_z.value]
-        )
-        vel_x, vel_y, vel_z = data_processing.convert_coordinate_system_3d(
-            session_collection[udp_data.Fields.vel_x.value],
-            session_collection[udp_data.Fields.vel_y.value],
-            session_collection[udp_data.Fields.vel_z.value]
-        )
-        pitch_x, pitch_y, pitch_z = data_processing.convert_coordinate_system_3d(
-            session_collection[udp_data.Fields.roll_x.value],
-            session_collection[udp_data.Fields.roll_y.value],
-            session_collection[udp_data.Fields.roll_z.value]
-        )
-        roll_x, roll_y, roll_z = data_processing.convert_coordinate_system_3d(
-            session_collection[udp_data.Fields.pitch_x.value],
-            session_collection[udp_data.Fields.pitch_y.value],
-            session_collection[udp_data.Fields.pitch_z.value],
-        )
+    @staticmethod
+    def get_channel(session_collection, field: udp_data.Fields):
+        # samples are float32 and some saved channels small integers, the plots work with float64
+        channel = session_collection[field.value]
+        if isinstance(channel, np.ndarray) and channel.dtype == np.float64:
+            channel = channel.view()
+            channel.flags.writeable = False  # shares the session's memory
+            return channel
+        return np.asarray(channel, dtype=np.float64)
 
-        plot_data = pd.PlotData(
-            run_time=run_time,
-            lap_time=session_collection[udp_data.Fields.lap_time.value],
-            distance=session_collection[udp_data.Fields.distance.value],
-            track_length=session_collection[udp_data.Fields.track_length.value],
-            progress=session_collection[udp_data.Fields.progress.value],
-            pos_x=pos_x,
-            pos_y=pos_y,
-            pos_z=pos_z,
-            speed_ms=session_collection[udp_data.Fields.speed_ms.value],
-            vel_x=vel_x,
-            vel_y=vel_y,
-            vel_z=vel_z,
-            roll_x=roll_x,
-            roll_y=roll_y,
-            roll_z=roll_z,
-            pitch_x=pitch_x,
-            pitch_y=pitch_y,
-            pitch_z=pitch_z,
-            susp_rl=session_collection[udp_data.Fields.susp_rl.value],
-            susp_rr=session_collection[udp_data.Fields.susp_rr.value],
-            susp_fl=session_collection[udp_data.Fields.susp_fl.value],
-            susp_fr=session_collection[udp_data.Fields.susp_fr.value],
-            susp_vel_rl=session_collection[udp_data.Fields.susp_vel_rl.value],
-            susp_vel_rr=session_collection[udp_data.Fields.susp_vel_rr.value],
-            susp_vel_fl=session_collection[udp_data.Fields.susp_vel_fl.value],
-            susp_vel_fr=session_collection[udp_data.Fields.susp_vel_fr.value],
-            wsp_rl=session_collection[udp_data.Fields.wsp_rl.value],
-            wsp_rr=session_collection[udp_data.Fields.wsp_rr.value],
-            wsp_fl=session_collection[udp_data.Fields.wsp_fl.value],
-            wsp_fr=session_collection[udp_data.Fields.wsp_fr.value],
-            gear=session_collection[udp_data.Fields.gear.value],
-            g_force_lat=session_collection[udp_data.Fields.g_force_lat.value],
-            g_force_lon=session_collection[udp_data.Fields.g_force_lon.value],
-            rpm=rpm,
-            max_rpm=max_rpm,
-            idle_rpm=idle_rpm,
-            max_gear=session_collection[udp_data.Fields.max_gears.value],
-            throttle=session_collection[udp_data.Fields.throttle.value],
-            steering=session_collection[udp_data.Fields.steering.value],
-            brakes=session_collection[udp_data.Fields.brakes.value],
-            clutch=session_collection[udp_data.Fields.clutch.value]
-        )
+    def get_plot_data(self, session_collection):
+        """
+        :return: LazyPlotData, the channels are read and converted when a plot first uses them
+        """
+
+        def channel(field: udp_data.Fields):
+            return lambda: self.get_channel(session_collection, field)
+
+        def scaled(field: udp_data.Fields, factor: float):
+            return lambda: self.get_channel(session_collection, field) * factor
+
+        def converted_3d(fields_xyz: list):
+            # switch coordinate system to z - up, each axis is converted on its own
+            # convert the field positions like values to get the source axis and sign per axis
+            axes = data_processing.convert_coordinate_system_3d(1, 2, 3)
+            return [channel(fields_xyz[axis - 1]) if axis > 0 else scaled(fields_xyz[-axis - 1], -1.0)
+                    for axis in axes]
+
+        f = udp_data.Fields
+        pos_x, pos_y, pos_z = converted_3d([f.pos_x, f.pos_y, f.pos_z])
+        vel_x, vel_y, vel_z = converted_3d([f.vel_x, f.vel_y, f.vel_z])
+        pitch_x, pitch_y, pitch_z = converted_3d([f.roll_x, f.roll_y, f.roll_z])
+        roll_x, roll_y, roll_z = converted_3d([f.pitch_x, f.pitch_y, f.pitch_z])
+
+        plot_data = pd.LazyPlotData({
+            # make consistent with other games
+            'run_time': lambda: self.get_run_time_cleaned(self.get_channel(session_collection, f.run_time)),
+            'lap_time': channel(f.lap_time),
+            'distance': channel(f.distance),
+            'track_length': channel(f.track_length),
+            'progress': channel(f.progress),
+            'pos_x': pos_x,
+            'pos_y': pos_y,
+            'pos_z': pos_z,
+            'speed_ms': channel(f.speed_ms),
+            'vel_x': vel_x,
+            'vel_y': vel_y,
+            'vel_z': vel_z,
+            'roll_x': roll_x,
+            'roll_y': roll_y,
+            'roll_z': roll_z,
+            'pitch_x': pitch_x,
+            'pitch_y': pitch_y,
+            'pitch_z': pitch_z,
+            'susp_rl': channel(f.susp_rl),
+            'susp_rr': channel(f.susp_rr),
+            'susp_fl': channel(f.susp_fl),
+            'susp_fr': channel(f.susp_fr),
+            'susp_vel_rl': channel(f.susp_vel_rl),
+            'susp_vel_rr': channel(f.susp_vel_rr),
+            'susp_vel_fl': channel(f.susp_vel_fl),
+            'susp_vel_fr': channel(f.susp_vel_fr),
+            'wsp_rl': channel(f.wsp_rl),
+            'wsp_rr': channel(f.wsp_rr),
+            'wsp_fl': channel(f.wsp_fl),
+            'wsp_fr': channel(f.wsp_fr),
+            'gear': channel(f.gear),
+            'g_force_lat': channel(f.g_force_lat),
+            'g_force_lon': channel(f.g_force_lon),
+            'rpm': scaled(f.rpm, 10.0),
+            'max_rpm': scaled(f.max_rpm, 10.0),
+            'idle_rpm': scaled(f.idle_rpm, 10.0),
+            'max_gear': channel(f.max_gears),
+            'throttle': channel(f.throttle),
+            'steering': channel(f.steering),
+            'brakes': channel(f.brakes),
+            'clutch': channel(f.clutch),
+        })
 
         return plot_data
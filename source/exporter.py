@@ -0,0 +1,118 @@
+import json
+import os
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from source import session_io
+from source import session_library
+
+
+# export saved races for other tools, one CSV or JSON-lines file per race with one row per sample
+export_formats = {'csv': '.csv', 'jsonl': '.jsonl'}
+export_units = ['raw', 'plot']  # as received from the game or converted like get_plot_data
+block_size = 4096  # samples per write, bounds the memory per worker
+value_format = '%.9g'  # enough digits for float32
+
+
+def get_export_path(file_path: str, output_dir: str, export_format: str):
+    name = os.path.splitext(os.path.basename(os.path.normpath(file_path)))[0]
+    return os.path.join(output_dir, name + export_formats[export_format])
+
+
+def check_channels(channel_names: list, available_names: list):
+    unknown_names = [name for name in channel_names if name not in available_names]
+    if len(unknown_names) > 0:
+        raise ValueError('Unknown channels: {}\nAvailable channels: {}'.format(
+            ', '.join(unknown_names), ', '.join(available_names)))
+
+
+def format_block(block: np.ndarray, channel_names: list, export_format: str):
+    """
+    :param block: numpy array of shape (num_channels, num_samples)
+    :return: text with one line per sample
+    """
+
+    if export_format == 'csv':
+        row_template = ','.join([value_format] * len(channel_names))
+    else:
+        if not np.all(np.isfinite(block)):
+            # NaN and infinity are not valid JSON
+            return ''.join([json.dumps({name: float(v) if np.isfinite(v) else None
+                                        for name, v in zip(channel_names, row)}) + '\n' for row in block.T])
+        row_template = '{' + ', '.join(['"{}": {}'.format(name, value_format) for name in channel_names]) + '}'
+    return ''.join([row_template % tuple(row) + '\n' for row in block.T.tolist()])
+
+
+def export_file(file_path: str, export_path: str, export_format: str, channel_names: list, units: str):
+    """
+    Stream a saved race to a text file in blocks. Runs in a worker process.
+    :param channel_names: exported fields in this order, all fields if None
+    :return: file path, number of exported samples, error message or None
+    """
+
+    try:
+        game = session_io.get_game(session_library.get_game_name(file_path))
+        all_names = game.get_channel_names()
+        channel_names = all_names if channel_names is None else channel_names
+        check_channels(channel_names, all_names)
+        channel_ids = [all_names.index(name) for name in channel_names]
+
+        num_samples = 0
+        temp_export_path = export_path + '.tmp'
+        with open(temp_export_path, 'w', newline='\n') as f:
+            if export_format == 'csv':
+                f.write(','.join(channel_names) + '\n')
+            start_run_time = None
+            for samples in game.iter_samples(file_path, block_size):
+                if units == 'plot':
+                    if start_run_time is None:
+                        start_run_time = float(samples[game.get_fields_enum().run_time.value, 0])
+                    samples = game.convert_to_plot_units(samples, start_run_time)
+                f.write(format_block(samples[channel_ids], channel_names, export_format))
+                num_samples += samples.shape[1]
+        os.replace(temp_export_path, export_path)
+    except (OSError, ValueError, KeyError, EOFError, zipfile.BadZipFile) as er:
+        return file_path, 0, str(er)
+    return file_path, num_samples, None
+
+
+def export_all(patterns: list, output_dir: str, export_format: str, channel_names: list = None,
+               units: str = 'raw', num_workers: int = None):
+    """
+    Export saved races in parallel worker processes.
+    :param patterns: files, directories or glob patterns, see session_io.find_sessions
+    :param output_dir: directory for the exported files, named like the saved races
+    :param channel_names: exported fields, all if None
+    :param units: 'raw' or 'plot'
+    :param num_workers: number of processes, the number of CPUs if None
+    :return: number of exported files, number of exported samples
+    :raises ValueError: for unknown channels
+    """
+
+    file_paths = sorted(set([f for pattern in patterns for f in session_io.find_sessions(pattern)]))
+    if len(file_paths) == 0:
+        print('No saved races found')
+        return 0, 0
+    if channel_names is not None:
+        # report unknown channels once instead of once per file
+        game = session_io.get_game(session_library.get_game_name(file_paths[0]))
+        check_channels(channel_names, game.get_channel_names())
+    os.makedirs(output_dir, exist_ok=True)
+
+    num_files = 0
+    num_samples = 0
+    with ProcessPoolExecutor(max_workers=num_workers) as executor:
+        futures = [executor.submit(export_file, file_path, get_export_path(file_path, output_dir, export_format),
+                                   export_format, channel_names, units) for file_path in file_paths]
+        for i, future in enumerate(as_completed(futures)):
+            file_path, file_samples, error = future.result()
+            if error is not None:
+                print('\nError while exporting {}: {}'.format(file_path, error))
+            else:
+                num_files += 1
+                num_samples += file_samples
+            print('\r{}/{} files exported'.format(i + 1, len(file_paths)), end='', flush=True)
+    print()
+    return num_files, num_samples
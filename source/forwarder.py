@@ -0,0 +1,86 @@
+import queue
+import socket
+import threading
+
+from source import networking
+
+
+class ForwardTarget(threading.Thread):
+    """
+    Sends datagrams to one target from its own thread.
+    The queue is bounded, a slow or unreachable target drops its datagrams instead of stalling the logger.
+    """
+
+    queue_size = 1024  # datagrams, about 10 seconds at 100 Hz
+
+    def __init__(self, ip: str, port: int):
+        super().__init__(daemon=True)
+        self.ip = ip
+        self.port = port
+        self.queue = queue.Queue(maxsize=ForwardTarget.queue_size)
+        self.udp_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.stop_event = threading.Event()
+        self.num_sent = 0
+        self.num_dropped = 0  # queue full, counted by the receiving thread
+        self.num_failed = 0  # send errors, counted by this thread
+        self.last_error = None
+
+    def put(self, datagram: bytes):
+        try:
+            self.queue.put_nowait(datagram)
+        except queue.Full:
+            self.num_dropped += 1
+
+    def run(self):
+        while not self.stop_event.is_set():
+            try:
+                datagram = self.queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            try:
+                networking.send_datagram(self.udp_socket, datagram, self.ip, self.port)
+                self.num_sent += 1
+            except OSError as error:
+                self.num_failed += 1
+                self.last_error = error
+
+    def stop(self):
+        self.stop_event.set()
+        if self.is_alive():
+            self.join()
+        self.udp_socket.close()
+
+    def get_stats_str(self):
+        stats_str = '{}:{}: sent {}, dropped {}, failed {}'.format(
+            self.ip, self.port, self.num_sent, self.num_dropped, self.num_failed)
+        if self.last_error is not None:
+            stats_str += ', last error: {}'.format(self.last_error)
+        return stats_str
+
+
+class UdpForwarder:
+    """
+    Mirrors received datagrams to several targets, e.g. motion platforms, dashboards or other loggers.
+    """
+
+    def __init__(self, targets: list):
+        """
+        :param targets: list of (ip, port) tuples
+        """
+        self.targets = [ForwardTarget(ip, port) for ip, port in targets]
+
+    def start(self):
+        for target in self.targets:
+            target.start()
+
+    def stop(self):
+        for target in self.targets:
+            target.stop()
+
+    def forward(self, datagrams: list):
+        for target in self.targets:
+            for datagram in datagrams:
+                target.put(datagram)
+
+    def get_stats_str(self):
+        return '\n'.join(['Forwarded to ' + target.get_stats_str() for target in self.targets])
@@ -13,7 +13,43 @@ class GameBase(ABC):
         pass
 
     @abstractmethod
-    def save_data(self, data, file_path):
+    def iter_samples(self, file_path, block_size):
+        pass
+
+    @abstractmethod
+    def convert_to_plot_units(self, samples, start_run_time, field_ids=None):
+        pass
+
+    @abstractmethod
+    def load_channels(self, file_path):
+        pass
+
+    @abstractmethod
+    def save_data(self, data, file_path, ingest_stats=None):
+        pass
+
+    @abstractmethod
+    def get_session_info(self, file_path):
+        pass
+
+    @abstractmethod
+    def load_ingest_stats(self, file_path):
+        pass
+
+    @abstractmethod
+    def load_pyramid(self, file_path):
+        pass
+
+    @abstractmethod
+    def add_pyramid(self, race_file, data):
+        pass
+
+    @abstractmethod
+    def create_session_file(self, file_path):
+        pass
+
+    @abstractmethod
+    def add_ingest_stats(self, race_file, ingest_stats):
         pass
 
     @abstractmethod
@@ -24,10 +60,30 @@ class GameBase(ABC):
     def get_num_fields(self):
         pass
 
+    @abstractmethod
+    def get_overview_fields(self):
+        pass
+
+    @abstractmethod
+    def get_sample_dtype(self):
+        pass
+
     @abstractmethod
     def get_data(self, udp_socket):
         pass
 
+    @abstractmethod
+    def get_data_batch(self, udp_socket):
+        pass
+
+    @abstractmethod
+    def decode_datagrams(self, datagrams):
+        pass
+
+    @abstractmethod
+    def encode_samples(self, samples):
+        pass
+
     @abstractmethod
     def get_game_state(self, receive_results, last_receive_results):
         pass
@@ -0,0 +1,8 @@
+from enum import Enum
+
+
+# shared by the games and the logger, kept separate so that games can be used without the logger
+class GameState(Enum):
+    ignore_package = 0
+    race_not_running = 1
+    race_running = 2
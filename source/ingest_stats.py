@@ -0,0 +1,122 @@
+import numpy as np
+
+
+class IngestStats:
+    """
+    Rolling statistics about the received packets, updated once per batch with a few numpy operations.
+    Gaps in the game's run time indicate dropped packets, the jitter compares the receive intervals
+    with the game's send intervals (like RFC 3550). Packets without receive times
+    don't count for the rate and the jitter.
+    """
+
+    window_size = 1024  # packets for rate, send interval and jitter, about 10 seconds at 100 Hz
+    gap_factor = 1.5  # run time steps longer than this times the usual send interval are gaps
+    max_gap = 1.0  # seconds, longer run time steps are interruptions, e.g. menus or loading screens
+
+    def __init__(self, run_time_field: int):
+        self.run_time_field = run_time_field
+        self.num_packets = 0
+        self.num_per_state = {}
+        self.num_duplicates = 0
+        self.num_gaps = 0
+        self.num_missing = 0
+        self.num_interruptions = 0
+        self.last_sample = None
+        self.receive_times = np.zeros((0,))
+        self.run_times = np.zeros((0,))
+
+    def reset(self):
+        self.__init__(self.run_time_field)
+
+    def add_samples(self, samples: np.ndarray, receive_times: np.ndarray = None):
+        """
+        :param samples: numpy array of shape (num_fields, num_samples)
+        :param receive_times: receive time per sample in seconds, None if unknown
+        """
+
+        num_samples = samples.shape[1]
+        if num_samples == 0:
+            return
+        self.num_packets += num_samples
+
+        # all equal except the run time, like GameDirtRally.get_game_state -> paused
+        if self.last_sample is not None:
+            samples_with_last = np.concatenate((np.expand_dims(self.last_sample, 1), samples), axis=1)
+        else:
+            samples_with_last = samples
+        duplicates = np.all(samples_with_last[1:, 1:] == samples_with_last[1:, :-1], axis=0)
+        self.num_duplicates += np.count_nonzero(duplicates)
+
+        if receive_times is None:
+            receive_times = np.full((num_samples,), np.nan)
+        self.receive_times = np.concatenate((self.receive_times, receive_times))[-IngestStats.window_size:]
+        self.run_times = np.concatenate((self.run_times, samples[self.run_time_field]))[-IngestStats.window_size:]
+
+        run_time_steps = np.diff(samples_with_last[self.run_time_field])
+        send_interval = self.get_send_interval()
+        if send_interval > 0.0:
+            gaps = (run_time_steps > send_interval * IngestStats.gap_factor) & \
+                   (run_time_steps <= IngestStats.max_gap)
+            self.num_gaps += np.count_nonzero(gaps)
+            self.num_missing += int(np.sum(np.round(run_time_steps[gaps] / send_interval) - 1.0))
+            self.num_interruptions += np.count_nonzero(run_time_steps > IngestStats.max_gap)
+        self.last_sample = samples[:, -1].copy()
+
+    def add_state(self, state_name: str):
+        self.num_per_state[state_name] = self.num_per_state.get(state_name, 0) + 1
+
+    def get_send_interval(self):
+        # median of the normal run time steps in the window, robust against gaps and restarts
+        if self.run_times.shape[0] < 2:
+            return 0.0
+        run_time_steps = np.diff(self.run_times)
+        run_time_steps = run_time_steps[(run_time_steps > 0.0) & (run_time_steps <= IngestStats.max_gap)]
+        return float(np.median(run_time_steps)) if run_time_steps.shape[0] > 0 else 0.0
+
+    def get_packets_per_second(self):
+        receive_times = self.receive_times[np.isfinite(self.receive_times)]
+        if receive_times.shape[0] < 2:
+            return 0.0
+        duration = receive_times[-1] - receive_times[0]
+        return (receive_times.shape[0] - 1) / duration if duration > 0.0 else 0.0
+
+    def get_jitter(self):
+        # mean absolute difference between receive and send intervals, without gaps and restarts
+        if self.receive_times.shape[0] < 2:
+            return 0.0
+        receive_steps = np.diff(self.receive_times)
+        run_time_steps = np.diff(self.run_times)
+        send_interval = self.get_send_interval()
+        valid = (run_time_steps > 0.0) & (run_time_steps <= send_interval * IngestStats.gap_factor) & \
+            np.isfinite(receive_steps)
+        if not np.any(valid):
+            return 0.0
+        return float(np.mean(np.abs(receive_steps[valid] - run_time_steps[valid])))
+
+    def get_stats_dict(self):
+        return {
+            'packets': self.num_packets,
+            'packets_per_state': dict(self.num_per_state),
+            'duplicates': int(self.num_duplicates),
+            'gaps': int(self.num_gaps),
+            'missing_packets': self.num_missing,
+            'interruptions': int(self.num_interruptions),
+            'packets_per_second': self.get_packets_per_second(),
+            'send_interval': self.get_send_interval(),
+            'jitter': self.get_jitter(),
+        }
+
+    def get_stats_str(self):
+        return IngestStats.stats_dict_to_str(self.get_stats_dict())
+
+    @staticmethod
+    def stats_dict_to_str(stats: dict):
+        states_str = ', '.join(['{}: {}'.format(state, num) for state, num in stats['packets_per_state'].items()])
+        return 'Packets: {packets} ({states}), {pps:.1f} packets/s\n' \
+               'Duplicates (paused): {duplicates}, gaps: {gaps} ({missing} missing packets), ' \
+               'interruptions: {interruptions}\n' \
+               'Send interval: {interval:.1f} ms, jitter: {jitter:.2f} ms'.format(
+                packets=stats['packets'], states=states_str, pps=stats['packets_per_second'],
+                duplicates=stats['duplicates'], gaps=stats['gaps'], missing=stats['missing_packets'],
+                interruptions=stats['interruptions'],
+                interval=stats['send_interval'] * 1000.0, jitter=stats['jitter'] * 1000.0)
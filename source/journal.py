@@ -0,0 +1,102 @@
+import mmap
+import os
+import struct
+
+from source import utils
+
+
+# file layout: header, then records of (receive time, datagram size, datagram bytes)
+# the file is pre-extended with zeros, so a record header of zeros marks the end, real receive times are never 0
+header_struct = struct.Struct('<8sH32s')  # magic, version, game name
+record_struct = struct.Struct('<dI')  # receive time in seconds since epoch, datagram size
+journal_magic = b'DR2JRNL\0'
+journal_version = 1
+journal_file_extension = '.dr2j'
+
+
+class RawJournal:
+    """
+    Append-only journal of raw datagrams for crash-safe capture.
+    Records are copied into a memory-mapped, pre-extended file, so the receive path never calls write().
+    The OS writes the mapped pages to disk even if the logger crashes or is killed.
+    """
+
+    chunk_size = 16 * 1024 * 1024  # bytes, about 10 minutes at 100 Hz with 276 bytes per record
+
+    def __init__(self, file_path: str, game_name: str):
+        utils.make_dir_for_file(file_path)
+        self.file_path = file_path
+        self.file = open(file_path, 'w+b')
+        self.file.truncate(RawJournal.chunk_size)
+        self.mmap = mmap.mmap(self.file.fileno(), RawJournal.chunk_size)
+        header_struct.pack_into(self.mmap, 0, journal_magic, journal_version, game_name.encode('utf-8'))
+        self.position = header_struct.size
+
+    def extend(self, min_size: int):
+        new_size = len(self.mmap) + max(RawJournal.chunk_size, min_size)
+        self.mmap.flush()
+        self.mmap.close()
+        self.file.truncate(new_size)
+        self.mmap = mmap.mmap(self.file.fileno(), new_size)
+
+    def write(self, datagram: bytes, receive_time: float):
+        record_size = record_struct.size + len(datagram)
+        if self.position + record_size > len(self.mmap):
+            self.extend(record_size)
+
+        # the record header is written last, so that a record is complete once its header is set
+        data_start = self.position + record_struct.size
+        self.mmap[data_start:data_start + len(datagram)] = datagram
+        record_struct.pack_into(self.mmap, self.position, receive_time, len(datagram))
+        self.position += record_size
+
+    def write_datagrams(self, datagrams: list, receive_times: list):
+        for datagram, receive_time in zip(datagrams, receive_times):
+            self.write(datagram, receive_time)
+
+    def close(self):
+        # cut the unused pre-extended part
+        self.mmap.flush()
+        self.mmap.close()
+        self.file.truncate(self.position)
+        self.file.close()
+
+
+def get_journal_path(session_path: str, time_str: str):
+    return os.path.join(session_path, 'journal', time_str + journal_file_extension)
+
+
+def read_journal(file_path: str):
+    """
+    Read a journal, also if it was not closed properly.
+    :param file_path: path to a journal file
+    :return: game name, list of receive times, list of datagrams
+    """
+
+    with open(file_path, 'rb') as f:
+        data = f.read()
+
+    if len(data) < header_struct.size:
+        raise ValueError('"{}" is too small to be a journal'.format(file_path))
+    magic, version, game_name = header_struct.unpack_from(data, 0)
+    if magic != journal_magic:
+        raise ValueError('"{}" is no journal'.format(file_path))
+    if version != journal_version:
+        raise ValueError('Unknown journal version {} in "{}"'.format(version, file_path))
+    game_name = game_name.rstrip(b'\0').decode('utf-8')
+
+    receive_times = []
+    datagrams = []
+    position = header_struct.size
+    while position + record_struct.size <= len(data):
+        receive_time, datagram_size = record_struct.unpack_from(data, position)
+        data_start = position + record_struct.size
+        if receive_time == 0.0 and datagram_size == 0:
+            break  # end of the written part, empty datagrams are kept
+        if data_start + datagram_size > len(data):
+            break  # truncated record
+        receive_times.append(receive_time)
+        datagrams.append(data[data_start:data_start + datagram_size])
+        position = data_start + datagram_size
+
+    return game_name, receive_times, datagrams
@@ -1,28 +1,45 @@
 import numpy as np
 import os
 import sys
+import time
 import traceback
-from enum import Enum
+import zipfile
 
 from source import networking
 from source import utils
 from source import plots
 from source import settings
+from source import journal
+from source import channel_store
+from source import session_file
+from source import session_library
+from source.forwarder import UdpForwarder
+from source.game_state import GameState
+from source.ingest_stats import IngestStats
+from source.run_analytics import RunAnalytics
+from source.save_worker import SaveWorker
+from source.session_library import SessionLibrary
+from source.ring_buffer import RingBuffer
+from source.session_buffer import SessionBuffer
 # from source.dr1.game_dr1 import GameDr1
 from source.dirt_rally.game_dirt_rally import GameDirtRally
 
 
-class GameState(Enum):
-    ignore_package = 0
-    race_not_running = 1
-    race_running = 2
+class LoggerBackend:
 
+    ring_buffer_capacity = 4096  # samples, about 40 seconds at 100 Hz
+    receive_timeout = 0.01  # seconds to wait for new samples per main loop iteration
 
-class LoggerBackend:
+    def __init__(self, debugging=False, log_raw_data=False, port_in=None, rig_name=None):
+        """
+        :param port_in: input port, the first port from the settings if None
+        :param rig_name: name of the sim rig when logging several rigs, also the sub-directory for its sessions
+        """
 
-    def __init__(self, debugging=False, log_raw_data=False):
         self.debugging = debugging
         self.log_raw_data = log_raw_data
+        self.port_in = port_in
+        self.rig_name = rig_name
 
         self.game_name = None
         self.game = None
@@ -31,17 +48,64 @@ class LoggerBackend:
         else:
             self.change_game(settings.settings['general']['game'])
 
-        self.session_collection = np.zeros((self.game.get_num_fields(), 0))
+        self.session_buffer = SessionBuffer(self.game.get_num_fields(), dtype=self.game.get_sample_dtype())
+        self.loaded_channels = None  # ChannelStore of a loaded session directory, read when the plots need it
         self.first_sample = np.zeros((self.game.get_num_fields(),))
-        self.raw_data = np.zeros((self.game.get_num_fields(), 0))
+        self.raw_data_buffer = None
         self.last_sample = np.zeros((self.game.get_num_fields(),))
         self.receive_results = np.zeros((self.game.get_num_fields(),))
-        self.receive_results_raw = np.zeros((self.game.get_num_fields(),))
         self.last_receive_results = None
         self.new_state = GameState.race_not_running
         self.last_state = GameState.race_not_running
         self.has_new_data = False
         self.udp_socket = None
+        self.ring_buffer = None
+        self.udp_receiver = None
+        self.journal = None
+        self.forwarder = None
+        self.session_file = None
+        self.num_samples_in_file = 0  # samples of the running race that were sent to the save worker
+        self.last_checkpoint_time = 0.0
+        self.checkpoint_interval = self.get_checkpoint_interval()
+        self.save_worker = SaveWorker()
+        self.save_worker.start()
+        self.library = None
+        self.last_num_dropped = 0
+        self.messages = []
+
+        # since start and since the last race start, the latter is saved with the race
+        run_time_field = self.game.get_fields_enum().run_time.value
+        self.ingest_stats = IngestStats(run_time_field)
+        self.run_ingest_stats = IngestStats(run_time_field)
+        self.run_analytics = RunAnalytics(self.game)
+
+    @property
+    def session_collection(self):
+        if self.loaded_channels is not None:
+            return self.loaded_channels
+        return self.session_buffer.get_data()
+
+    @session_collection.setter
+    def session_collection(self, data):
+        """
+        :param data: numpy array of shape (num_fields, num_samples) or a ChannelStore, which is kept as it is
+        """
+
+        self.run_analytics = RunAnalytics(self.game)
+        if isinstance(data, channel_store.ChannelStore):
+            # the plots compute their statistics from the channels they use
+            self.loaded_channels = data
+            self.session_buffer = SessionBuffer(self.game.get_num_fields(), dtype=self.game.get_sample_dtype())
+            return
+        self.loaded_channels = None
+        self.session_buffer = SessionBuffer(self.game.get_num_fields(), data=data, dtype=self.game.get_sample_dtype())
+        self.run_analytics.add_samples(self.session_buffer.get_data())
+
+    def append_session_samples(self, samples: np.ndarray):
+        if self.loaded_channels is not None:
+            self.session_collection = np.asarray(self.loaded_channels, dtype=self.game.get_sample_dtype())
+        self.session_buffer.append(samples)
+        self.run_analytics.add_samples(samples)
 
     @staticmethod
     def get_all_valid_games():
@@ -67,68 +131,281 @@ class LoggerBackend:
             settings.write_settings()
             self.change_game(GameDirtRally.valid_game_name_dr2)
 
-    def forward_datagram(self, datagram):
-        # forward datagram to another socket
-        # not necessary atm because you can simply duplicate the entry in the DR2 settings file
+    def start_forwarding(self):
+        # mirror the datagrams to other telemetry tools, e.g. motion platforms or dashboards
         try:
-            networking.send_datagram(self.udp_socket, datagram,
-                                     settings.settings['general']['ip_out'],
-                                     int(settings.settings['general']['port_out']))
+            forward_targets = settings.get_forward_targets()
         except ValueError:
-            print('Invalid output socket. Resetting...')
+            print('Invalid forward targets. Resetting...')
             settings.init_settings_output_socket()
             settings.write_settings()
-            networking.send_datagram(self.udp_socket, datagram,
-                                     settings.settings['general']['ip_out'],
-                                     int(settings.settings['general']['port_out']))
+            forward_targets = settings.get_forward_targets()
+
+        self.forwarder = UdpForwarder(forward_targets)
+        self.forwarder.start()
+        print('Forwarding datagrams to {}'.format(', '.join(['{}:{}'.format(ip, port) for ip, port in forward_targets])))
+
+    def save_run_data(self, data: np.ndarray, automatic_name=False, ingest_stats: dict = None, file_path: str = None):
+        """
+        :param file_path: save without a file dialog if given
+        """
 
-    def save_run_data(self, data: np.ndarray, automatic_name=False):
         if data is None or data.shape[1] == 0:
             print('Nothing to save!')
             return
 
-        # TODO: this will block the main thread and data from the port may be lost -> put in extra process
+        # only the file dialog blocks the main thread, the save worker compresses and writes
+        self.make_session_dir()
+        if file_path is None:
+            file_path = self.get_auto_file_path(data)
+            if not automatic_name:
+                file_path = self.ask_save_file_path(os.path.basename(file_path))
+
+        if file_path is not None and file_path != '' and file_path != '.npz':
+            # the session buffer never modifies written samples, so the worker can use the data without a copy
+            self.save_worker.submit(LoggerBackend.save_data_job, self.game, data, file_path, ingest_stats,
+                                    self.get_library())
+
+    def ask_save_file_path(self, file_name: str):
         import tkinter as tk
         from tkinter import filedialog
-        from datetime import datetime
 
+        root = tk.Tk()
+        root.withdraw()
+        return filedialog.asksaveasfilename(
+            initialdir=self.get_session_path(),
+            initialfile=file_name,
+            title='Save race log',
+            filetypes=(("numpy", "*.npz"), ("session directory", "*" + channel_store.channel_dir_extension)))
+
+    def get_library(self):
+        # one library for the session path of all rigs
+        if self.library is None:
+            self.make_session_dir()
+            self.library = SessionLibrary(settings.settings['general']['session_path'])
+        return self.library
+
+    @staticmethod
+    def add_to_library(library, file_path: str, message: str):
+        if library is None:
+            return message
+        try:
+            library.add(file_path)
+        except Exception as er:
+            message += '\nError while adding {} to the session library: {}'.format(file_path, er)
+        return message
+
+    @staticmethod
+    def save_data_job(game, data: np.ndarray, file_path: str, ingest_stats: dict, library=None):
+        utils.make_dir_for_file(file_path)
+        game.save_data(data, file_path, ingest_stats=ingest_stats)
+        if not file_path.endswith('.npz') and not file_path.endswith(channel_store.channel_dir_extension):
+            file_path += '.npz'  # added by save_data
+        message = 'Saved {} data points to {}'.format(data.shape[1], os.path.abspath(file_path))
+        return LoggerBackend.add_to_library(library, file_path, message)
+
+    @staticmethod
+    def create_session_file_job(race_file):
+        try:
+            race_file.create()
+        except OSError as er:
+            race_file.error = er
+            return 'Error while creating session file: {}\n{}'.format(race_file.file_path, er)
+
+    @staticmethod
+    def append_session_chunk_job(race_file, samples: np.ndarray):
+        if race_file.error is not None:
+            return  # already reported, the race is saved as a whole at the end
+        try:
+            race_file.append(samples)
+        except OSError as er:
+            race_file.error = er
+            return 'Error while writing session file: {}\n{}'.format(race_file.file_path, er)
+
+    @staticmethod
+    def report_unfinished_race_job(race_file):
+        if race_file.error is None:
+            return 'Unfinished race saved to {}, it can be recovered at the next start'.format(
+                os.path.abspath(race_file.file_path))
+
+    @staticmethod
+    def finish_session_file_job(game, race_file, data: np.ndarray, file_path: str, ingest_stats: dict, library):
+        if not file_path.endswith('.npz'):
+            # other session format, the chunks were only a backup during the race
+            race_file.delete()
+            return LoggerBackend.save_data_job(game, data, file_path, ingest_stats, library)
+
+        if race_file.error is None:
+            try:
+                race_file.append(data[:, race_file.num_samples:])
+                if ingest_stats is not None:
+                    game.add_ingest_stats(race_file, ingest_stats)
+                game.add_pyramid(race_file, data)
+                race_file.move(file_path)
+                message = 'Saved {} data points to {}'.format(race_file.num_samples, os.path.abspath(file_path))
+                return LoggerBackend.add_to_library(library, file_path, message)
+            except OSError as er:
+                race_file.error = er
+
+        # fall back to saving the whole race
+        message = 'Error while finishing session file: {}\n{}\n'.format(race_file.file_path, race_file.error)
+        race_file.delete()
+        return message + LoggerBackend.save_data_job(game, data, file_path, ingest_stats, library)
+
+    def make_session_dir(self):
         try:
-            os.makedirs(settings.settings['general']['session_path'], exist_ok=True)
+            os.makedirs(self.get_session_path(), exist_ok=True)
         except ValueError:
             print('Invalid session path. Resetting...')
             settings.init_settings_session_path()
             settings.write_settings()
-            os.makedirs(settings.settings['general']['session_path'], exist_ok=True)
+            os.makedirs(self.get_session_path(), exist_ok=True)
+
+    def get_auto_file_path(self, data: np.ndarray, date=None, game=None):
+        """
+        :param date: datetime for the name, now if None
+        :param game: game of the data, the current game if None
+        """
+
+        from datetime import datetime
+
+        game = self.game if game is None else game
 
         # assemble default name
         last_sample = data[:, -1]
-        car_name = self.game.get_car_name(last_sample)
-        track_name = self.game.get_track_name(last_sample)
-        race_time = self.game.get_race_duration(data)
+        car_name = game.get_car_name(last_sample)
+        track_name = game.get_track_name(last_sample)
+        race_time = game.get_race_duration(data)
         total_race_time = '{:.1f}'.format(race_time)
-        now = datetime.now()
+        now = datetime.now() if date is None else date
         now_str = now.strftime('%Y-%m-%d %H_%M_%S')
-        file_name = '{} - {} - {} - {}s.npz'.format(now_str, car_name, track_name, total_race_time)
-        file_path = os.path.join(settings.settings['general']['session_path'], file_name)
-
-        if not automatic_name:
-            root = tk.Tk()
-            root.withdraw()
-            file_path = filedialog.asksaveasfilename(
-                initialdir=settings.settings['general']['session_path'],
-                initialfile=file_name,
-                title='Save race log',
-                filetypes=(("numpy", "*.npz"),))
+        file_name = '{} - {} - {} - {}s{}'.format(
+            now_str, car_name, track_name, total_race_time, settings.get_session_file_extension())
+        return os.path.join(self.get_session_path(), file_name)
 
-        if file_path is not None and file_path != '' and file_path != '.npz':
-            utils.make_dir_for_file(file_path)
-            self.game.save_data(data, file_path)
-            print('Saved {} data points to {}'.format(data.shape[1], os.path.abspath(file_path)))
+    def get_checkpoint_interval(self):
+        try:
+            return settings.get_checkpoint_interval()
+        except ValueError:
+            print('Invalid checkpoint interval. Resetting...')
+            settings.init_settings_checkpoint_interval()
+            settings.write_settings()
+            return settings.get_checkpoint_interval()
+
+    def start_session_file(self):
+        # the race is checkpointed while it's running, see session_file.py
+        from datetime import datetime
+
+        self.make_session_dir()
+        file_name = datetime.now().strftime('%Y-%m-%d %H_%M_%S') + '.npz'
+        file_path = os.path.join(self.get_unfinished_races_dir(), file_name)
+        self.session_file = self.game.create_session_file(file_path)
+        self.num_samples_in_file = 0
+        self.last_checkpoint_time = time.time()
+        self.save_worker.submit(LoggerBackend.create_session_file_job, self.session_file)
+
+    def write_session_chunk(self, force=False):
+        """
+        Checkpoint the running race. Only the samples since the last checkpoint are written as a new chunk.
+        :param force: write the new samples now instead of after the checkpoint interval
+        """
+
+        if self.session_file is None or self.get_num_samples() == self.num_samples_in_file:
+            return
+
+        now = time.time()
+        if force or now - self.last_checkpoint_time >= self.checkpoint_interval:
+            self.save_worker.submit(LoggerBackend.append_session_chunk_job, self.session_file,
+                                    self.session_collection[:, self.num_samples_in_file:])
+            self.num_samples_in_file = self.get_num_samples()
+            self.last_checkpoint_time = now
+
+    def get_unfinished_races_dir(self):
+        return os.path.join(self.get_session_path(), 'in_progress')
+
+    def get_unfinished_races(self):
+        """
+        :return: checkpointed races that were never finished, e.g. because the logger crashed
+        """
+
+        races_dir = self.get_unfinished_races_dir()
+        if not os.path.isdir(races_dir):
+            return []
+        running_race = None if self.session_file is None else os.path.abspath(self.session_file.file_path)
+        file_paths = [os.path.join(races_dir, f) for f in sorted(os.listdir(races_dir)) if f.endswith('.npz')]
+        return [f for f in file_paths if os.path.abspath(f) != running_race]
+
+    def recover_unfinished_race(self, file_path: str):
+        """
+        Save a checkpointed race like a finished race, named with its start time.
+        A file that was damaged while a chunk was appended is repaired first.
+        """
+
+        from datetime import datetime
+
+        try:
+            try:
+                with np.load(file_path) as npz_file:
+                    _ = npz_file.files
+            except zipfile.BadZipFile:
+                num_entries = session_file.repair(file_path)
+                print('Repaired damaged file {}, recovered {} entries'.format(file_path, num_entries))
+            game = GameDirtRally(game_name=session_library.get_game_name(file_path))
+            data = game.load_data(file_path)
+            with np.load(file_path) as npz_file:
+                num_chunks = len(session_file.get_chunk_keys(npz_file.files))
+        except (OSError, ValueError, KeyError, EOFError, zipfile.BadZipFile) as er:
+            print('Error while recovering unfinished race: {}\n{}'.format(file_path, er))
+            return
 
-    def save_run(self, automatic_name=False):
-        self.save_run_data(data=self.session_collection, automatic_name=automatic_name)
+        if data.shape[1] == 0:
+            print('Removed unfinished race without samples: {}'.format(file_path))
+            os.remove(file_path)
+            return
+
+        try:
+            date = datetime.strptime(os.path.basename(file_path)[:19], '%Y-%m-%d %H_%M_%S')
+        except ValueError:
+            date = None
+        race_file = game.create_session_file(file_path)
+        race_file.num_chunks = num_chunks
+        race_file.num_samples = data.shape[1]
+        target_file_path = self.get_auto_file_path(data, date=date, game=game)
+        self.save_worker.submit(LoggerBackend.finish_session_file_job, game, race_file, data, target_file_path,
+                                None, self.get_library())
+
+    def discard_session_file(self):
+        if self.session_file is not None:
+            self.save_worker.submit(self.session_file.delete)
+            self.session_file = None
+
+    def save_race(self):
+        """
+        Save the finished race with an automatic name. If it was written during the race,
+        only the last chunk is written and the file is renamed.
+        """
+
+        race_duration = self.game.get_race_duration(self.session_collection)
+        if race_duration <= 10.0:  # only save if more than 10 sec of race time
+            self.discard_session_file()
+            return
+
+        ingest_stats = self.get_run_ingest_stats()
+        if self.session_file is None:
+            self.save_run_data(self.session_collection, automatic_name=True, ingest_stats=ingest_stats)
+            return
+
+        file_path = self.get_auto_file_path(self.session_collection)
+        self.save_worker.submit(LoggerBackend.finish_session_file_job, self.game, self.session_file,
+                                self.session_collection, file_path, ingest_stats, self.get_library())
+        self.session_file = None
+
+    def save_run(self, automatic_name=False, file_path: str = None):
+        data = np.asarray(self.session_collection, dtype=self.game.get_sample_dtype())
+        self.save_run_data(data=data, automatic_name=automatic_name,
+                           ingest_stats=self.get_run_ingest_stats(), file_path=file_path)
 
-    def load_run(self):
+    def ask_load_file_path(self):
         # TODO: this will block the main thread and data from the port may be lost
 
         import tkinter as tk
@@ -136,16 +413,32 @@ class LoggerBackend:
 
         root = tk.Tk()
         root.withdraw()
-        file_path = filedialog.askopenfilename(
-            initialdir=settings.settings['general']['session_path'],
+        return filedialog.askopenfilename(
+            initialdir=self.get_session_path(),
             title='Load race log',
-            filetypes=(("numpy", "*.npz"), ("all files", "*.*")))
+            filetypes=(("numpy", "*.npz"), ("session directory", channel_store.meta_file_name), ("all files", "*.*")))
+
+    def load_run(self, file_path: str = None):
+        """
+        :param file_path: load without a file dialog if given
+        """
+
+        if file_path is None:
+            file_path = self.ask_load_file_path()
         if file_path is not None and file_path != '':
-            if os.path.isfile(file_path):
+            if os.path.isfile(file_path) or channel_store.get_session_dir(file_path) is not None:
                 try:
-                    race_data = self.game.load_data(file_path)
+                    if channel_store.get_session_dir(file_path) is not None:
+                        race_data = self.game.load_channels(file_path)
+                    else:
+                        race_data = self.game.load_data(file_path)
+                    self.discard_session_file()
                     self.session_collection = race_data
+                    self.run_ingest_stats.reset()
                     print('Loaded {} data points from {}'.format(self.session_collection.shape[1], file_path))
+                    ingest_stats = self.game.load_ingest_stats(file_path)
+                    if ingest_stats is not None:
+                        print('Ingest statistics of this run:\n' + IngestStats.stats_dict_to_str(ingest_stats))
                 except ValueError as er:
                     print('Error while loading race data: {}\n{}'.format(file_path, er))
 
@@ -154,35 +447,140 @@ class LoggerBackend:
             else:
                 print('"{}" is no valid file!'.format(file_path))
 
+    def recover_journal(self, file_path):
+        """
+        Rebuild saved runs from a raw datagram journal, e.g. after a crash.
+        Finished races are saved as usual, an unfinished race at the end of the journal is saved as well.
+        """
+
+        try:
+            game_name, receive_times, datagrams = journal.read_journal(file_path)
+        except (OSError, ValueError) as er:
+            print('Error while reading journal: {}\n{}'.format(file_path, er))
+            return
+        if game_name != self.game_name:
+            self.change_game(game_name)
+        print('Read {} datagrams from {}'.format(len(datagrams), file_path))
+
+        self.clear_session_collection()
+        self.last_state = GameState.race_not_running
+        self.new_state = GameState.race_not_running
+        self.process_samples(self.game.decode_datagrams(datagrams), np.array(receive_times))
+
+        if self.last_state == GameState.race_running and \
+                self.game.get_race_duration(self.session_collection) > 10.0:
+            sys.stdout.write('\n')
+            self.save_race()
+            self.messages += ['Recovered unfinished race']
+        self.discard_session_file()
+        self.save_worker.flush()
+
+        message = self.pop_messages()
+        if len(message) > 0:
+            print(message)
+
+    def get_session_path(self):
+        if self.rig_name is None:
+            return settings.settings['general']['session_path']
+        else:
+            return os.path.join(settings.settings['general']['session_path'], self.rig_name)
+
+    def get_port_in(self):
+        if self.port_in is not None:
+            return self.port_in
+        else:
+            return settings.get_ports_in()[0]
+
     def get_game_state_str(self):
-        return self.game.get_game_state_str(self.new_state, self.last_sample, self.session_collection.shape[1])
+        game_state_str = self.game.get_game_state_str(self.new_state, self.last_sample, self.get_num_samples())
+        if self.rig_name is not None:
+            game_state_str = '{}: {}'.format(self.rig_name, game_state_str)
+        return game_state_str
 
     def get_num_samples(self):
-        return self.session_collection.shape[1]
+        if self.loaded_channels is not None:
+            return self.loaded_channels.num_samples
+        return self.session_buffer.get_num_samples()
 
     def clear_session_collection(self):
-        self.session_collection = np.zeros((self.game.get_num_fields(), 0))
+        self.loaded_channels = None
+        self.session_buffer.clear()
+        self.run_analytics.reset()
         self.first_sample = np.zeros((self.game.get_num_fields(),))
         self.last_receive_results = None
-
-    def start_logging(self):
-        self.udp_socket = networking.open_port(settings.settings['general']['ip_in'],
-                                          int(settings.settings['general']['port_in']))
+        self.run_ingest_stats.reset()
+        self.discard_session_file()  # the samples are gone, the race is saved as a whole if it continues
+
+    def get_run_ingest_stats(self):
+        # None for loaded runs
+        return self.run_ingest_stats.get_stats_dict() if self.run_ingest_stats.num_packets > 0 else None
+
+    def get_run_analytics_str(self):
+        analytics_str = self.run_analytics.get_summary_str()
+        if self.rig_name is not None:
+            analytics_str = '{}:\n{}'.format(self.rig_name, analytics_str)
+        return analytics_str
+
+    def get_ingest_stats_str(self):
+        stats_str = 'Since start:\n{}\nSince race start:\n{}\nReceive buffer overflows: {} samples'.format(
+            self.ingest_stats.get_stats_str(), self.run_ingest_stats.get_stats_str(), self.get_num_dropped())
+        if self.forwarder is not None:
+            stats_str += '\n' + self.forwarder.get_stats_str()
+        if self.rig_name is not None:
+            stats_str = '{}:\n{}'.format(self.rig_name, stats_str)
+        return stats_str
+
+    def start_logging(self, receive_thread=True, udp_receiver=None):
+        """
+        Open the input socket.
+        :param receive_thread: receive in a thread that feeds the ring buffer for check_udp_messages.
+        Set to False when another engine reads from self.udp_socket and calls process_samples.
+        :param udp_receiver: shared UdpReceiver for several rigs, the caller starts and stops it.
+        A receiver for this backend alone is created if None.
+        """
+
+        ip_in = settings.settings['general']['ip_in']
+        self.udp_socket = networking.open_port(ip_in, self.get_port_in())
         if self.udp_socket is not None:
             print('Listening on socket {} for data from {}'.format(self.udp_socket.getsockname(), self.game_name))
+        elif self.rig_name is not None:
+            # don't reset the settings of all rigs because of one busy port
+            print('Failed to open socket on {}:{} for {}. Is another program already listening on this socket?'.format(
+                ip_in, self.get_port_in(), self.rig_name))
         else:
             print('Invalid input socket. Resetting...')
             settings.init_settings_input_socket()
             settings.write_settings()
-            self.udp_socket = networking.open_port(settings.settings['general']['ip_in'],
-                                                   int(settings.settings['general']['port_in']))
+            self.udp_socket = networking.open_port(settings.settings['general']['ip_in'], self.get_port_in())
             if self.udp_socket is None:
                 print('Failed to open socket on {}:{}. Is another program already listening on this socket?'.format(
-                    settings.settings['general']['ip_in'], int(settings.settings['general']['port_in'])))
+                    settings.settings['general']['ip_in'], self.get_port_in()))
             else:
                 print('Listening on socket {}'.format(self.udp_socket.getsockname()))
 
-        self.raw_data = np.zeros((self.game.get_num_fields(), 0)) if self.log_raw_data else None
+        if self.udp_socket is not None and settings.settings['general']['journal'] == '1':
+            from datetime import datetime
+            journal_path = journal.get_journal_path(
+                self.get_session_path(), datetime.now().strftime('%Y-%m-%d %H_%M_%S'))
+            self.journal = journal.RawJournal(journal_path, self.game_name)
+            print('Writing raw datagrams to {}'.format(os.path.abspath(journal_path)))
+
+        if self.udp_socket is not None and settings.settings['general']['forward_udp'] == '1':
+            self.start_forwarding()
+
+        if self.udp_socket is not None and receive_thread:
+            self.ring_buffer = RingBuffer(self.game.get_num_fields(), LoggerBackend.ring_buffer_capacity,
+                                          dtype=self.game.get_sample_dtype())
+            if udp_receiver is None:
+                self.udp_receiver = networking.UdpReceiver()
+                udp_receiver = self.udp_receiver
+            udp_receiver.add_source(udp_socket=self.udp_socket, receive_function=self.game.get_data_batch,
+                                    ring_buffer=self.ring_buffer, journal=self.journal, forwarder=self.forwarder)
+            if self.udp_receiver is not None:
+                self.udp_receiver.start()
+
+        self.raw_data_buffer = SessionBuffer(self.game.get_num_fields(), dtype=self.game.get_sample_dtype()) \
+            if self.log_raw_data else None
 
         if self.debugging:  # start with plots
             self.session_collection = self.game.load_data(
@@ -205,43 +603,114 @@ class LoggerBackend:
         else:
             raise ValueError('Unknown state: {}'.format(state))
 
-    def check_udp_messages(self):
-        self.receive_results, datagram = self.game.get_data(self.udp_socket)
-        # forward_datagram(udp_socket=self.udp_socket, datagram=datagram, settings=settings)
+    def check_udp_messages(self, timeout=receive_timeout):
+        """
+        Process all samples from the receive thread.
+        :param timeout: wait up to this many seconds for new samples, don't wait if None
+        """
 
-        if self.receive_results is not None:
-            if self.log_raw_data:
-                self.receive_results_raw = np.expand_dims(self.receive_results, 1)
-                if self.raw_data.size == 0:
-                    self.raw_data = self.receive_results_raw
-                else:
-                    self.raw_data = np.append(self.session_collection, self.receive_results_raw, axis=1)
+        if self.ring_buffer is None:
+            if timeout is not None:
+                time.sleep(timeout)  # nothing to receive, don't spin
+            return
+
+        samples, receive_times = self.ring_buffer.pop_all(timeout=timeout)
+        self.check_dropped_samples()
+        self.process_samples(samples, receive_times)
+
+        # update the status line once per batch instead of once per sample
+        if samples.shape[1] > 0:
+            self.write_status_line()
+
+    def write_status_line(self):
+        # several rigs would overwrite each other's status line, they show their state in the window title
+        if self.last_state == GameState.race_running and self.rig_name is None:
+            game_state_str = self.get_game_state_str()
+            sys.stdout.write('\r' + game_state_str),
+            sys.stdout.flush()
+
+    def check_dropped_samples(self):
+        num_dropped = self.ring_buffer.num_dropped
+        if num_dropped > self.last_num_dropped:
+            self.messages += ['Receive buffer overflow: dropped {} samples ({} in total)'.format(
+                num_dropped - self.last_num_dropped, num_dropped)]
+            self.last_num_dropped = num_dropped
+
+    def get_num_dropped(self):
+        return 0 if self.ring_buffer is None else self.ring_buffer.num_dropped
+
+    def add_ingest_stats(self, samples: np.ndarray, receive_times: np.ndarray):
+        self.ingest_stats.add_samples(samples, receive_times)
+        self.run_ingest_stats.add_samples(samples, receive_times)
+
+    def process_samples(self, samples: np.ndarray, receive_times: np.ndarray = None):
+        """
+        Run the state machine for each sample but append consecutive accepted samples in one operation.
+        Pending samples are appended before a state change so that starting and finishing races see them.
+        :param samples: numpy array of shape (num_fields, num_samples)
+        :param receive_times: receive time per sample in seconds for the ingest statistics, None if unknown
+        """
+
+        if self.log_raw_data:
+            self.raw_data_buffer.append(samples)
+
+        first_pending = None
+        stats_start = 0
+        for i in range(samples.shape[1]):
+            self.receive_results = samples[:, i]
 
             self.new_state = self.game.get_game_state(self.receive_results, self.last_receive_results)
             self.last_sample = self.receive_results
             self.has_new_data = self.accept_new_data(self.new_state)
-            if self.has_new_data:
-                if self.session_collection.size == 0:
-                    self.session_collection = np.expand_dims(self.receive_results, 1)
-                else:
-                    self.session_collection = np.append(self.session_collection,
-                                                        np.expand_dims(self.receive_results, 1), axis=1)
-        else:
-            self.new_state = self.last_state
-            self.has_new_data = False
+            state_name = self.new_state.name
+
+            if self.has_new_data and first_pending is None:
+                first_pending = i
+            state_changes = self.new_state != GameState.ignore_package and self.new_state != self.last_state
+            if first_pending is not None and (not self.has_new_data or state_changes):
+                self.append_session_samples(samples[:, first_pending:i + 1 if self.has_new_data else i])
+                first_pending = None
+            if state_changes:
+                # the statistics of a race must be complete when it's saved and start with its first sample
+                self.add_ingest_stats(samples[:, stats_start:i],
+                                      None if receive_times is None else receive_times[stats_start:i])
+                stats_start = i
+
+            message = self.check_state_changes()
+            if len(message) > 0:
+                self.messages += [message]
+            self.ingest_stats.add_state(state_name)
+            self.run_ingest_stats.add_state(state_name)
+
+        if first_pending is not None:
+            self.append_session_samples(samples[:, first_pending:])
+        self.add_ingest_stats(samples[:, stats_start:], None if receive_times is None else receive_times[stats_start:])
+        self.write_session_chunk()
+
+    def pop_messages(self):
+        self.messages += self.save_worker.pop_messages()
+        if self.rig_name is not None:
+            self.messages = ['[{}] {}'.format(self.rig_name, m.strip('\n')) for m in self.messages]
+        message_str = '\n'.join(self.messages)
+        self.messages = []
+        return message_str
 
     def show_plots(self, additional_plots=False):
         plot_data = self.game.get_plot_data(self.session_collection)
+        # the analytics must describe the same samples as the plot data
+        run_analytics = self.run_analytics if self.run_analytics.num_samples == self.get_num_samples() else None
         car_name = self.game.get_car_name(self.session_collection[:, -1])
         track_name = self.game.get_track_name(self.session_collection[:, -1])
 
         if self.debugging:
             plots.plot_main(
-                plot_data=plot_data, car_name=car_name, track_name=track_name, additional_plots=additional_plots)
+                plot_data=plot_data, car_name=car_name, track_name=track_name, additional_plots=additional_plots,
+                run_analytics=run_analytics)
         else:
             try:
                 plots.plot_main(
-                    plot_data=plot_data, car_name=car_name, track_name=track_name, additional_plots=additional_plots)
+                    plot_data=plot_data, car_name=car_name, track_name=track_name, additional_plots=additional_plots,
+                    run_analytics=run_analytics)
             except Exception:
                 print('Error during plot: {}'.format(sys.exc_info()))
                 print(traceback.format_exc())
@@ -253,12 +722,6 @@ class LoggerBackend:
         if self.debugging and self.last_state != self.new_state:
             message += ['State changed from {} to {}'.format(self.last_state, self.new_state)]
 
-        if self.last_state == GameState.race_running and \
-                self.new_state == GameState.race_running:
-            game_state_str = self.get_game_state_str()
-            sys.stdout.write('\r' + game_state_str),
-            sys.stdout.flush()
-
         # simply ignore state changes through duplicates
         if self.new_state == GameState.ignore_package:
             self.new_state = self.last_state
@@ -268,13 +731,12 @@ class LoggerBackend:
             sys.stdout.write('\n')
             sys.stdout.flush()
 
-            race_duration = self.game.get_race_duration(self.session_collection)
-            if race_duration > 10.0:  # only save if more than 10 sec of race time
-                self.save_run_data(self.session_collection, automatic_name=True)
+            self.save_race()
             message += ['Race finished']
+            message += [self.run_analytics.get_summary_str()]
 
             if self.log_raw_data:
-                self.save_run_data(self.raw_data, automatic_name=False)
+                self.save_run_data(self.raw_data_buffer.get_data(), automatic_name=False)
         elif self.last_state == GameState.race_not_running and \
                 self.new_state == GameState.race_running:
             message += ['\nRace starting: {} on {}'.format(
@@ -284,6 +746,7 @@ class LoggerBackend:
             if self.session_collection.shape[1] > 10:  # should only be less than 100 at the first race after startup
                 message += ['Cleared {} data points'.format(self.session_collection.shape[1])]
             self.clear_session_collection()
+            self.start_session_file()
 
         self.last_state = self.new_state
         if self.has_new_data:
@@ -293,5 +756,26 @@ class LoggerBackend:
         return message_str
 
     def end_logging(self):
+        if self.udp_receiver is not None:
+            self.udp_receiver.stop()
+        if self.journal is not None:
+            self.journal.close()
+            self.journal = None
+        if self.forwarder is not None:
+            self.forwarder.stop()
+            print(self.forwarder.get_stats_str())
+            self.forwarder = None
+        if self.session_file is not None:
+            # keep the unfinished race, the file is valid up to the last chunk
+            self.write_session_chunk(force=True)
+            self.save_worker.submit(LoggerBackend.report_unfinished_race_job, self.session_file)
+            self.session_file = None
+
+        # finish all queued saves before exiting
+        self.save_worker.flush()
+        self.save_worker.stop()
+        message = self.pop_messages()
+        if len(message) > 0:
+            print(message)
         if self.udp_socket is not None:
             self.udp_socket.close()
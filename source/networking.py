@@ -1,4 +1,7 @@
+import selectors
 import socket
+import threading
+import time
 
 
 def send_datagram(udp_socket: socket, datagram: bytes, ip, port):
@@ -6,11 +9,45 @@ def send_datagram(udp_socket: socket, datagram: bytes, ip, port):
         udp_socket.sendto(datagram, (ip, port))
 
 
+def receive_datagrams(udp_socket: socket, buffer_size=1024):
+    """
+    Wait for the next datagram (up to the socket timeout) and then read all datagrams
+    that are already queued in the socket without blocking.
+    :param udp_socket: socket from open_port
+    :param buffer_size: max bytes per datagram
+    :return: list of datagrams, empty if nothing arrived before the timeout, and list of their receive times
+    in seconds since epoch, taken when each datagram is read so that they keep the timing within a batch
+    """
+
+    try:
+        datagrams = [udp_socket.recv(buffer_size)]
+    except socket.timeout as _:
+        return [], []
+    receive_times = [time.time()]
+
+    timeout = udp_socket.gettimeout()
+    udp_socket.settimeout(0.0)
+    try:
+        while True:
+            datagrams.append(udp_socket.recv(buffer_size))
+            receive_times.append(time.time())
+    except BlockingIOError as _:
+        pass  # queue is empty
+    finally:
+        udp_socket.settimeout(timeout)
+    return datagrams, receive_times
+
+
 def open_port(udp_ip: str, udp_port: int):
 
     udp_socket = socket.socket(socket.AF_INET,  # Internet
                                socket.SOCK_DGRAM)  # UDP
     udp_socket.settimeout(0.01)
+    try:
+        # larger kernel buffer to survive bursts while the receive thread is busy
+        udp_socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1024 * 1024)
+    except socket.error as _:
+        pass  # keep the OS default
     try:
         udp_socket.bind((udp_ip, udp_port))
     except socket.error as error:
@@ -36,3 +73,60 @@ def open_port(udp_ip: str, udp_port: int):
         udp_socket = None
 
     return udp_socket
+
+
+class UdpReceiver(threading.Thread):
+    """
+    Owns the input sockets and pushes every decoded batch of samples into the ring buffer of its source,
+    so that packets are not lost while the main thread plots, saves or waits for dialogs.
+    One thread serves all sockets, e.g. one per sim rig.
+    """
+
+    select_timeout = 0.01  # seconds, keeps the loop responsive to stop()
+
+    def __init__(self):
+        super().__init__(daemon=True)
+        self.selector = selectors.DefaultSelector()
+        self.stop_event = threading.Event()
+
+    def add_source(self, udp_socket: socket, receive_function, ring_buffer, journal=None, forwarder=None):
+        """
+        Register a socket before starting the thread.
+        :param udp_socket: socket from open_port
+        :param receive_function: returns (samples, datagrams, receive times), see GameBase.get_data_batch
+        :param ring_buffer: RingBuffer for the decoded samples
+        :param journal: optional RawJournal for the raw datagrams
+        :param forwarder: optional UdpForwarder that mirrors the raw datagrams
+        """
+        self.selector.register(udp_socket, selectors.EVENT_READ, (receive_function, ring_buffer, journal, forwarder))
+
+    def run(self):
+        while not self.stop_event.is_set():
+            if len(self.selector.get_map()) == 0:
+                self.stop_event.wait(UdpReceiver.select_timeout)  # select fails without sockets on Windows
+                continue
+
+            for key, _ in self.selector.select(timeout=UdpReceiver.select_timeout):
+                receive_function, ring_buffer, journal, forwarder = key.data
+                try:
+                    samples, datagrams, receive_times = receive_function(key.fileobj)
+                except OSError as error:
+                    if not self.stop_event.is_set():
+                        print('Socket error while receiving: {}'.format(error))
+                        self.stop_event.wait(0.1)  # don't flood the console if the error persists
+                    continue
+                if journal is not None and len(datagrams) > 0:
+                    journal.write_datagrams(datagrams, receive_times)
+                if forwarder is not None and len(datagrams) > 0:
+                    forwarder.forward(datagrams)
+                if samples is not None and samples.shape[1] > 0:
+                    # decode_datagrams skips short datagrams, the receive times don't fit then
+                    if samples.shape[1] != len(receive_times):
+                        receive_times = receive_times[-1]
+                    ring_buffer.push_block(samples, receive_times)
+
+    def stop(self):
+        self.stop_event.set()
+        if self.is_alive():
+            self.join()
+        self.selector.close()
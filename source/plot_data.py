@@ -1,5 +1,5 @@
 import numpy as np
-from dataclasses import dataclass
+from dataclasses import dataclass, fields
 
 
 @dataclass
@@ -64,3 +64,31 @@ class PlotData:
     steering: np.ndarray  # raw input: -1..+1
     brakes: np.ndarray  # raw input: 0..1
     clutch: np.ndarray  # raw input: 0..1
+
+
+class LazyPlotData(PlotData):
+    """
+    PlotData whose channels are computed when they are first accessed, e.g. the RPM scaling and the switch of the
+    coordinate system. Plots that use only some channels don't pay for the others. Channels that need no conversion
+    are views of the session if its samples are float64 already.
+    """
+
+    def __init__(self, channel_functions: dict):
+        """
+        :param channel_functions: field name -> function without arguments that returns the channel
+        """
+
+        # the dataclass __init__ is skipped, the fields are set on first access
+        missing_fields = [f.name for f in fields(PlotData) if f.name not in channel_functions]
+        if len(missing_fields) > 0:
+            raise ValueError('No channel functions for: {}'.format(', '.join(missing_fields)))
+        self._channel_functions = channel_functions
+
+    def __getattr__(self, name):
+        # only called for fields that are not computed yet
+        channel_functions = self.__dict__.get('_channel_functions')
+        if channel_functions is None or name not in channel_functions:
+            raise AttributeError(name)
+        channel = channel_functions[name]()
+        setattr(self, name, channel)
+        return channel
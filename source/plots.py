@@ -12,6 +12,9 @@ from scipy.stats import binned_statistic
 
 from source import plot_data as pd
 from source import data_processing
+from source.polynomial_fits import PolynomialFits
+from source.pyramid import Pyramid
+from source.run_analytics import RunAnalytics
 
 static_colors = ['tab:blue', 'tab:orange', 'tab:green', 'tab:red', 'tab:purple',
                  'tab:brown', 'tab:pink', 'tab:gray', 'tab:olive', 'tab:cyan']
@@ -22,7 +25,6 @@ static_colors = ['tab:blue', 'tab:orange', 'tab:green', 'tab:red', 'tab:purple',
 # TODO: - check all correlations
 # TODO: - show crashes in track overview (num crashes as legend) -> track overview in essential plots
 # TODO: - continuous integration
-# TODO: - put socket I/O in extra thread (add all those things in the message queue?)
 # TODO: - add rotation energy to power plots?
 # TODO: - add wheel rotation energy to power plots?
 # TODO: - analyze slip
@@ -44,7 +46,11 @@ def save_plot(title: str, title_post_fix: str, fig):
                 orientation='landscape', transparent=False, bbox_inches='tight',  pad_inches=0.1)
 
 
-def plot_main(plot_data: pd.PlotData, car_name: str, track_name: str, additional_plots=False):
+def plot_main(plot_data: pd.PlotData, car_name: str, track_name: str, additional_plots=False,
+              run_analytics: RunAnalytics = None):
+    """
+    :param run_analytics: histograms of the same samples that were updated during the race, computed here if None
+    """
 
     if plot_data.run_time.shape[0] > 0:
         title_post_fix = ' - {} on {}'.format(car_name, track_name)
@@ -81,7 +87,7 @@ def plot_main(plot_data: pd.PlotData, car_name: str, track_name: str, additional
         # see how much you use which gear. the most-used RPM interval should be around the optimal RPM
         fig, ax = plt.subplots(1, 1)
         fig.canvas.set_window_title('RPM Histogram per Gear' + title_post_fix)
-        gear_rpm_bars(ax, plot_data)
+        gear_rpm_bars(ax, plot_data, run_analytics)
         # save_plot('RPM Histogram per Gear', title_post_fix, fig)
 
         # overlaps on the y axis mean the driver shifts too early or too late and/or that the gears are too close.
@@ -122,7 +128,7 @@ def plot_main(plot_data: pd.PlotData, car_name: str, track_name: str, additional
         # key plot for tuning the suspension height, dampers and springs
         fig, ax = plt.subplots(1, 1)
         fig.canvas.set_window_title('Suspension' + title_post_fix)
-        suspension_bars(ax, plot_data)
+        suspension_bars(ax, plot_data, run_analytics)
         # suspension_l_r_f_r_bars(ax[1], plot_data)
         # save_plot('Suspension', title_post_fix, fig)
 
@@ -154,6 +160,60 @@ def plot_main(plot_data: pd.PlotData, car_name: str, track_name: str, additional
         plt.show()
 
 
+def plot_overview(pyramid: Pyramid, time_field: int, fields: list, title_post_fix: str, max_points=2000):
+    """
+    Min-max envelope and mean of some channels over time from the pyramid of a saved race.
+    When zooming, the channels are drawn again from the smallest sufficient level, all samples are never read.
+    :param time_field: field id of the time for the x axis
+    :param fields: list of (field id, label)
+    :param max_points: buckets to draw at least, about the width of the plot in pixels
+    """
+
+    if len(pyramid.levels) == 0:
+        print('The race is too short for an overview')
+        return
+
+    fig, ax = plt.subplots(len(fields), 1, sharex='all', squeeze=False)
+    ax = ax[:, 0]
+    fig.canvas.set_window_title('Overview' + title_post_fix)
+
+    # the finest level maps times to samples for the zoom
+    finest_level = min(pyramid.levels.keys())
+    finest_times = pyramid.levels[finest_level][2, time_field]
+    drawn = {'level': None, 'start': 0, 'end': 0, 'artists': []}
+
+    def draw(start, end):
+        for artist in drawn['artists']:
+            artist.remove()
+        drawn['artists'] = []
+        _, _, _, times = pyramid.get_envelope(time_field, max_points, start, end)
+        for field_ax, (field, label) in zip(ax, fields):
+            _, mins, maxs, means = pyramid.get_envelope(field, max_points, start, end)
+            color = static_colors[0]
+            drawn['artists'].append(field_ax.fill_between(times, mins, maxs, color=color, alpha=0.3, linewidth=0))
+            drawn['artists'] += field_ax.plot(times, means, color=color, linewidth=0.8)
+        drawn.update({'level': pyramid.get_level(end - start, max_points), 'start': start, 'end': end})
+
+    def on_xlim_changed(changed_ax):
+        time_min, time_max = changed_ax.get_xlim()
+        start = int(max(np.searchsorted(finest_times, time_min) - 1, 0)) * finest_level
+        end = int(np.searchsorted(finest_times, time_max) + 1) * finest_level
+        end = min(max(end, start + 1), pyramid.num_samples)
+        level = pyramid.get_level(end - start, max_points)
+        if level != drawn['level'] or start < drawn['start'] or end > drawn['end']:
+            draw(start, end)
+            fig.canvas.draw_idle()
+
+    draw(0, pyramid.num_samples)
+    for field_ax, (_, label) in zip(ax, fields):
+        field_ax.set_ylabel(label)
+        field_ax.grid(True)
+    ax[-1].set_xlabel('Time (s)')
+    ax[0].set_title('Overview, zoom in for more details')
+    ax[0].set_autoscalex_on(False)
+    ax[0].callbacks.connect('xlim_changed', on_xlim_changed)
+
+
 def plot_over_3d_pos(ax, plot_data: pd.PlotData, scale, color, slicing):
 
     x_min, x_middle, x_max = data_processing.get_min_middle_max(plot_data.pos_x)
@@ -207,7 +267,10 @@ def plot_over_2d_pos(ax, plot_data: pd.PlotData, lines_x, lines_y, scale, alpha,
 
 def scatter_plot(ax: plt.axes, x_points: List, y_points: List, title: str, labels: List[str],
                  colors: List, scales: List, alphas: List,
-                 x_label, y_label, plot_mean=True, plot_polynomial=True):
+                 x_label, y_label, plot_mean=True, plot_polynomial=True, polynomials: PolynomialFits = None):
+    """
+    :param polynomials: fits of the series for plot_polynomial, e.g. cached ones, fitted here if None
+    """
 
     for i in range(len(x_points)):
         ax.scatter(x=x_points[i], y=y_points[i], c=colors[i], s=scales[i], alpha=alphas[i], label=labels[i])
@@ -223,18 +286,14 @@ def scatter_plot(ax: plt.axes, x_points: List, y_points: List, title: str, label
         ax.scatter(x_series_mean, y_series_mean, c=colors, s=200.0, alpha=1.0, marker='X', edgecolors='k')
 
     if plot_polynomial:
+        if polynomials is None:
+            polynomials = PolynomialFits.fit(x_points, y_points, 3)
+        x_poly = polynomials.get_grid(500)
+        y_poly = polynomials.evaluate(x_poly)
+        valid_series = polynomials.get_valid()
         for i in range(len(x_points)):
-            if x_points[i].shape[0] > 0:
-                x_min = np.min(x_points[i])
-                x_max = np.max(x_points[i])
-                try:
-                    poly_coefficients = np.polyfit(x_points[i], y_points[i], 3)
-                    poly = np.poly1d(poly_coefficients)
-                    x_poly = np.linspace(x_min, x_max, 500)
-                    y_poly = poly(x_poly)
-                    ax.plot(x_poly, y_poly, '-', c=colors[i])
-                except np.linalg.LinAlgError as _:
-                    pass  # sometimes LinAlgError("SVD did not converge in Linear Least Squares"), maybe first gear
+            if valid_series[i]:  # invalid e.g. for empty series or if the fit is singular
+                ax.plot(x_poly[i], y_poly[i], '-', c=colors[i])
 
 
 def line_plot(ax, x_points, y_points, title, labels, alpha, x_label, y_label, colors=None,
@@ -320,18 +379,33 @@ def bar_plot(ax, data, weights, num_bins=20,
     data_max = max([d.max() for d in data])
     bin_edges = np.linspace(start=data_min, stop=data_max, num=num_bins+1)
 
+    bin_sums = []
+    for i in range(len(series_labels)):
+        data_bin_sum, _, _ = \
+            binned_statistic(data[i], weights[i], statistic='sum', bins=bin_edges)
+        bin_sums += [data_bin_sum]
+
+    binned_bar_plot(ax, bin_edges=bin_edges, bin_sums=bin_sums, title=title, x_label=x_label, y_label=y_label,
+                    series_labels=series_labels, highlight_value=highlight_value)
+
+
+def binned_bar_plot(ax, bin_edges, bin_sums, title=None, x_label=None, y_label=None, series_labels=None,
+                    highlight_value=None):
+    """
+    :param bin_edges: numpy array of shape (num_bins + 1,)
+    :param bin_sums: list of numpy arrays of shape (num_bins,), one per series, e.g. the accumulated time
+    """
+
+    num_bins = bin_edges.shape[0] - 1
     x = np.arange(num_bins)
     num_series = len(series_labels)
 
     default_width = 0.8
     width = default_width / (float(num_series) + 1)
+    tick_labels = ['{:.0f} to\n {:.0f}'.format(bin_edges[0 + i], bin_edges[1 + i])
+                   for i in range(bin_edges.shape[0] - 1)]
     for i in range(num_series):
-        data_bin_sum, _, _ = \
-            binned_statistic(data[i], weights[i], statistic='sum', bins=bin_edges)
-        tick_labels = ['{:.0f} to\n {:.0f}'.format(bin_edges[0 + i], bin_edges[1 + i])
-                       for i in range(bin_edges.shape[0] - 1)]
-
-        ax.bar(x + (0.5 + i - float(num_series) * 0.5) * width, data_bin_sum, width, label=series_labels[i])
+        ax.bar(x + (0.5 + i - float(num_series) * 0.5) * width, bin_sums[i], width, label=series_labels[i])
 
     ax.set_xlabel(x_label)
     ax.set_ylabel(y_label)
@@ -418,7 +492,12 @@ def plot_energy_over_2d_pos(ax, plot_data: pd.PlotData):
                      scale=scales, alpha=0.5, title='Gear at 2D positions, scaled by energy', labels=labels)
 
 
-def gear_rpm_bars(ax, plot_data: pd.PlotData):
+def gear_rpm_bars(ax, plot_data: pd.PlotData, run_analytics: RunAnalytics = None):
+
+    optimal_rpm, optimal_rpm_range_min, optimal_rpm_range_max = data_processing.get_optimal_rpm(plot_data=plot_data)
+    if run_analytics is not None:
+        gear_rpm_bars_from_analytics(ax, run_analytics, optimal_rpm)
+        return
 
     time_differences = data_processing.differences(plot_data.run_time, True)
     rpm = plot_data.rpm
@@ -437,12 +516,30 @@ def gear_rpm_bars(ax, plot_data: pd.PlotData):
     series_labels = ['Gear {0}: {1:.1f}%'.format(
         int(g), gear_ratio[gi] * 100.0) for gi, g in enumerate(range_gears)]
 
-    optimal_rpm, optimal_rpm_range_min, optimal_rpm_range_max = data_processing.get_optimal_rpm(plot_data=plot_data)
     bar_plot(ax, data=gear_rpms, weights=gear_times, num_bins=16,
              title='Gear RPM', x_label='RPM', y_label='Accumulated Time (s)', series_labels=series_labels,
              highlight_value=optimal_rpm)
 
 
+def gear_rpm_bars_from_analytics(ax, run_analytics: RunAnalytics, optimal_rpm):
+    # like gear_rpm_bars with the histograms that were updated during the race
+    range_gears = run_analytics.get_gears()
+    if len(range_gears) == 0:
+        return
+    histograms = [run_analytics.gear_rpm_histograms[g] for g in range_gears]
+    gear_ratios = run_analytics.get_summary_dict()['gear_ratios']
+    series_labels = ['Gear {0}: {1:.1f}%'.format(int(g), gear_ratios[g] * 100.0) for g in range_gears]
+
+    filled_histograms = [h for h in histograms if not h.is_empty()]
+    if len(filled_histograms) == 0:
+        return
+    bin_edges = np.linspace(start=min([h.min for h in filled_histograms]),
+                            stop=max([h.max for h in filled_histograms]), num=16+1)
+    binned_bar_plot(ax, bin_edges=bin_edges, bin_sums=[h.rebin(bin_edges) for h in histograms],
+                    title='Gear RPM', x_label='RPM', y_label='Accumulated Time (s)', series_labels=series_labels,
+                    highlight_value=optimal_rpm)
+
+
 def energy_over_time(ax, plot_data: pd.PlotData):
     race_time = plot_data.run_time
     energy, kinetic_energy, potential_energy = data_processing.get_energy(plot_data=plot_data)
@@ -609,7 +706,11 @@ def suspension_vel_der_diff_l_r_f_r_over_time(ax, plot_data: pd.PlotData):
               y_label='Suspension velocity derived - given (mm/s)', flip_y=True, min_max_annotations=True)
 
 
-def suspension_bars(ax, plot_data: pd.PlotData):
+def suspension_bars(ax, plot_data: pd.PlotData, run_analytics: RunAnalytics = None):
+
+    if run_analytics is not None:
+        suspension_bars_from_analytics(ax, run_analytics)
+        return
 
     race_time = plot_data.run_time
     time_differences = data_processing.differences(race_time, True)
@@ -631,6 +732,24 @@ def suspension_bars(ax, plot_data: pd.PlotData):
              x_label='Suspension compression (mm)', y_label='Accumulated Time (s)', series_labels=series_labels)
 
 
+def suspension_bars_from_analytics(ax, run_analytics: RunAnalytics):
+    # like suspension_bars with the histograms that were updated during the race
+    histograms = run_analytics.susp_histograms
+    filled_histograms = [h for h in histograms if not h.is_empty()]
+    if len(filled_histograms) == 0:
+        return
+    susp_min = min([h.min for h in filled_histograms])
+    susp_max = max([h.max for h in filled_histograms])
+    series_labels = [l + ', bump stops hit: {:.1f} s'.format(t)
+                     for l, t in zip(RunAnalytics.wheel_names, run_analytics.bump_stop_times)]
+
+    bin_edges = np.linspace(start=susp_min, stop=susp_max, num=20+1)
+    binned_bar_plot(ax, bin_edges=bin_edges, bin_sums=[h.rebin(bin_edges) for h in histograms],
+                    title='Suspension compression, min: {:.1f} mm, max: {:.1f} mm'.format(susp_min, susp_max),
+                    x_label='Suspension compression (mm)', y_label='Accumulated Time (s)',
+                    series_labels=series_labels)
+
+
 def suspension_l_r_f_r_bars(ax, plot_data: pd.PlotData):
 
     race_time = plot_data.run_time
@@ -665,27 +784,18 @@ def plot_height_over_dist(ax, plot_data: pd.PlotData):
 
 def plot_g_over_rpm(ax: matplotlib.axes, plot_data: pd.PlotData):
 
-    range_gears = np.unique(plot_data.gear)
-    range_gears = np.sort(range_gears)
-    range_gears = range_gears[range_gears > 0.0]
+    # the same samples per gear as for the optimal RPM
+    range_gears, gear_masks = data_processing.get_gear_acceleration_masks(plot_data=plot_data)
 
     labels = ['Gear {}'.format(str(g)) for g in range_gears]
     scale = 50.0
     alphas = [0.5] * len(labels)
     colors = [static_colors[i] for i, g in enumerate(range_gears)]
 
-    full_acceleration_mask = data_processing.get_full_acceleration_mask(plot_data=plot_data)
-
     x_points = []
     y_points = []
     scales = []
-    for g in range_gears:
-        current_gear = plot_data.gear == g
-        not_close_to_gear_changes = np.logical_not(
-            data_processing.get_gear_shift_mask(plot_data=plot_data, shift_time_ms=100.0))
-        full_in_current_gear = np.logical_and(not_close_to_gear_changes, current_gear)
-        interesting = np.logical_and(full_in_current_gear, full_acceleration_mask)
-
+    for interesting in gear_masks:
         g_force_lon = plot_data.g_force_lon[interesting]
         rpm = plot_data.rpm[interesting]
         throttle = plot_data.throttle[interesting]
@@ -697,41 +807,36 @@ def plot_g_over_rpm(ax: matplotlib.axes, plot_data: pd.PlotData):
 
     scatter_plot(ax, x_points=x_points, y_points=y_points, title='G-force over RPM (full throttle)',
                  labels=labels, colors=colors, scales=scales, alphas=alphas,
-                 x_label='RPM', y_label='G-force X')
+                 x_label='RPM', y_label='G-force X',
+                 polynomials=data_processing.get_rpm_polynomials(plot_data=plot_data, channel_name='g_force_lon'))
     plot_optimal_rpm_region(ax=ax, plot_data=plot_data)
 
 
 def plot_p_over_rpm(ax, plot_data: pd.PlotData):
 
-    range_gears = np.unique(plot_data.gear)
-    range_gears = np.sort(range_gears)
-    range_gears = range_gears[range_gears > 0.0]
+    # the same samples per gear as for the optimal RPM
+    range_gears, gear_masks = data_processing.get_gear_acceleration_masks(plot_data=plot_data)
 
     labels = ['Gear {}'.format(str(g)) for g in range_gears]
     scale = 50.0
     alphas = [0.5] * len(labels)
     colors = [static_colors[i] for i, g in enumerate(range_gears)]
-    full_acceleration_mask = data_processing.get_full_acceleration_mask(plot_data=plot_data)
 
     rpm = plot_data.rpm
-    energy, kinetic_energy, potential_energy = data_processing.get_energy(plot_data=plot_data)
-    times_steps = plot_data.run_time
-    power = data_processing.derive_no_nan(x=kinetic_energy, time_steps=times_steps) / 1000.0
+    power = data_processing.get_power(plot_data=plot_data)
 
     x_points = []
     y_points = []
     scales = []
-    for gear in range_gears:
-        current_gear = plot_data.gear == gear
-        interesting = np.logical_and(current_gear, full_acceleration_mask)
-
+    for interesting in gear_masks:
         x_points += [rpm[interesting]]
         y_points += [power[interesting]]
         scales += [np.ones_like(rpm[interesting]) * scale]
 
     scatter_plot(ax, x_points=x_points, y_points=y_points, title='Power over RPM (full throttle)',
                  labels=labels, colors=colors, scales=scales, alphas=alphas,
-                 x_label='RPM', y_label='Power (kW)', plot_mean=True, plot_polynomial=True)
+                 x_label='RPM', y_label='Power (kW)', plot_mean=True, plot_polynomial=True,
+                 polynomials=data_processing.get_rpm_polynomials(plot_data=plot_data, channel_name='power'))
     plot_optimal_rpm_region(ax=ax, plot_data=plot_data)
 
 
@@ -746,10 +851,7 @@ def plot_p_over_vel(ax, plot_data: pd.PlotData):
     alphas = [0.5] * len(labels)
     colors = [static_colors[i] for i, g in enumerate(range_gears)]
     full_acceleration_mask = data_processing.get_full_acceleration_mask(plot_data=plot_data)
-
-    energy, kinetic_energy, potential_energy = data_processing.get_energy(plot_data=plot_data)
-    times_steps = plot_data.run_time
-    power = data_processing.derive_no_nan(x=kinetic_energy, time_steps=times_steps) / 1000.0
+    power = data_processing.get_power(plot_data=plot_data)
 
     x_points = []
     y_points = []
@@ -796,11 +898,8 @@ def plot_g_over_throttle(ax, plot_data: pd.PlotData):
 
 def plot_v_over_rpm(ax, plot_data: pd.PlotData):
 
-    range_gears = np.unique(plot_data.gear)
-    range_gears = np.sort(range_gears)
-    range_gears = range_gears[range_gears > 0.0]
-    not_close_to_gear_changes = np.logical_not(
-        data_processing.get_gear_shift_mask(plot_data=plot_data, shift_time_ms=100.0))
+    # the same samples per gear and fits as for the optimal RPM
+    range_gears, gear_masks = data_processing.get_gear_acceleration_masks(plot_data=plot_data)
 
     labels = ['Gear {}'.format(str(g)) for g in range_gears]
     colors = [static_colors[i] for i, g in enumerate(range_gears)]
@@ -809,12 +908,7 @@ def plot_v_over_rpm(ax, plot_data: pd.PlotData):
 
     x_points = []
     y_points = []
-    for i, g in enumerate(range_gears):
-        current_gear = plot_data.gear == g
-        full_in_current_gear = np.logical_and(not_close_to_gear_changes, current_gear)
-        full_throttle = plot_data.throttle == 1.0
-        interesting = np.logical_and(full_in_current_gear, full_throttle)
-
+    for interesting in gear_masks:
         rpm = plot_data.rpm[interesting]
         speed_ms = plot_data.speed_ms[interesting]
 
@@ -823,7 +917,8 @@ def plot_v_over_rpm(ax, plot_data: pd.PlotData):
 
     scatter_plot(ax, x_points=x_points, y_points=y_points, title='Speed over RPM (full throttle)',
                  labels=labels, colors=colors, scales=scales, alphas=alphas,
-                 x_label='RPM', y_label='Speed (m/s)', plot_mean=True, plot_polynomial=True)
+                 x_label='RPM', y_label='Speed (m/s)', plot_mean=True, plot_polynomial=True,
+                 polynomials=data_processing.get_rpm_polynomials(plot_data=plot_data, channel_name='speed_ms'))
     plot_optimal_rpm_region(ax=ax, plot_data=plot_data)
 
 
@@ -942,14 +1037,10 @@ def slip_over_time(ax, plot_data: pd.PlotData):
 
 def ground_contact_over_time(ax, plot_data: pd.PlotData):
 
-    susp_vel = [plot_data.susp_vel_fl, plot_data.susp_vel_fr, plot_data.susp_vel_rl, plot_data.susp_vel_rr]
-    in_air_masks = [data_processing.get_in_air_mask(
-        susp_vel_arr=susp, time_steps=plot_data.run_time,
-        susp_vel_lim=100.0, susp_vel_var_max=100.0, filter_length=6)
-        for susp in susp_vel]
+    in_air_masks = data_processing.get_in_air_masks(plot_data=plot_data)
 
     # boolean mask to 0.0 or 1.0, also take sum
-    in_air_masks = [gc.astype(np.float) for gc in in_air_masks]
+    in_air_masks = [gc.astype(float) for gc in in_air_masks]
     in_air_masks_sum = np.sum(np.array(in_air_masks), axis=0)  # also show sum of wheels in air
     in_air_masks_sum[in_air_masks_sum < 4.0] = 0.0
     in_air_masks_sum[in_air_masks_sum == 4.0] = 1.0
@@ -0,0 +1,125 @@
+import numpy as np
+
+
+class PolynomialFits:
+    """
+    Least-squares polynomials of several point series, e.g. one per gear, fitted together.
+    The normal equations of all series are built from power sums and solved in one batched np.linalg.solve
+    instead of one np.polyfit per series.
+    x is normalized per series so that the systems are well-conditioned, evaluate and derive take raw x values.
+    Series that can't be fitted, e.g. with too few distinct points, are invalid and have NaN coefficients.
+    """
+
+    def __init__(self, coefficients: np.ndarray, centers: np.ndarray, scales: np.ndarray, x_ranges: np.ndarray):
+        """
+        :param coefficients: numpy array of shape (num_series, degree + 1), highest power first like np.polyfit,
+        for the normalized x
+        :param centers: x center per series
+        :param scales: x scale per series
+        :param x_ranges: numpy array of shape (num_series, 2) with min and max x per series
+        """
+
+        self.coefficients = coefficients
+        self.centers = centers
+        self.scales = scales
+        self.x_ranges = x_ranges
+
+    @staticmethod
+    def fit(x_points: list, y_points: list, degree: int = 3):
+        """
+        :param x_points: list of numpy arrays, one per series
+        :param y_points: list of numpy arrays, one per series
+        """
+
+        num_series = len(x_points)
+        num_coefficients = degree + 1
+        coefficients = np.full((num_series, num_coefficients), np.nan)
+        centers = np.zeros((num_series,))
+        scales = np.ones((num_series,))
+        x_ranges = np.full((num_series, 2), np.nan)
+
+        fitted_series = []
+        x_normalized = []
+        y_fitted = []
+        for i, (x, y) in enumerate(zip(x_points, y_points)):
+            x = np.asarray(x, dtype=np.float64)
+            y = np.asarray(y, dtype=np.float64)
+            finite = np.logical_and(np.isfinite(x), np.isfinite(y))
+            x = x[finite]
+            y = y[finite]
+            if np.unique(x).shape[0] < num_coefficients:
+                continue  # under-determined, e.g. a gear that was hardly used
+            centers[i] = np.mean(x)
+            scales[i] = np.std(x)
+            x_ranges[i] = np.min(x), np.max(x)
+            fitted_series.append(i)
+            x_normalized.append((x - centers[i]) / scales[i])
+            y_fitted.append(y)
+
+        if len(fitted_series) == 0:
+            return PolynomialFits(coefficients, centers, scales, x_ranges)
+
+        # power sums per series, the normal equations depend only on them
+        series_starts = np.cumsum([0] + [x.shape[0] for x in x_normalized[:-1]])
+        x_powers = np.concatenate(x_normalized)[:, np.newaxis] ** np.arange(2 * degree + 1)
+        x_power_sums = np.add.reduceat(x_powers, series_starts, axis=0)
+        xy_power_sums = np.add.reduceat(x_powers[:, :num_coefficients] * np.concatenate(y_fitted)[:, np.newaxis],
+                                        series_starts, axis=0)
+
+        powers = np.arange(degree, -1, -1)  # highest power first
+        gram = x_power_sums[:, powers[:, np.newaxis] + powers[np.newaxis, :]]
+        rhs = xy_power_sums[:, powers]
+        coefficients[fitted_series] = PolynomialFits.solve(gram, rhs)
+        return PolynomialFits(coefficients, centers, scales, x_ranges)
+
+    @staticmethod
+    def solve(gram: np.ndarray, rhs: np.ndarray):
+        try:
+            return np.linalg.solve(gram, rhs[..., np.newaxis])[..., 0]
+        except np.linalg.LinAlgError as _:
+            # a singular system fails the whole batch, solve the series one by one then
+            solutions = np.full(rhs.shape, np.nan)
+            for i in range(gram.shape[0]):
+                try:
+                    solutions[i] = np.linalg.solve(gram[i], rhs[i])
+                except np.linalg.LinAlgError as _:
+                    pass  # stays invalid
+            return solutions
+
+    def get_valid(self):
+        return np.all(np.isfinite(self.coefficients), axis=1)
+
+    def get_grid(self, num_points: int = 500):
+        """
+        :return: numpy array of shape (num_series, num_points) with equidistant x in the range of each series
+        """
+
+        return np.linspace(self.x_ranges[:, 0], self.x_ranges[:, 1], num_points, axis=1)
+
+    @staticmethod
+    def horner(coefficients: np.ndarray, x_normalized: np.ndarray):
+        y = np.zeros_like(x_normalized)
+        for c in coefficients.T:
+            y = y * x_normalized + c[:, np.newaxis]
+        return y
+
+    def normalize(self, x: np.ndarray):
+        return (x - self.centers[:, np.newaxis]) / self.scales[:, np.newaxis]
+
+    def evaluate(self, x: np.ndarray):
+        """
+        :param x: numpy array of shape (num_series, num_points), e.g. from get_grid
+        :return: y of the polynomials, NaN for invalid series
+        """
+
+        return PolynomialFits.horner(self.coefficients, self.normalize(x))
+
+    def derive(self, x: np.ndarray):
+        """
+        :param x: numpy array of shape (num_series, num_points), e.g. from get_grid
+        :return: dy/dx of the polynomials, NaN for invalid series
+        """
+
+        degree = self.coefficients.shape[1] - 1
+        derived_coefficients = self.coefficients[:, :-1] * np.arange(degree, 0, -1)
+        return PolynomialFits.horner(derived_coefficients, self.normalize(x)) / self.scales[:, np.newaxis]
@@ -0,0 +1,141 @@
+import numpy as np
+
+
+# entries in session files, levels are named by their samples per bucket, e.g. pyramid_00016
+entry_prefix = 'pyramid_'
+info_entry = entry_prefix + 'info'  # number of samples
+ends_entry = entry_prefix + 'ends'  # first and last sample
+
+
+class Pyramid:
+    """
+    Min, max and mean per channel at several decimation levels, built when a session is saved.
+    Overviews of long races and the session library use the smallest sufficient level instead of all samples.
+    Each level has the shape (3, num_fields, num_buckets) with min, max and mean per bucket.
+    The last bucket of each level may be partial.
+    """
+
+    factor = 16  # samples per bucket grow by this factor per level, the first level has 6 % of the samples' size
+    min_buckets = 16  # coarser levels are not worth storing
+
+    def __init__(self, num_samples: int, ends: np.ndarray, levels: dict):
+        """
+        :param num_samples: number of samples in the session
+        :param ends: first and last sample, shape (2, num_fields)
+        :param levels: samples per bucket -> numpy array of shape (3, num_fields, num_buckets)
+        """
+
+        self.num_samples = num_samples
+        self.ends = ends
+        self.levels = levels
+
+    @staticmethod
+    def build(data: np.ndarray):
+        """
+        :param data: numpy array of shape (num_fields, num_samples)
+        """
+
+        num_samples = data.shape[1]
+        if num_samples == 0:
+            raise ValueError('No samples')
+
+        # reduce in float64 so that the means are exact, store in the type of the samples
+        mins = maxs = means = np.asarray(data, dtype=np.float64)
+        counts = np.ones((num_samples,))
+        levels = {}
+        samples_per_bucket = 1
+        while True:
+            num_buckets = -(-mins.shape[1] // Pyramid.factor)
+            if num_buckets < Pyramid.min_buckets:
+                break
+            padding = num_buckets * Pyramid.factor - mins.shape[1]
+
+            def reduce(values, pad_value, reduce_function):
+                values = np.pad(values, ((0, 0), (0, padding)), constant_values=pad_value)
+                return reduce_function(values.reshape(values.shape[0], num_buckets, Pyramid.factor), axis=2)
+
+            sums = reduce(means * counts, 0.0, np.sum)
+            counts = np.pad(counts, (0, padding)).reshape(num_buckets, Pyramid.factor).sum(axis=1)
+            mins = reduce(mins, np.inf, np.min)
+            maxs = reduce(maxs, -np.inf, np.max)
+            means = sums / counts
+            samples_per_bucket *= Pyramid.factor
+            levels[samples_per_bucket] = np.stack((mins, maxs, means)).astype(data.dtype)
+
+        ends = np.stack((data[:, 0], data[:, -1]))
+        return Pyramid(num_samples, ends, levels)
+
+    def to_entries(self):
+        entries = {info_entry: np.array([self.num_samples], dtype=np.int64), ends_entry: self.ends}
+        for samples_per_bucket, level in self.levels.items():
+            entries['{}{:05d}'.format(entry_prefix, samples_per_bucket)] = level
+        return entries
+
+    @staticmethod
+    def from_entries(entries):
+        """
+        :param entries: mapping like an npz file, needs only the pyramid entries
+        :return: Pyramid or None if there are no pyramid entries, e.g. in older saves
+        """
+
+        if info_entry not in entries:
+            return None
+        levels = {}
+        for key in entries.keys():
+            if key.startswith(entry_prefix) and key not in [info_entry, ends_entry]:
+                levels[int(key[len(entry_prefix):])] = entries[key]
+        return Pyramid(int(entries[info_entry][0]), entries[ends_entry], levels)
+
+    def get_level(self, num_samples: int, max_points: int):
+        """
+        :param num_samples: samples in the shown range
+        :param max_points: points that are needed at least, e.g. the width of the plot in pixels
+        :return: samples per bucket of the coarsest level with at least max_points buckets in the range,
+        the finest level if none has enough, None if there are no levels
+        """
+
+        if len(self.levels) == 0:
+            return None
+        sufficient = [spb for spb in self.levels.keys() if num_samples / spb >= max_points]
+        return max(sufficient) if len(sufficient) > 0 else min(self.levels.keys())
+
+    def get_bucket_sizes(self, samples_per_bucket: int):
+        num_buckets = self.levels[samples_per_bucket].shape[2]
+        bucket_sizes = np.full((num_buckets,), samples_per_bucket)
+        bucket_sizes[-1] = self.num_samples - (num_buckets - 1) * samples_per_bucket
+        return bucket_sizes
+
+    def get_envelope(self, field: int, max_points: int, start: int = 0, end: int = None):
+        """
+        :param field: channel id
+        :param max_points: see get_level
+        :param start: first sample of the range
+        :param end: end sample of the range, the number of samples if None
+        :return: bucket ranges as numpy array of shape (num_buckets, 2) and min, max, mean per bucket
+        """
+
+        end = self.num_samples if end is None else min(end, self.num_samples)
+        start = max(start, 0)
+        samples_per_bucket = self.get_level(end - start, max_points)
+        if samples_per_bucket is None or end <= start:
+            raise ValueError('No pyramid level for the range {}..{}'.format(start, end))
+
+        first_bucket = start // samples_per_bucket
+        end_bucket = -(-end // samples_per_bucket)
+        level = self.levels[samples_per_bucket][:, field, first_bucket:end_bucket]
+        bucket_starts = np.arange(first_bucket, end_bucket) * samples_per_bucket
+        bucket_ranges = np.stack((bucket_starts, np.minimum(bucket_starts + samples_per_bucket, self.num_samples)),
+                                 axis=1)
+        return bucket_ranges, level[0], level[1], level[2]
+
+    def get_max(self, field: int):
+        if len(self.levels) == 0:
+            return float(max(self.ends[0, field], self.ends[1, field]))
+        return float(np.max(self.levels[max(self.levels.keys())][1, field]))
+
+    def get_mean(self, field: int):
+        if len(self.levels) == 0:
+            return float(np.mean(self.ends[:, field]))  # not exact, sessions without levels are only seconds long
+        samples_per_bucket = max(self.levels.keys())
+        bucket_means = self.levels[samples_per_bucket][2, field].astype(np.float64)
+        return float(np.sum(bucket_means * self.get_bucket_sizes(samples_per_bucket)) / self.num_samples)
@@ -0,0 +1,77 @@
+import os
+import socket
+import time
+
+import numpy as np
+
+from source import journal
+from source.game_base import GameBase
+
+
+def load_replay(file_path: str, game: GameBase, append_finish=True):
+    """
+    Get the datagrams and their relative send times from a saved run or a raw journal.
+    :param file_path: saved run (.npz) or raw journal (.dr2j)
+    :param game: game that decodes and encodes the data
+    :param append_finish: saved runs contain only race samples,
+    append a sample that tells the logger that the race is finished
+    :return: numpy array of send times in seconds, starting at 0, and list of datagrams
+    """
+
+    if os.path.splitext(file_path)[1] == journal.journal_file_extension:
+        game_name, receive_times, datagrams = journal.read_journal(file_path)
+        send_times = np.array(receive_times)
+    else:
+        samples = game.load_data(file_path)
+        fields = game.get_fields_enum()
+        send_times = samples[fields.run_time.value].astype(np.float64)
+        if append_finish and samples.shape[1] > 0:
+            finish_sample = samples[:, -1].copy()
+            finish_sample[fields.lap_time.value] = 0.0
+            samples = np.concatenate((samples, np.expand_dims(finish_sample, 1)), axis=1)
+            send_times = np.append(send_times, send_times[-1])
+        datagrams = game.encode_samples(samples)
+
+    if send_times.shape[0] > 0:
+        send_times = send_times - send_times[0]
+        send_times = np.maximum.accumulate(send_times)  # new laps or restarts must not go back in time
+    return send_times, datagrams
+
+
+def replay(send_times: np.ndarray, datagrams: list, ip: str, port: int, speed=1.0):
+    """
+    Send datagrams to a UDP port with their original timing.
+    :param send_times: relative send time per datagram in seconds
+    :param datagrams: list of datagram bytes
+    :param ip: target IP
+    :param port: target port
+    :param speed: 1.0 for real time, 2.0 for twice as fast, 0.0 to send as fast as possible
+    :return: number of sent datagrams, duration in seconds
+    """
+
+    udp_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    start_time = time.perf_counter()
+    try:
+        for send_time, datagram in zip(send_times, datagrams):
+            if speed > 0.0:
+                delay = start_time + send_time / speed - time.perf_counter()
+                if delay > 0.0:
+                    time.sleep(delay)
+            udp_socket.sendto(datagram, (ip, port))
+    finally:
+        udp_socket.close()
+    return len(datagrams), time.perf_counter() - start_time
+
+
+def replay_file(file_path: str, game: GameBase, ip: str, port: int, speed=1.0):
+    try:
+        send_times, datagrams = load_replay(file_path, game)
+    except (OSError, ValueError) as er:
+        print('Error while loading replay: {}\n{}'.format(file_path, er))
+        return
+
+    print('Replaying {} datagrams from {} to {}:{} at {}'.format(
+        len(datagrams), file_path, ip, port, 'max speed' if speed <= 0.0 else '{}x speed'.format(speed)))
+    num_sent, duration = replay(send_times, datagrams, ip, port, speed)
+    print('Sent {} datagrams in {:.2f} s ({:.0f} datagrams/s)'.format(
+        num_sent, duration, num_sent / duration if duration > 0.0 else 0.0))
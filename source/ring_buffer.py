@@ -0,0 +1,82 @@
+import threading
+
+import numpy as np
+
+
+class RingBuffer:
+    """
+    Preallocated buffer for samples with a single producer (receive thread) and a single consumer (main thread).
+    The producer only advances write_count and the consumer only advances read_count,
+    so the sample data needs no lock.
+    If the consumer falls behind by more than the capacity, new samples are dropped and counted.
+    """
+
+    def __init__(self, num_fields: int, capacity: int, dtype=np.float64):
+        self.num_fields = num_fields
+        self.capacity = capacity
+        self.buffer = np.zeros((num_fields, capacity), dtype=dtype)
+        self.receive_times = np.zeros((capacity,))
+        self.write_count = 0
+        self.read_count = 0
+        self.num_dropped = 0
+        self.data_event = threading.Event()
+
+    def get_num_available(self):
+        return self.write_count - self.read_count
+
+    def push(self, sample: np.ndarray, receive_time=0.0):
+        if self.write_count - self.read_count >= self.capacity:
+            self.num_dropped += 1
+            return False
+
+        self.buffer[:, self.write_count % self.capacity] = sample
+        self.receive_times[self.write_count % self.capacity] = receive_time
+        self.write_count += 1
+        self.data_event.set()
+        return True
+
+    def push_block(self, samples: np.ndarray, receive_times=0.0):
+        """
+        Push a batch of samples with one copy.
+        :param samples: numpy array of shape (num_fields, num_samples)
+        :param receive_times: receive time per sample in seconds, or one time for the whole batch
+        :return: number of samples that were pushed, the rest was dropped
+        """
+
+        num_free = self.capacity - (self.write_count - self.read_count)
+        num_samples = min(samples.shape[1], num_free)
+        self.num_dropped += samples.shape[1] - num_samples
+        if num_samples == 0:
+            return 0
+
+        ids = np.arange(self.write_count, self.write_count + num_samples) % self.capacity
+        self.buffer[:, ids] = samples[:, :num_samples]
+        self.receive_times[ids] = np.broadcast_to(receive_times, (samples.shape[1],))[:num_samples]
+        self.write_count += num_samples
+        self.data_event.set()
+        return num_samples
+
+    def pop_all(self, timeout=None):
+        """
+        Get all samples that arrived since the last call.
+        :param timeout: wait up to this many seconds for new samples, don't wait if None
+        :return: numpy array of shape (num_fields, num_samples), numpy array of receive times
+        """
+
+        if timeout is not None and self.get_num_available() == 0:
+            self.data_event.wait(timeout)
+        self.data_event.clear()
+
+        start = self.read_count
+        end = self.write_count
+        if start == end:
+            return np.zeros((self.num_fields, 0), dtype=self.buffer.dtype), np.zeros((0,))
+
+        ids = np.arange(start, end) % self.capacity
+        samples = self.buffer[:, ids]  # fancy indexing copies, the producer may overwrite the slots afterwards
+        receive_times = self.receive_times[ids]
+        self.read_count = end
+        return samples, receive_times
+
+    def clear(self):
+        self.read_count = self.write_count
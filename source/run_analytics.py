@@ -0,0 +1,260 @@
+import numpy as np
+
+from source import data_processing
+
+
+class RunningHistogram:
+    """
+    Sums of weights in fixed-width bins, the bins grow with the range of the values up to value_range.
+    Adding values costs the same per sample regardless of how many were added before.
+    Values outside of value_range, e.g. from broken packets, are only counted as outliers so that they can't
+    allocate a huge number of bins. Non-finite values and weights are ignored.
+    """
+
+    def __init__(self, bin_width: float, value_range: tuple):
+        """
+        :param bin_width: width of the fine bins
+        :param value_range: min and max of the values that are binned
+        """
+
+        self.bin_width = bin_width
+        self.value_range = value_range
+        self.first_bin = 0
+        self.sums = np.zeros((0,))
+        self.min = np.inf
+        self.max = -np.inf
+        self.num_outliers = 0
+        self.outlier_weight = 0.0
+
+    def add(self, values: np.ndarray, weights: np.ndarray):
+        valid = np.logical_and(np.isfinite(values), np.isfinite(weights))
+        values = values[valid]
+        weights = weights[valid]
+        in_range = np.logical_and(values >= self.value_range[0], values <= self.value_range[1])
+        if not np.all(in_range):
+            outliers = np.logical_not(in_range)
+            self.num_outliers += int(np.count_nonzero(outliers))
+            self.outlier_weight += float(weights[outliers].sum())
+            values = values[in_range]
+            weights = weights[in_range]
+        if values.shape[0] == 0:
+            return
+        bins = np.floor(values / self.bin_width).astype(np.int64)
+        first_bin = int(bins.min())
+        end_bin = int(bins.max()) + 1
+        if self.sums.shape[0] == 0:
+            self.first_bin = first_bin
+            self.sums = np.zeros((end_bin - first_bin,))
+        else:
+            pad_before = max(0, self.first_bin - first_bin)
+            pad_after = max(0, end_bin - (self.first_bin + self.sums.shape[0]))
+            if pad_before > 0 or pad_after > 0:
+                self.sums = np.pad(self.sums, (pad_before, pad_after))
+                self.first_bin -= pad_before
+        np.add.at(self.sums, bins - self.first_bin, weights)
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+
+    def is_empty(self):
+        return self.sums.shape[0] == 0
+
+    def get_total(self):
+        return float(self.sums.sum())
+
+    def get_weighted_mean(self):
+        total = self.get_total()
+        if total == 0.0:
+            return 0.0
+        bin_centers = (np.arange(self.sums.shape[0]) + self.first_bin + 0.5) * self.bin_width
+        return float(np.sum(bin_centers * self.sums) / total)
+
+    def rebin(self, bin_edges: np.ndarray):
+        """
+        :param bin_edges: edges of coarser bins from min to max, e.g. of a bar plot
+        :return: sums per coarse bin, fine bins on a coarse edge are split assuming uniform values in them
+        """
+
+        fine_bin_edges = (np.arange(self.sums.shape[0] + 1) + self.first_bin) * self.bin_width
+        cumulative_sums = np.interp(bin_edges, fine_bin_edges, np.concatenate(([0.0], np.cumsum(self.sums))))
+        # all values are between min and max
+        cumulative_sums[0] = 0.0
+        cumulative_sums[-1] = self.get_total()
+        return np.diff(cumulative_sums)
+
+
+class RunAnalytics:
+    """
+    Statistics of the current race that are updated with each batch of accepted samples, so they are ready
+    as soon as the race ends, regardless of its length: RPM histograms per gear, gear usage,
+    suspension histograms, bump stop time and in-air time per wheel.
+    The values are the same as in the plots of the whole session, the histograms have fine fixed-width bins
+    that are combined for the plots.
+    """
+
+    rpm_bin_width = 1.0  # RPM
+    susp_bin_width = 0.1  # mm
+    # beyond any car, limits the number of bins for broken values
+    rpm_range = (0.0, 30000.0)  # RPM
+    susp_range = (-1000.0, 1000.0)  # mm
+    wheel_names = ['Front left', 'Front right', 'Rear left', 'Rear right']
+
+    def __init__(self, game):
+        self.game = game
+        fields = game.get_fields_enum()
+        self.run_time_field = fields.run_time.value
+        self.gear_field = fields.gear.value
+        self.rpm_field = fields.rpm.value
+        self.susp_fields = [f.value for f in [fields.susp_fl, fields.susp_fr, fields.susp_rl, fields.susp_rr]]
+        self.susp_vel_fields = [f.value for f in [fields.susp_vel_fl, fields.susp_vel_fr,
+                                                  fields.susp_vel_rl, fields.susp_vel_rr]]
+        # only these fields are converted for each batch
+        self.used_fields = [self.run_time_field, self.gear_field, self.rpm_field] + \
+            self.susp_fields + self.susp_vel_fields
+
+        self.num_samples = 0
+        self.start_run_time = None
+        self.last_run_time = None
+        self.total_time = 0.0
+        self.gear_rpm_histograms = {}  # gear -> RunningHistogram of the time per RPM
+        self.susp_histograms = [RunningHistogram(RunAnalytics.susp_bin_width, RunAnalytics.susp_range)
+                                for _ in self.susp_fields]
+        self.susp_max = -np.inf
+        self.bump_stop_times = np.zeros((len(self.susp_fields),))  # time at susp_max per wheel
+
+        # in-air masks depend on neighboring samples, keep the last ones until their masks are final
+        self.in_air_times = np.zeros((len(self.susp_vel_fields),))
+        self.air_run_times = np.zeros((0,))
+        self.air_susp_vels = np.zeros((len(self.susp_vel_fields), 0))
+        self.air_num_final = 0  # samples at the start of the kept ones that are already counted
+
+    def reset(self):
+        self.__init__(self.game)
+
+    def add_samples(self, samples: np.ndarray):
+        """
+        :param samples: accepted samples of shape (num_fields, num_samples), appended to the session
+        """
+
+        num_samples = samples.shape[1]
+        if num_samples == 0:
+            return
+        if self.start_run_time is None:
+            raw_run_time = samples[self.run_time_field]
+            finite_raw_run_times = raw_run_time[np.isfinite(raw_run_time)]
+            if finite_raw_run_times.shape[0] > 0:
+                self.start_run_time = float(finite_raw_run_times[0])
+        converted = self.game.convert_to_plot_units(samples, self.start_run_time or 0.0, self.used_fields)
+        num_susp = len(self.susp_fields)
+        run_time, gear, rpm = converted[:3]
+        susp = converted[3:3 + num_susp]
+        susp_vels = converted[3 + num_susp:]
+
+        # like data_processing.differences(run_time, True) over the whole session, broken times don't count
+        finite_run_times = run_time[np.isfinite(run_time)]
+        last_run_time = self.last_run_time
+        if last_run_time is None:
+            last_run_time = finite_run_times[0] if finite_run_times.shape[0] > 0 else np.nan
+        time_differences = np.diff(run_time, prepend=last_run_time)
+        time_differences[time_differences < 0.0] = np.finfo(time_differences.dtype).eps
+        time_differences[~np.isfinite(time_differences)] = 0.0
+        if finite_run_times.shape[0] > 0:
+            self.last_run_time = float(finite_run_times[-1])
+        self.total_time += float(time_differences.sum())
+        self.num_samples += num_samples
+
+        for g in np.unique(gear[np.isfinite(gear)]):
+            g = float(g)
+            if g not in self.gear_rpm_histograms:
+                self.gear_rpm_histograms[g] = RunningHistogram(RunAnalytics.rpm_bin_width, RunAnalytics.rpm_range)
+            current_gear = gear == g
+            self.gear_rpm_histograms[g].add(rpm[current_gear], time_differences[current_gear])
+
+        for histogram, susp_wheel in zip(self.susp_histograms, susp):
+            histogram.add(susp_wheel, time_differences)
+
+        # bump stops are hit at the maximum compression of all wheels, restart counting for a new maximum
+        valid_susp = susp[np.logical_and(susp >= RunAnalytics.susp_range[0], susp <= RunAnalytics.susp_range[1])]
+        batch_susp_max = float(valid_susp.max()) if valid_susp.shape[0] > 0 else -np.inf
+        if batch_susp_max > self.susp_max:
+            self.susp_max = batch_susp_max
+            self.bump_stop_times[:] = 0.0
+        self.bump_stop_times += np.sum(np.where(susp == self.susp_max, time_differences, 0.0), axis=1)
+
+        self.add_in_air_samples(run_time, susp_vels)
+
+    def get_air_masks(self):
+        # np.convolve returns the filter's length for fewer samples, e.g. right after the start
+        return np.array([data_processing.get_wheel_in_air_mask(susp_vel, self.air_run_times)
+                         for susp_vel in self.air_susp_vels])[:, :self.air_run_times.shape[0]]
+
+    def get_air_time_differences(self):
+        # the first kept sample is only counted at the start of the race, where its difference is 0
+        time_differences = data_processing.differences(self.air_run_times, True)
+        time_differences[~np.isfinite(time_differences)] = 0.0
+        return time_differences
+
+    def add_in_air_samples(self, run_time: np.ndarray, susp_vels: np.ndarray):
+        context = data_processing.in_air_context
+        self.air_run_times = np.concatenate((self.air_run_times, run_time))
+        self.air_susp_vels = np.concatenate((self.air_susp_vels, susp_vels), axis=1)
+
+        # masks are final if they don't depend on missing samples before the kept ones or after the last one
+        num_kept = self.air_run_times.shape[0]
+        end_final = num_kept - context
+        if end_final > self.air_num_final:
+            air_masks = self.get_air_masks()[:, self.air_num_final:end_final]
+            time_differences = self.get_air_time_differences()[self.air_num_final:end_final]
+            self.in_air_times += np.sum(air_masks * time_differences, axis=1)
+            self.air_num_final = end_final
+
+        # keep enough samples before the first pending one
+        num_dropped = max(0, num_kept - 2 * context)
+        if num_dropped > 0:
+            self.air_run_times = self.air_run_times[num_dropped:]
+            self.air_susp_vels = self.air_susp_vels[:, num_dropped:]
+            self.air_num_final -= num_dropped
+
+    def get_in_air_times(self):
+        """
+        :return: in-air time per wheel in seconds, the last samples are evaluated as if the race ended now
+        """
+
+        if self.air_run_times.shape[0] == 0 or self.air_num_final >= self.air_run_times.shape[0]:
+            return self.in_air_times.copy()
+        air_masks = self.get_air_masks()[:, self.air_num_final:]
+        time_differences = self.get_air_time_differences()[self.air_num_final:]
+        return self.in_air_times + np.sum(air_masks * time_differences, axis=1)
+
+    def get_gears(self):
+        return sorted(self.gear_rpm_histograms.keys())
+
+    def get_gear_times(self):
+        return {g: self.gear_rpm_histograms[g].get_total() for g in self.get_gears()}
+
+    def get_summary_dict(self):
+        gear_times = self.get_gear_times()
+        return {
+            'samples': self.num_samples,
+            'duration': self.total_time,
+            'gear_ratios': {g: t / self.total_time if self.total_time > 0.0 else 0.0 for g, t in gear_times.items()},
+            'gear_mean_rpm': {g: self.gear_rpm_histograms[g].get_weighted_mean() for g in self.get_gears()},
+            'susp_max': self.susp_max,
+            'bump_stop_times': self.bump_stop_times.tolist(),
+            'in_air_times': self.get_in_air_times().tolist(),
+        }
+
+    def get_summary_str(self):
+        if self.num_samples == 0:
+            return 'No race data'
+        summary = self.get_summary_dict()
+        gears_str = ', '.join(['{}: {:.1f}% at {:.0f} RPM'.format(int(g), ratio * 100.0, summary['gear_mean_rpm'][g])
+                               for g, ratio in summary['gear_ratios'].items()])
+        bump_stops_str = ', '.join(['{} {:.1f} s'.format(name.lower(), t)
+                                    for name, t in zip(RunAnalytics.wheel_names, summary['bump_stop_times'])])
+        in_air_str = ', '.join(['{} {:.1f} s'.format(name.lower(), t)
+                                for name, t in zip(RunAnalytics.wheel_names, summary['in_air_times'])])
+        return 'Race analytics: {} samples, {:.1f} s\n' \
+               'Gear usage: {}\n' \
+               'Bump stops hit (max. compression {:.1f} mm): {}\n' \
+               'In air: {}'.format(summary['samples'], summary['duration'], gears_str,
+                                   summary['susp_max'], bump_stops_str, in_air_str)
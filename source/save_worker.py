@@ -0,0 +1,53 @@
+import queue
+import threading
+import traceback
+
+
+class SaveWorker(threading.Thread):
+    """
+    Runs save jobs one after another in a background thread, so compressing and writing races never blocks ingest.
+    Jobs are functions that return a message for the console or None. Their messages and errors are collected
+    until the main thread pops them. The job queue is bounded, a full queue blocks the caller instead of losing saves.
+    """
+
+    queue_size = 16  # jobs, a race has at most a few jobs in the queue
+
+    def __init__(self):
+        super().__init__(daemon=True)
+        self.jobs = queue.Queue(maxsize=SaveWorker.queue_size)
+        self.messages = queue.Queue()
+
+    def submit(self, job, *args):
+        if self.jobs.full():
+            self.messages.put('Save queue is full, waiting for the running saves...')
+        self.jobs.put((job, args))
+
+    def run(self):
+        while True:
+            job, args = self.jobs.get()
+            try:
+                if job is None:
+                    return  # stop
+                message = job(*args)
+                if message is not None:
+                    self.messages.put(message)
+            except Exception as er:
+                self.messages.put('Error while saving: {}\n{}'.format(er, traceback.format_exc()))
+            finally:
+                self.jobs.task_done()
+
+    def pop_messages(self):
+        messages = []
+        while not self.messages.empty():
+            messages.append(self.messages.get())
+        return messages
+
+    def flush(self):
+        # wait until all queued jobs are done
+        if self.is_alive():
+            self.jobs.join()
+
+    def stop(self):
+        if self.is_alive():
+            self.jobs.put((None, ()))
+            self.join()
@@ -0,0 +1,54 @@
+import numpy as np
+
+
+class SessionBuffer:
+    """
+    Growable (num_fields, num_samples) array with amortized O(1) appends.
+    The capacity doubles when full. get_data returns a view of the used part where each channel row is contiguous.
+    Written samples are never modified, so views stay valid after further appends and after clear.
+    """
+
+    initial_capacity = 4096  # samples, about 40 seconds at 100 Hz
+
+    def __init__(self, num_fields: int, data: np.ndarray = None, dtype=np.float64):
+        self.num_fields = num_fields
+        if data is None:
+            self.buffer = np.zeros((num_fields, SessionBuffer.initial_capacity), dtype=dtype)
+            self.num_samples = 0
+        else:
+            # wrap existing data, e.g. a loaded run, without copying
+            self.buffer = np.asarray(data, dtype=dtype)
+            self.num_samples = data.shape[1]
+
+    def get_num_samples(self):
+        return self.num_samples
+
+    def get_data(self):
+        return self.buffer[:, :self.num_samples]
+
+    def reserve(self, capacity: int):
+        if capacity <= self.buffer.shape[1]:
+            return
+
+        new_capacity = max(capacity, self.buffer.shape[1] * 2, SessionBuffer.initial_capacity)
+        new_buffer = np.zeros((self.num_fields, new_capacity), dtype=self.buffer.dtype)
+        new_buffer[:, :self.num_samples] = self.buffer[:, :self.num_samples]
+        self.buffer = new_buffer
+
+    def append(self, samples: np.ndarray):
+        """
+        Append one sample or a batch of samples.
+        :param samples: numpy array of shape (num_fields,) or (num_fields, num_new_samples)
+        """
+
+        if samples.ndim == 1:
+            samples = np.expand_dims(samples, 1)
+        num_new_samples = samples.shape[1]
+        self.reserve(self.num_samples + num_new_samples)
+        self.buffer[:, self.num_samples:self.num_samples + num_new_samples] = samples
+        self.num_samples += num_new_samples
+
+    def clear(self):
+        # new storage instead of overwriting, views of the old data may still be in use
+        self.buffer = np.zeros((self.num_fields, SessionBuffer.initial_capacity), dtype=self.buffer.dtype)
+        self.num_samples = 0
@@ -0,0 +1,160 @@
+import os
+import struct
+import zipfile
+import zlib
+
+import numpy as np
+
+from source import utils
+
+
+chunk_key_prefix = 'chunk_'
+
+# zip local file header: signature, versions, flags, compression, time, date, crc, sizes, name and extra length
+local_header = struct.Struct('<4sHHHHHIIIHH')
+local_header_signature = b'PK\x03\x04'
+zip64_extra_id = 0x0001
+
+
+class ChunkedSessionFile:
+    """
+    npz file that grows by appending compressed chunks of samples while the race is running,
+    so that finishing a race only writes the last chunk and renames the file.
+    The file is opened and closed for each chunk, so it is a valid npz between appends.
+    """
+
+    max_chunk_size = 4096  # samples, larger appends are split so that readers can stream the file in chunks
+
+    def __init__(self, file_path: str, values: dict):
+        """
+        :param file_path: path of the new file
+        :param values: additional entries, e.g. game name and save version
+        """
+
+        self.file_path = file_path
+        self.values = values
+        self.num_chunks = 0
+        self.num_samples = 0
+        self.error = None  # the first write error, the file is incomplete then
+
+    def create(self):
+        # an existing file is overwritten
+        utils.make_dir_for_file(self.file_path)
+        with zipfile.ZipFile(self.file_path, mode='w', compression=zipfile.ZIP_DEFLATED):
+            pass
+        self.add_values(self.values)
+
+    def write_entry(self, key: str, value):
+        with zipfile.ZipFile(self.file_path, mode='a', compression=zipfile.ZIP_DEFLATED) as zip_file:
+            with zip_file.open(key + '.npy', mode='w', force_zip64=True) as f:
+                np.lib.format.write_array(f, np.asanyarray(value), allow_pickle=False)
+
+    def add_values(self, values: dict):
+        for key, value in values.items():
+            self.write_entry(key, value)
+
+    def append(self, samples: np.ndarray):
+        """
+        :param samples: numpy array of shape (num_fields, num_samples)
+        """
+
+        for start in range(0, samples.shape[1], ChunkedSessionFile.max_chunk_size):
+            chunk = samples[:, start:start + ChunkedSessionFile.max_chunk_size]
+            self.write_entry('{}{:05d}'.format(chunk_key_prefix, self.num_chunks), chunk)
+            self.num_chunks += 1
+            self.num_samples += chunk.shape[1]
+
+    def move(self, new_file_path: str):
+        utils.make_dir_for_file(new_file_path)
+        os.replace(self.file_path, new_file_path)
+        self.file_path = new_file_path
+
+    def delete(self):
+        if os.path.isfile(self.file_path):
+            os.remove(self.file_path)
+
+
+def get_chunk_keys(keys: list):
+    """
+    :param keys: entries of an npz file
+    :return: keys of the chunks in the order they were appended, by their number and not as text
+    """
+
+    chunk_keys = [key for key in keys if key.startswith(chunk_key_prefix)]
+    return sorted(chunk_keys, key=lambda key: int(key[len(chunk_key_prefix):]))
+
+
+def load_chunks(npz_file, num_fields: int, dtype=np.float64):
+    """
+    Concatenate the chunks of a ChunkedSessionFile.
+    :param npz_file: loaded npz file
+    :param num_fields: number of fields per sample, for sessions without chunks
+    :param dtype: type of the returned samples
+    :return: numpy array of shape (num_fields, num_samples)
+    """
+
+    chunk_keys = get_chunk_keys(npz_file.files)
+    if len(chunk_keys) == 0:
+        return np.zeros((num_fields, 0), dtype=dtype)
+    return np.concatenate([npz_file[key] for key in chunk_keys], axis=1).astype(dtype, copy=False)
+
+
+def read_complete_entries(file_path: str):
+    """
+    Read the entries of a zip file from their local headers instead of the central directory at the end.
+    Stops at the first incomplete or damaged entry.
+    :return: list of (name, uncompressed bytes)
+    """
+
+    entries = []
+    with open(file_path, 'rb') as f:
+        while True:
+            header = f.read(local_header.size)
+            if len(header) < local_header.size:
+                break
+            signature, _, _, compression, _, _, crc, compressed_size, _, name_length, extra_length = \
+                local_header.unpack(header)
+            if signature != local_header_signature:
+                break  # central directory or garbage
+            name = f.read(name_length).decode('utf-8')
+            extra = f.read(extra_length)
+
+            # entries written with force_zip64 have their sizes in the extra field
+            offset = 0
+            while offset + 4 <= len(extra):
+                extra_id, extra_size = struct.unpack('<HH', extra[offset:offset + 4])
+                if extra_id == zip64_extra_id and extra_size >= 16:
+                    _, compressed_size = struct.unpack('<QQ', extra[offset + 4:offset + 20])
+                offset += 4 + extra_size
+
+            data = f.read(compressed_size)
+            if len(data) < compressed_size:
+                break
+            try:
+                if compression == zipfile.ZIP_DEFLATED:
+                    data = zlib.decompress(data, -zlib.MAX_WBITS)
+                elif compression != zipfile.ZIP_STORED:
+                    break
+            except zlib.error:
+                break
+            if zlib.crc32(data) != crc:
+                break  # the header is written again with the checksum when the entry is complete
+            entries.append((name, data))
+    return entries
+
+
+def repair(file_path: str):
+    """
+    Rebuild a session file that was damaged while a chunk was appended, e.g. because the logger was killed.
+    Appending rewrites the zip directory at the end of the file, so the whole file is unreadable without it,
+    but all previous chunks are still complete.
+    :return: number of recovered entries
+    """
+
+    entries = read_complete_entries(file_path)
+    temp_file_path = file_path + '.tmp'
+    with zipfile.ZipFile(temp_file_path, mode='w', compression=zipfile.ZIP_DEFLATED) as zip_file:
+        for name, data in entries:
+            zip_file.writestr(name, data)
+    os.replace(temp_file_path, file_path)
+    return len(entries)
@@ -0,0 +1,122 @@
+import glob
+import os
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass
+
+import numpy as np
+
+from source import channel_store
+from source import session_library
+from source import utils
+
+
+# headless loading and saving of races, e.g. for scripts and bulk analysis, without file dialogs or a logger
+load_errors = (OSError, ValueError, KeyError, EOFError, zipfile.BadZipFile)
+
+
+@dataclass
+class Session:
+    file_path: str
+    game_name: str
+    data: np.ndarray  # samples of shape (num_fields, num_samples), a ChannelStore if loaded lazily
+    ingest_stats: dict  # None if the race was saved without them
+
+
+def get_game(game_name: str):
+    from source.dirt_rally.game_dirt_rally import GameDirtRally
+    return GameDirtRally(game_name=game_name)
+
+
+def load(file_path: str, lazy: bool = False):
+    """
+    Load a saved race. The game is read from the file.
+    :param file_path: .npz file, session directory or its meta file
+    :param lazy: keep a session directory as ChannelStore, e.g. for get_plot_data, so that only the used channels
+    are read. npz files are always read at once.
+    :return: Session
+    """
+
+    session_dir = channel_store.get_session_dir(file_path)
+    if session_dir is not None:
+        file_path = session_dir
+    elif not os.path.isfile(file_path):
+        raise ValueError('"{}" is no valid file!'.format(file_path))
+
+    game_name = session_library.get_game_name(file_path)
+    game = get_game(game_name)
+    data = game.load_channels(file_path) if lazy and session_dir is not None else game.load_data(file_path)
+    return Session(file_path=file_path, game_name=game_name,
+                   data=data, ingest_stats=game.load_ingest_stats(file_path))
+
+
+def find_sessions(pattern: str):
+    """
+    :param pattern: glob pattern, e.g. 'races/**/*.npz', or a directory to search recursively
+    :return: sorted paths of the saved races
+    """
+
+    if os.path.isdir(pattern) and channel_store.get_session_dir(pattern) is None:
+        return sorted(session_library.get_session_files(pattern))
+
+    file_paths = []
+    for file_path in glob.glob(pattern, recursive=True):
+        if session_library.temp_marker in file_path:
+            continue  # unfinished conversion
+        if channel_store.get_session_dir(file_path) is not None:
+            file_paths.append(channel_store.get_session_dir(file_path))
+        elif file_path.endswith('.npz') and os.path.isfile(file_path):
+            file_paths.append(file_path)
+    return sorted(set(file_paths))
+
+
+def load_many(pattern: str, num_workers: int = None):
+    """
+    Load many saved races in parallel worker processes. Broken files are reported and skipped.
+    :param pattern: glob pattern or directory, see find_sessions
+    :param num_workers: number of processes, the number of CPUs if None
+    :return: generator of Sessions in the order they finish loading
+    """
+
+    file_paths = find_sessions(pattern)
+    if len(file_paths) == 0:
+        return
+
+    executor = ProcessPoolExecutor(max_workers=num_workers)
+    futures = {}
+    try:
+        futures = {executor.submit(load, file_path): file_path for file_path in file_paths}
+        for future in as_completed(futures):
+            try:
+                yield future.result()
+            except load_errors as er:
+                print('Error while loading race data: {}\n{}'.format(futures[future], er))
+    finally:
+        # the caller may stop early, don't load the rest then
+        # cancel_futures of shutdown needs Python 3.9
+        for future in futures:
+            future.cancel()
+        executor.shutdown(wait=True)
+
+
+def save(data: np.ndarray, file_path: str, game_name: str = None, ingest_stats: dict = None):
+    """
+    Save a race, the format is chosen by the extension like for saves from the logger.
+    :param data: samples of shape (num_fields, num_samples)
+    :param file_path: .npz file or session directory
+    :param game_name: game of the samples, DR2 if None
+    :param ingest_stats: optional statistics of the received packets
+    :return: path of the saved race, '.npz' is added if there was no known extension
+    """
+
+    from source.dirt_rally.game_dirt_rally import GameDirtRally
+
+    if data is None or data.shape[1] == 0:
+        raise ValueError('Nothing to save!')
+    game = get_game(GameDirtRally.valid_game_name_dr2 if game_name is None else game_name)
+
+    utils.make_dir_for_file(file_path)
+    game.save_data(data, file_path, ingest_stats=ingest_stats)
+    if not file_path.endswith('.npz') and not file_path.endswith(channel_store.channel_dir_extension):
+        file_path += '.npz'  # added by save_data
+    return file_path
@@ -0,0 +1,215 @@
+import contextlib
+import os
+import sqlite3
+import zipfile
+from datetime import datetime
+
+import numpy as np
+
+from source import channel_store
+
+
+library_file_name = 'library.sqlite'
+skipped_dirs = {'in_progress', 'journal'}  # unfinished races and raw datagrams
+temp_marker = '.converting'  # races that are being converted, see converter.py
+
+columns = [
+    ('path', 'TEXT PRIMARY KEY'),
+    ('mtime', 'REAL'),  # of the file when it was indexed, to detect changes
+    ('size', 'INTEGER'),
+    ('game', 'TEXT'),
+    ('car', 'TEXT'),
+    ('track', 'TEXT'),
+    ('date', 'TEXT'),  # ISO format
+    ('duration', 'REAL'),  # run time in seconds
+    ('race_time', 'REAL'),  # lap time at the end, including penalties
+    ('num_samples', 'INTEGER'),
+    ('max_speed', 'REAL'),  # m/s
+    ('mean_speed', 'REAL'),  # m/s
+    ('progress', 'REAL'),  # 0..1
+    ('missing_packets', 'INTEGER'),  # from the ingest statistics, NULL if unknown
+    ('note', 'TEXT'),  # e.g. conversions
+]
+
+
+def get_session_files(session_path: str):
+    """
+    Find all saved races in the session path and its sub-directories, e.g. of several rigs.
+    :return: list of paths to .npz files and session directories
+    """
+
+    session_files = []
+    for root, dirs, files in os.walk(session_path):
+        session_dirs = [d for d in dirs if d.endswith(channel_store.channel_dir_extension)]
+        dirs[:] = [d for d in dirs if d not in skipped_dirs and d not in session_dirs]
+        # unfinished or crashed conversions are no saved races
+        session_files += [os.path.join(root, d) for d in session_dirs if temp_marker not in d]
+        session_files += [os.path.join(root, f) for f in files if f.endswith('.npz') and temp_marker not in f]
+    return session_files
+
+
+def get_file_state(file_path: str):
+    # session directories change with their meta file
+    session_dir = channel_store.get_session_dir(file_path)
+    stat_path = file_path if session_dir is None else os.path.join(session_dir, channel_store.meta_file_name)
+    stat = os.stat(stat_path)
+    return stat.st_mtime, stat.st_size
+
+
+def get_session_date(file_path: str, mtime: float):
+    # auto-saves start with the date, use the modification time for other names
+    try:
+        date = datetime.strptime(os.path.basename(file_path)[:19], '%Y-%m-%d %H_%M_%S')
+    except ValueError:
+        date = datetime.fromtimestamp(mtime)
+    return date.isoformat(sep=' ')
+
+
+def get_game_name(file_path: str):
+    session_dir = channel_store.get_session_dir(file_path)
+    if session_dir is not None:
+        return channel_store.read_meta(session_dir).get('game')
+    with np.load(file_path) as npz_file:
+        if 'game' in npz_file:
+            return str(npz_file['game'])
+    from source.dirt_rally.game_dirt_rally import GameDirtRally
+    return GameDirtRally.valid_game_name_dr2  # initial saves were only for DR2
+
+
+class SessionLibrary:
+    """
+    SQLite index of all saved races with car, track, date, duration and some key stats.
+    update() rescans only new and changed files, add() indexes a single new save.
+    Each call opens its own connection, so the save worker and the main thread can use the same library.
+    """
+
+    def __init__(self, session_path: str):
+        self.session_path = session_path
+        self.db_path = os.path.join(session_path, library_file_name)
+        self.games = {}
+        os.makedirs(session_path, exist_ok=True)
+        with self.connect() as con:
+            con.execute('CREATE TABLE IF NOT EXISTS sessions ({})'.format(
+                ', '.join(['{} {}'.format(name, sql_type) for name, sql_type in columns])))
+            con.execute('CREATE INDEX IF NOT EXISTS sessions_car ON sessions (car)')
+            con.execute('CREATE INDEX IF NOT EXISTS sessions_track ON sessions (track)')
+            con.commit()
+
+    def connect(self):
+        return contextlib.closing(sqlite3.connect(self.db_path, timeout=10.0))
+
+    def get_game(self, game_name: str):
+        from source.dirt_rally.game_dirt_rally import GameDirtRally
+
+        if game_name not in self.games:
+            self.games[game_name] = GameDirtRally(game_name=game_name)
+        return self.games[game_name]
+
+    def get_key(self, file_path: str):
+        # relative paths, so the library survives moving the session directory
+        return os.path.relpath(os.path.abspath(file_path), os.path.abspath(self.session_path))
+
+    def index_file(self, file_path: str, note: str = None):
+        mtime, size = get_file_state(file_path)
+        game_name = get_game_name(file_path)
+        info = self.get_game(game_name).get_session_info(file_path)
+        row = {
+            'path': self.get_key(file_path),
+            'mtime': mtime,
+            'size': size,
+            'game': game_name,
+            'date': get_session_date(file_path, mtime),
+            'note': note,
+        }
+        row.update(info)
+        return row
+
+    def write_rows(self, rows: list):
+        if len(rows) == 0:
+            return
+        names = [name for name, _ in columns]
+        with self.connect() as con:
+            con.executemany('INSERT OR REPLACE INTO sessions ({}) VALUES ({})'.format(
+                ', '.join(names), ', '.join(['?'] * len(names))),
+                [[row.get(name) for name in names] for row in rows])
+            con.commit()
+
+    def add(self, file_path: str, note: str = None):
+        """
+        Index a single save, e.g. right after it was written.
+        """
+
+        self.write_rows([self.index_file(file_path, note)])
+
+    def remove(self, file_path: str):
+        with self.connect() as con:
+            con.execute('DELETE FROM sessions WHERE path = ?', (self.get_key(file_path),))
+            con.commit()
+
+    def update(self):
+        """
+        Index new and changed saves, remove deleted ones.
+        :return: number of indexed files, number of removed entries, list of (path, error) for broken files
+        """
+
+        with self.connect() as con:
+            indexed = {path: (mtime, size) for path, mtime, size in con.execute('SELECT path, mtime, size FROM sessions')}
+
+        rows = []
+        errors = []
+        existing_keys = set()
+        for file_path in get_session_files(self.session_path):
+            key = self.get_key(file_path)
+            existing_keys.add(key)
+            try:
+                if indexed.get(key) == get_file_state(file_path):
+                    continue
+                rows.append(self.index_file(file_path))
+            except (OSError, ValueError, KeyError, EOFError, zipfile.BadZipFile) as er:
+                errors.append((file_path, er))
+        self.write_rows(rows)
+
+        removed_keys = [key for key in indexed.keys() if key not in existing_keys]
+        with self.connect() as con:
+            con.executemany('DELETE FROM sessions WHERE path = ?', [(key,) for key in removed_keys])
+            con.commit()
+        return len(rows), len(removed_keys), errors
+
+    def query(self, car: str = None, track: str = None, game: str = None):
+        """
+        Find saved races. Car and track match if they contain all words of the query, ignoring case.
+        :return: list of dicts with the columns, newest first, paths relative to the working directory
+        """
+
+        conditions = []
+        parameters = []
+        for column, query in [('car', car), ('track', track)]:
+            if query is not None:
+                for word in query.split():
+                    conditions.append('{} LIKE ?'.format(column))
+                    parameters.append('%{}%'.format(word))
+        if game is not None:
+            conditions.append('game = ?')
+            parameters.append(game)
+
+        sql = 'SELECT * FROM sessions'
+        if len(conditions) > 0:
+            sql += ' WHERE ' + ' AND '.join(conditions)
+        sql += ' ORDER BY date DESC'
+
+        with self.connect() as con:
+            con.row_factory = sqlite3.Row
+            rows = [dict(row) for row in con.execute(sql, parameters)]
+        for row in rows:
+            row['path'] = os.path.join(self.session_path, row['path'])
+        return rows
+
+
+def get_table_str(rows: list):
+    lines = ['{:<19}  {:<32}  {:<48}  {:>8}  {:>8}  {:>7}'.format(
+        'Date', 'Car', 'Track', 'Time', 'Samples', 'Missing')]
+    for row in rows:
+        missing = '' if row['missing_packets'] is None else str(row['missing_packets'])
+        lines.append('{:<19}  {:<32}  {:<48}  {:>7.1f}s  {:>8}  {:>7}'.format(
+            row['date'][:19], row['car'][:32], row['track'][:48], row['race_time'], row['num_samples'], missing))
+    return '\n'.join(lines)
@@ -1,6 +1,8 @@
 import os
 import configparser
 
+from source import channel_store
+
 
 settings = configparser.ConfigParser()
 
@@ -10,6 +12,10 @@ def init_settings():
     init_settings_output_socket()
     init_settings_session_path()
     init_settings_game('Dirt_Rally_2')
+    init_settings_engine()
+    init_settings_journal()
+    init_settings_session_format()
+    init_settings_checkpoint_interval()
 
 
 def init_settings_input_socket():
@@ -17,11 +23,30 @@ def init_settings_input_socket():
     settings['general']['port_in'] = '20777'
 
 
+def get_ports_in():
+    # one port per sim rig, separated by commas, e.g. "20777, 20778"
+    return [int(port) for port in settings['general']['port_in'].split(',')]
+
+
 def init_settings_output_socket():
-    # mirror the received datagrams to this port in order to enable other telemetry tools
-    settings['general']['ip_out'] = '127.0.0.1'
-    settings['general']['port_out'] = '10001'
-    settings['general']['forward_udp'] = '0'
+    # mirror the received datagrams to these sockets in order to enable other telemetry tools
+    # format: "ip:port, ip:port, ..."
+    if 'ip_out' in settings['general'] and 'port_out' in settings['general']:
+        # keep the target from older settings files
+        settings['general']['forward_targets'] = '{}:{}'.format(
+            settings['general'].pop('ip_out'), settings['general'].pop('port_out'))
+    else:
+        settings['general']['forward_targets'] = '127.0.0.1:10001'
+    if 'forward_udp' not in settings['general']:
+        settings['general']['forward_udp'] = '0'
+
+
+def get_forward_targets():
+    targets = []
+    for target in settings['general']['forward_targets'].split(','):
+        ip, port = target.strip().rsplit(':', 1)
+        targets.append((ip, int(port)))
+    return targets
 
 
 def init_settings_session_path():
@@ -32,6 +57,61 @@ def init_settings_game(init_val):
     settings['general']['game'] = init_val
 
 
+def init_settings_engine():
+    # 'thread': receive thread with ring buffer, 'asyncio': event loop without polling
+    settings['general']['engine'] = 'thread'
+
+
+def init_settings_journal():
+    # write all raw datagrams to a memory-mapped journal in the session path, see journal.py
+    settings['general']['journal'] = '0'
+
+
+def init_settings_session_format():
+    # 'npz': compressed file, 'channels': directory with one memory-mapped file per channel, see channel_store.py
+    settings['general']['session_format'] = 'npz'
+
+
+def get_session_file_extension():
+    return channel_store.channel_dir_extension if settings['general']['session_format'] == 'channels' else '.npz'
+
+
+# each checkpoint reopens the file and rewrites its zip directory, which grows with the race
+min_checkpoint_interval = 1.0
+
+
+def init_settings_checkpoint_interval():
+    # seconds between writes of the running race to session_path/in_progress, at least min_checkpoint_interval
+    settings['general']['checkpoint_interval'] = '5'
+
+
+def get_checkpoint_interval():
+    checkpoint_interval = float(settings['general']['checkpoint_interval'])
+    if checkpoint_interval < 0.0:
+        raise ValueError('Negative checkpoint interval: {}'.format(checkpoint_interval))
+    # smaller values are raised to min_checkpoint_interval
+    return max(checkpoint_interval, min_checkpoint_interval)
+
+
+def init_missing_settings():
+    # settings files from older versions don't have all entries
+    missing_settings = {
+        'ip_in': init_settings_input_socket,
+        'forward_targets': init_settings_output_socket,
+        'session_path': init_settings_session_path,
+        'engine': init_settings_engine,
+        'journal': init_settings_journal,
+        'session_format': init_settings_session_format,
+        'checkpoint_interval': init_settings_checkpoint_interval,
+    }
+    added_settings = False
+    for key, init_function in missing_settings.items():
+        if key not in settings['general']:
+            init_function()
+            added_settings = True
+    return added_settings
+
+
 def write_settings():
     with open('settings.ini', 'w') as settings_file:
         settings.write(settings_file)
@@ -41,6 +121,10 @@ def read_settings():
     settings_file_path = 'settings.ini'
     if os.path.isfile(settings_file_path):
         settings.read(settings_file_path)
+        if 'general' not in settings:
+            settings['general'] = {}
+        if init_missing_settings():
+            write_settings()
     else:
         settings['general'] = {}
         init_settings()
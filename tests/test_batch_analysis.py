@@ -0,0 +1,63 @@
+import os
+import sys
+
+import numpy as np
+
+repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, repo_dir)
+
+from source import batch_analysis
+from source import data_processing
+from source import session_io
+from source.dirt_rally import udp_data
+from source.dirt_rally.game_dirt_rally import GameDirtRally
+
+
+def make_samples(num_samples: int):
+    fields = udp_data.Fields
+    samples = np.zeros((len(fields), num_samples), dtype=np.float32)
+    time_steps = np.arange(num_samples) * 0.01
+    samples[fields.run_time.value] = time_steps
+    samples[fields.lap_time.value] = time_steps
+    samples[fields.speed_ms.value] = 20.0
+    samples[fields.rpm.value] = 500.0 + 100.0 * np.sin(time_steps)
+    samples[fields.gear.value] = 3.0
+    return samples
+
+
+def save(tmp_path, name: str, num_samples: int):
+    return session_io.save(make_samples(num_samples), str(tmp_path / name), GameDirtRally.valid_game_name_dr2)
+
+
+def test_short_races_fail(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    for num_samples in range(1, batch_analysis.min_samples):
+        file_path, result, error = batch_analysis.analyze_file(save(tmp_path, 'short.npz', num_samples))
+        assert result is None
+        assert 'Not enough samples' in error
+
+    _, result, error = batch_analysis.analyze_file(save(tmp_path, 'long.npz', batch_analysis.min_samples))
+    assert error is None
+    assert result['duration'] > 0.0
+
+
+def test_unexpected_errors_fail_the_file(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+
+    def get_optimal_rpm(plot_data):
+        raise IndexError('broken fit')
+
+    monkeypatch.setattr(data_processing, 'get_optimal_rpm', get_optimal_rpm)
+    file_path = save(tmp_path, 'race.npz', 1000)
+    assert batch_analysis.analyze_file(file_path) == (file_path, None, 'IndexError: broken fit')
+
+
+def test_analyze_all_continues_after_failures(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    file_paths = [save(tmp_path, 'race_1.npz', 1000), save(tmp_path, 'short.npz', 3), save(tmp_path, 'race_2.npz', 500)]
+    broken_file_path = str(tmp_path / 'broken.npz')
+    with open(broken_file_path, 'wb') as f:
+        f.write(b'no zip file')
+
+    results = batch_analysis.analyze_all(file_paths + [broken_file_path], num_workers=1)
+    assert sorted([r['path'] for r in results]) == [file_paths[0], file_paths[2]]
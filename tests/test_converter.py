@@ -0,0 +1,39 @@
+import os
+import sys
+
+import numpy as np
+
+repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, repo_dir)
+
+from source import converter
+from source import session_io
+from source import session_library
+from source.dirt_rally import udp_data
+from source.dirt_rally.game_dirt_rally import GameDirtRally
+
+
+def make_samples(num_samples: int):
+    samples = np.zeros((len(udp_data.Fields), num_samples), dtype=np.float32)
+    samples[udp_data.Fields.run_time.value] = np.arange(num_samples) * 0.01
+    samples[udp_data.Fields.speed_ms.value] = 20.0
+    return samples
+
+
+def test_convert_samples_with_nan(tmp_path):
+    samples = make_samples(100)
+    samples[udp_data.Fields.rpm.value, 10] = np.nan
+    file_path = session_io.save(samples, str(tmp_path / 'race.npz'), GameDirtRally.valid_game_name_dr2)
+
+    _, result, target_path, message = converter.convert_file(file_path, 'channels')
+    assert result == converter.converted, message
+    np.testing.assert_array_equal(session_io.load(target_path).data[udp_data.Fields.rpm.value],
+                                  samples[udp_data.Fields.rpm.value])
+
+
+def test_temp_files_are_no_sessions(tmp_path):
+    file_path = session_io.save(make_samples(100), str(tmp_path / 'race.npz'), GameDirtRally.valid_game_name_dr2)
+    session_io.save(make_samples(100), str(tmp_path / ('race' + converter.temp_marker + '.npz')),
+                    GameDirtRally.valid_game_name_dr2)
+    assert session_library.get_session_files(str(tmp_path)) == [file_path]
+    assert session_io.find_sessions(str(tmp_path / '*.npz')) == [file_path]
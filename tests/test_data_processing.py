@@ -0,0 +1,46 @@
+import os
+import sys
+
+import numpy as np
+
+repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, repo_dir)
+
+from source import data_processing
+from source.dirt_rally import udp_data
+from source.dirt_rally.game_dirt_rally import GameDirtRally
+
+
+def make_plot_data(num_samples: int = 3000):
+    fields = udp_data.Fields
+    samples = np.zeros((len(fields), num_samples), dtype=np.float32)
+    time_steps = np.arange(num_samples) * 0.01
+    gear = 1 + (time_steps // 10.0)
+    phase = (time_steps % 10.0) / 10.0
+    samples[fields.run_time.value] = time_steps
+    samples[fields.gear.value] = gear
+    samples[fields.rpm.value] = 300.0 + 400.0 * phase
+    samples[fields.speed_ms.value] = gear * 5.0 + 10.0 * phase
+    samples[fields.vel_x.value] = samples[fields.speed_ms.value]  # driving straight forward
+    samples[fields.pitch_x.value] = 1.0
+    for field in [fields.wsp_fl, fields.wsp_fr, fields.wsp_rl, fields.wsp_rr]:
+        samples[field.value] = samples[fields.speed_ms.value]  # no slip
+    suspension_noise = np.random.default_rng(0).normal(0.0, 50.0, (4, num_samples))
+    for field, noise in zip([fields.susp_vel_fl, fields.susp_vel_fr, fields.susp_vel_rl, fields.susp_vel_rr],
+                            suspension_noise):
+        samples[field.value] = noise  # on a bumpy road, the wheels are on the ground
+    samples[fields.throttle.value] = 1.0
+    return GameDirtRally(GameDirtRally.valid_game_name_dr2).get_plot_data(samples)
+
+
+def test_power_polynomials_are_shared():
+    plot_data = make_plot_data()
+    power = data_processing.get_power(plot_data=plot_data)
+    _, kinetic_energy, _ = data_processing.get_energy(plot_data=plot_data)
+    np.testing.assert_allclose(power, data_processing.derive_no_nan(kinetic_energy, plot_data.run_time) / 1000.0)
+
+    polynomials = data_processing.get_rpm_polynomials(plot_data=plot_data, channel_name='power')
+    assert data_processing.get_rpm_polynomials(plot_data=plot_data, channel_name='power') is polynomials
+    range_gears, _ = data_processing.get_gear_acceleration_masks(plot_data=plot_data)
+    assert polynomials.coefficients.shape[0] == range_gears.shape[0]
+    assert np.all(polynomials.get_valid())
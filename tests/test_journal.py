@@ -0,0 +1,104 @@
+import os
+import socket
+import sys
+import time
+
+import numpy as np
+
+repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, repo_dir)
+
+from source import journal
+from source import networking
+from source import replay
+from source.dirt_rally import udp_data
+from source.dirt_rally.game_dirt_rally import GameDirtRally
+from source.ring_buffer import RingBuffer
+
+
+def make_datagrams(num_samples: int):
+    samples = np.zeros((len(udp_data.Fields), num_samples), dtype=np.float32)
+    samples[udp_data.Fields.run_time.value] = np.arange(num_samples) * 0.01
+    return udp_data.encode_samples(samples)
+
+
+def open_local_port():
+    udp_socket = networking.open_port('127.0.0.1', 0)
+    return udp_socket, udp_socket.getsockname()[1]
+
+
+def test_receive_times_per_datagram():
+    udp_socket, port = open_local_port()
+    send_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        start_time = time.time()
+        for datagram in make_datagrams(5):
+            send_socket.sendto(datagram, ('127.0.0.1', port))
+        time.sleep(0.05)
+        datagrams, receive_times = networking.receive_datagrams(udp_socket)
+        end_time = time.time()
+    finally:
+        send_socket.close()
+        udp_socket.close()
+
+    assert len(datagrams) == len(receive_times) == 5
+    assert np.all(np.diff(receive_times) >= 0.0)
+    assert start_time <= receive_times[0] and receive_times[-1] <= end_time
+
+
+def test_journal_keeps_times_per_datagram(tmp_path):
+    datagrams = make_datagrams(4)
+    receive_times = [100.0, 100.01, 100.03, 100.04]
+    file_path = str(tmp_path / 'race.dr2j')
+    raw_journal = journal.RawJournal(file_path, GameDirtRally.valid_game_name_dr2)
+    raw_journal.write_datagrams(datagrams[:2], receive_times[:2])
+    raw_journal.write_datagrams(datagrams[2:], receive_times[2:])
+    raw_journal.close()
+
+    game_name, read_times, read_datagrams = journal.read_journal(file_path)
+    assert read_times == receive_times
+    assert read_datagrams == datagrams
+
+    send_times, _ = replay.load_replay(file_path, GameDirtRally(GameDirtRally.valid_game_name_dr2))
+    np.testing.assert_allclose(send_times, np.array(receive_times) - receive_times[0])
+
+
+def test_receiver_journals_arrival_times(tmp_path):
+    # replay in real time, the journal must keep the spacing of the datagrams
+    udp_socket, port = open_local_port()
+    game = GameDirtRally(GameDirtRally.valid_game_name_dr2)
+    ring_buffer = RingBuffer(game.get_num_fields(), 1024, dtype=game.get_sample_dtype())
+    raw_journal = journal.RawJournal(str(tmp_path / 'race.dr2j'), game.game_name)
+    receiver = networking.UdpReceiver()
+    receiver.add_source(udp_socket, game.get_data_batch, ring_buffer, journal=raw_journal)
+    receiver.start()
+    try:
+        num_datagrams = 20
+        send_times = np.arange(num_datagrams) * 0.01
+        replay.replay(send_times, make_datagrams(num_datagrams), '127.0.0.1', port)
+        deadline = time.time() + 2.0
+        while ring_buffer.get_num_available() < num_datagrams and time.time() < deadline:
+            time.sleep(0.01)
+    finally:
+        receiver.stop()
+        udp_socket.close()
+        raw_journal.close()
+
+    samples, buffer_times = ring_buffer.pop_all()
+    _, journal_times, _ = journal.read_journal(raw_journal.file_path)
+    assert samples.shape[1] == len(journal_times) == num_datagrams
+    np.testing.assert_array_equal(buffer_times, journal_times)
+    assert journal_times[-1] - journal_times[0] >= 0.5 * send_times[-1]
+
+
+def test_empty_datagrams_dont_end_the_journal(tmp_path):
+    datagrams = [b'first', b'', b'third']
+    raw_journal = journal.RawJournal(str(tmp_path / 'race.dr2j'), GameDirtRally.valid_game_name_dr2)
+    raw_journal.write_datagrams(datagrams, [1.0, 2.0, 3.0])
+    raw_journal.mmap.flush()
+
+    # not closed, e.g. after a crash, the rest of the file is still zeros
+    _, receive_times, read_datagrams = journal.read_journal(raw_journal.file_path)
+    assert receive_times == [1.0, 2.0, 3.0]
+    assert read_datagrams == datagrams
+    raw_journal.close()
@@ -0,0 +1,79 @@
+import os
+import sys
+
+import numpy as np
+
+repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, repo_dir)
+
+from source import batch_analysis
+from source import channel_store
+from source import plots
+from source import session_io
+from source.dirt_rally import udp_data
+from source.dirt_rally.game_dirt_rally import GameDirtRally
+from source.logger_backend import LoggerBackend
+
+
+def make_samples(num_samples: int):
+    fields = udp_data.Fields
+    samples = np.zeros((len(fields), num_samples), dtype=np.float32)
+    time_steps = np.arange(num_samples) * 0.01
+    samples[fields.run_time.value] = time_steps
+    samples[fields.lap_time.value] = time_steps
+    samples[fields.speed_ms.value] = 20.0 + np.sin(time_steps)
+    samples[fields.rpm.value] = 500.0 + 100.0 * np.sin(time_steps)
+    samples[fields.gear.value] = 3.0
+    return samples
+
+
+def spy_on_channels(monkeypatch):
+    # get_plot_data reads each channel with get_channel when a plot first uses it
+    read_fields = []
+    get_channel = GameDirtRally.get_channel
+
+    def spy(session_collection, field):
+        read_fields.append(field)
+        return get_channel(session_collection, field)
+
+    monkeypatch.setattr(GameDirtRally, 'get_channel', staticmethod(spy))
+    return read_fields
+
+
+def test_load_run_reads_only_plotted_channels(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    file_path = session_io.save(make_samples(1000), str(tmp_path / 'race.dr2s'), GameDirtRally.valid_game_name_dr2)
+    read_fields = spy_on_channels(monkeypatch)
+
+    plotted = {}
+
+    def plot_main(plot_data, **kwargs):
+        plotted['speed_ms'] = plot_data.speed_ms
+
+    monkeypatch.setattr(plots, 'plot_main', plot_main)
+
+    logger_backend = LoggerBackend()
+    try:
+        logger_backend.load_run(file_path)
+        assert isinstance(logger_backend.session_collection, channel_store.ChannelStore)
+        assert logger_backend.session_buffer.get_num_samples() == 0
+        assert logger_backend.get_num_samples() == 1000
+
+        logger_backend.show_plots()
+        assert read_fields == [udp_data.Fields.speed_ms]
+        np.testing.assert_allclose(plotted['speed_ms'], make_samples(1000)[udp_data.Fields.speed_ms.value])
+    finally:
+        logger_backend.end_logging()
+
+
+def test_analyze_channels_lazily(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    file_path = session_io.save(make_samples(1000), str(tmp_path / 'race.dr2s'), GameDirtRally.valid_game_name_dr2)
+    read_fields = spy_on_channels(monkeypatch)
+
+    _, result, error = batch_analysis.analyze_file(file_path)
+    assert error is None
+    assert result['duration'] == float(make_samples(1000)[udp_data.Fields.run_time.value, -1])
+    # e.g. the positions are only used by the map plots
+    fields = udp_data.Fields
+    assert not set(read_fields) & {fields.pos_x, fields.pos_y, fields.pos_z}
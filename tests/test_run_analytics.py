@@ -0,0 +1,88 @@
+import os
+import sys
+
+import numpy as np
+
+repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, repo_dir)
+
+from source.dirt_rally import udp_data
+from source.dirt_rally.game_dirt_rally import GameDirtRally
+from source.logger_backend import LoggerBackend
+from source.run_analytics import RunningHistogram, RunAnalytics
+
+
+def make_race_samples(num_samples: int, start_time: float = 0.0):
+    fields = udp_data.Fields
+    samples = np.zeros((len(fields), num_samples), dtype=np.float32)
+    time_steps = start_time + 0.01 + np.arange(num_samples) * 0.01
+    samples[fields.run_time.value] = time_steps
+    samples[fields.lap_time.value] = time_steps
+    samples[fields.distance.value] = time_steps * 20.0
+    samples[fields.speed_ms.value] = 20.0
+    samples[fields.gear.value] = 3.0
+    samples[fields.rpm.value] = 500.0
+    samples[fields.max_rpm.value] = 800.0
+    samples[fields.idle_rpm.value] = 100.0
+    for field in [fields.susp_fl, fields.susp_fr, fields.susp_rl, fields.susp_rr]:
+        samples[field.value] = 50.0 + np.sin(time_steps * 10.0)
+    return samples
+
+
+def test_histogram_ignores_broken_values():
+    histogram = RunningHistogram(bin_width=1.0, value_range=(0.0, 100.0))
+    histogram.add(np.array([10.5, np.nan, np.inf, -np.inf, 1e12, -5.0, 20.5]),
+                  np.array([1.0, 1.0, 1.0, 1.0, 2.0, 3.0, np.nan]))
+    assert histogram.sums.shape[0] == 1
+    assert histogram.get_total() == 1.0
+    assert histogram.num_outliers == 2
+    assert histogram.outlier_weight == 5.0
+    assert histogram.min == histogram.max == 10.5
+
+    histogram.add(np.array([np.nan]), np.array([1.0]))
+    assert histogram.get_total() == 1.0
+
+
+def test_process_broken_samples(tmp_path, monkeypatch):
+    # corrupted or hand-crafted datagrams must not stop the logger
+    monkeypatch.chdir(tmp_path)
+    logger_backend = LoggerBackend()
+    try:
+        logger_backend.process_samples(make_race_samples(100))
+
+        fields = udp_data.Fields
+        broken_samples = make_race_samples(100, start_time=1.0)
+        broken_samples[fields.rpm.value, 10] = np.nan
+        broken_samples[fields.rpm.value, 11] = np.inf
+        broken_samples[fields.rpm.value, 12] = 1e12
+        broken_samples[fields.gear.value, 20] = np.nan
+        broken_samples[fields.gear.value, 21] = 1e12
+        broken_samples[fields.susp_fl.value, 30] = np.nan
+        broken_samples[fields.susp_fr.value, 31] = -np.inf
+        broken_samples[fields.susp_rl.value, 32] = 1e12
+        broken_samples[fields.susp_vel_rr.value, 40] = np.nan
+        broken_samples[fields.run_time.value, 50] = np.nan
+        logger_backend.process_samples(broken_samples)
+        logger_backend.process_samples(make_race_samples(100, start_time=2.0))
+
+        run_analytics = logger_backend.run_analytics
+        assert run_analytics.num_samples == logger_backend.get_num_samples() > 0
+        summary = run_analytics.get_summary_dict()
+        assert np.isfinite(summary['duration'])
+        assert abs(summary['duration'] - 2.99) < 0.1
+        assert summary['susp_max'] <= RunAnalytics.susp_range[1]
+        assert all(np.isfinite(summary['bump_stop_times']))
+        assert all(np.isfinite(summary['in_air_times']))
+        for histogram in run_analytics.gear_rpm_histograms.values():
+            assert histogram.sums.shape[0] <= RunAnalytics.rpm_range[1] / RunAnalytics.rpm_bin_width + 1
+        assert 'Race analytics' in run_analytics.get_summary_str()
+    finally:
+        logger_backend.end_logging()
+
+
+def test_convert_used_fields_only():
+    game = GameDirtRally(GameDirtRally.valid_game_name_dr2)
+    samples = np.random.default_rng(0).standard_normal((len(udp_data.Fields), 50)).astype(np.float32)
+    field_ids = RunAnalytics(game).used_fields + [udp_data.Fields.pos_y.value, udp_data.Fields.pitch_z.value]
+    np.testing.assert_array_equal(game.convert_to_plot_units(samples, 1.5, field_ids),
+                                  game.convert_to_plot_units(samples, 1.5)[field_ids])
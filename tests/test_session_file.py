@@ -0,0 +1,42 @@
+import os
+import sys
+
+import numpy as np
+
+repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, repo_dir)
+
+from source import session_file
+from source import settings
+
+
+def test_chunks_are_loaded_in_append_order(tmp_path):
+    # the chunk numbers have more than 5 digits after 100000 appends
+    chunk_numbers = [2, 99999, 100000, 100001]
+    chunks = {'{}{:05d}'.format(session_file.chunk_key_prefix, n): np.full((3, 2), float(n)) for n in chunk_numbers}
+    file_path = str(tmp_path / 'race.npz')
+    np.savez(file_path, game='Dirt_Rally_2', **chunks)
+
+    with np.load(file_path) as npz_file:
+        assert session_file.get_chunk_keys(npz_file.files) == list(chunks.keys())
+        samples = session_file.load_chunks(npz_file, num_fields=3)
+    assert samples[0].tolist() == [float(n) for n in chunk_numbers for _ in range(2)]
+
+
+def test_append_and_load_chunks(tmp_path):
+    samples = np.arange(3 * 10000, dtype=np.float32).reshape((3, 10000))
+    race_file = session_file.ChunkedSessionFile(str(tmp_path / 'race.npz'), values={'game': 'Dirt_Rally_2'})
+    race_file.create()
+    race_file.append(samples[:, :5000])
+    race_file.append(samples[:, 5000:])
+    assert race_file.num_chunks == 4
+
+    with np.load(race_file.file_path) as npz_file:
+        np.testing.assert_array_equal(session_file.load_chunks(npz_file, num_fields=3, dtype=np.float32), samples)
+
+
+def test_min_checkpoint_interval(monkeypatch):
+    monkeypatch.setitem(settings.settings['general'], 'checkpoint_interval', '0')
+    assert settings.get_checkpoint_interval() == settings.min_checkpoint_interval
+    monkeypatch.setitem(settings.settings['general'], 'checkpoint_interval', '10')
+    assert settings.get_checkpoint_interval() == 10.0
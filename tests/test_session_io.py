@@ -0,0 +1,55 @@
+import os
+import subprocess
+import sys
+
+import numpy as np
+
+repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, repo_dir)
+
+from source import session_io
+from source.dirt_rally import udp_data
+from source.dirt_rally.game_dirt_rally import GameDirtRally
+
+
+def make_samples(num_samples: int):
+    samples = np.zeros((len(udp_data.Fields), num_samples), dtype=np.float32)
+    samples[udp_data.Fields.run_time.value] = np.arange(num_samples) * 0.01
+    samples[udp_data.Fields.lap_time.value] = np.arange(num_samples) * 0.01
+    samples[udp_data.Fields.speed_ms.value] = 20.0
+    return samples
+
+
+def test_load_in_fresh_interpreter(tmp_path):
+    # headless scripts and process pool workers import nothing but session_io
+    file_path = session_io.save(make_samples(100), str(tmp_path / 'race.npz'), GameDirtRally.valid_game_name_dr2)
+    script = 'from source import session_io; print(session_io.load({!r}).data.shape[1])'.format(file_path)
+    result = subprocess.run([sys.executable, '-c', script], cwd=str(tmp_path), capture_output=True, text=True,
+                            env=dict(os.environ, PYTHONPATH=repo_dir))
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip() == '100'
+
+
+def test_load_many_in_fresh_interpreter(tmp_path):
+    for i in range(3):
+        session_io.save(make_samples(50 + i), str(tmp_path / 'race_{}.npz'.format(i)),
+                        GameDirtRally.valid_game_name_dr2)
+    script = 'from source import session_io\n' \
+             'if __name__ == "__main__":\n' \
+             '    print(sorted([s.data.shape[1] for s in session_io.load_many({!r}, num_workers=2)]))'.format(
+                str(tmp_path))
+    script_path = tmp_path / 'load_many.py'
+    script_path.write_text(script)
+    result = subprocess.run([sys.executable, str(script_path)], cwd=str(tmp_path), capture_output=True, text=True,
+                            env=dict(os.environ, PYTHONPATH=repo_dir))
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip() == '[50, 51, 52]'
+
+
+def test_load_many_stops_early(tmp_path):
+    for i in range(4):
+        session_io.save(make_samples(50 + i), str(tmp_path / 'race_{}.npz'.format(i)),
+                        GameDirtRally.valid_game_name_dr2)
+    sessions = session_io.load_many(str(tmp_path), num_workers=1)
+    assert next(sessions).data.shape[1] >= 50
+    sessions.close()  # cancels the pending loads